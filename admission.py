@@ -0,0 +1,328 @@
+"""
+Request admission control
+Per-client token-bucket rate limits weighted by endpoint cost, plus per-endpoint-class
+concurrency slots; work beyond them is shed at once (429/503 with Retry-After) so latency
+stays bounded under overload. Under ASGI a bounded queue waits for a slot on the event
+loop; WSGI requests never wait, since a waiting request would hold a server thread
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+# (endpoint class, rate-limit cost); paths not listed are not admission controlled
+ENDPOINT_POLICIES: Dict[str, Tuple[str, float]] = {
+    '/api/query': ('query', 5),
+    '/api/query/stream': ('query', 5),
+    '/api/query/batch': ('batch', 25),
+    '/api/transactions': ('table', 1),
+    '/api/stats': ('analytics', 1),
+    '/api/export': ('export', 10),
+}
+PREFIX_POLICIES: Dict[str, Tuple[str, float]] = {
+    '/api/analytics/': ('analytics', 2),
+}
+
+# Default (concurrent slots, queued waiters) per endpoint class, overridable with
+# <CLASS>_CONCURRENCY and <CLASS>_QUEUE
+CLASS_LIMITS: Dict[str, Tuple[int, int]] = {
+    'query': (64, 256),
+    'analytics': (4, 32),
+    'table': (8, 32),
+    'export': (2, 8),
+    'batch': (2, 8),
+}
+
+
+def endpoint_policy(path: str) -> Optional[Tuple[str, float]]:
+    """(class, cost) for a request path, or None when the path is exempt"""
+    policy = ENDPOINT_POLICIES.get(path)
+    if policy is None:
+        for prefix, prefix_policy in PREFIX_POLICIES.items():
+            if path.startswith(prefix):
+                return prefix_policy
+    return policy
+
+
+class Rejected(Exception):
+    """Request refused by admission control"""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def payload(self) -> Dict:
+        return {'error': self.reason, 'retry_after': self.retry_after}
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float) -> float:
+        """Spend cost tokens; returns 0 on success, otherwise seconds until affordable"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # A request costing more than the burst is admitted from a full bucket and
+        # leaves it in debt, so it is not free
+        if self.tokens >= min(cost, self.burst):
+            self.tokens -= cost
+            return 0.0
+        return (min(cost, self.burst) - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """One token bucket per client, least recently seen clients evicted first"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, client: str, cost: float) -> float:
+        with self.lock:
+            bucket = self.buckets.pop(client, None) or TokenBucket(self.rate, self.burst)
+            self.buckets[client] = bucket
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+            return bucket.take(cost)
+
+
+class _Waiter:
+    """A queued request; wake() hands it a slot from whichever thread releases one"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def wake(self):
+        self.granted = True
+        self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+
+
+class ConcurrencyLimiter:
+    """Fixed number of slots with a bounded FIFO queue of (event loop) waiters"""
+
+    def __init__(self, name: str, slots: int, queue: int, timeout: float):
+        self.name = name
+        self.slots = slots
+        self.queue_limit = queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiters = deque()
+        self.lock = threading.Lock()
+        # Moving average of time a slot is held, used for Retry-After estimates
+        self.service_time = 0.1
+
+    @property
+    def queued(self) -> int:
+        return len(self.waiters)
+
+    def retry_after(self) -> float:
+        return self.service_time * (self.queued + 1) / self.slots
+
+    def _enter(self, waiter_factory) -> Optional[_Waiter]:
+        """Take a free slot (returns None) or enqueue a waiter; raises when the queue is full"""
+        with self.lock:
+            if self.in_flight < self.slots and not self.waiters:
+                self.in_flight += 1
+                return None
+            if len(self.waiters) >= self.queue_limit:
+                raise Rejected(503, f"Server busy ({self.name} queue full)", self.retry_after())
+            waiter = waiter_factory()
+            self.waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter):
+        with self.lock:
+            if not waiter.granted:
+                self.waiters.remove(waiter)
+                raise Rejected(503, f"Server busy ({self.name} queue timeout)", self.retry_after())
+        # The slot was handed over just as the wait timed out: keep it
+
+    def try_acquire(self):
+        """Take a free slot or raise at once (a queued WSGI request would block a server thread)"""
+        with self.lock:
+            if self.in_flight < self.slots and not self.waiters:
+                self.in_flight += 1
+                return
+        raise Rejected(503, f"Server busy ({self.name} slots full)", self.retry_after())
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        waiter = self._enter(lambda: _Waiter(loop))
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+        except asyncio.CancelledError:
+            # Client went away while queued: leave the queue (or pass on a slot just granted)
+            with self.lock:
+                granted = waiter.granted
+                if not granted:
+                    self.waiters.remove(waiter)
+            if granted:
+                self.release(self.service_time)
+            raise
+
+    def release(self, held: float):
+        with self.lock:
+            self.service_time = 0.9 * self.service_time + 0.1 * held
+            if self.waiters:
+                # Hand the slot straight to the oldest waiter
+                self.waiters.popleft().wake()
+            else:
+                self.in_flight -= 1
+
+
+class Ticket:
+    """An admitted request; release() frees its concurrency slot (idempotent)"""
+
+    def __init__(self, limiter: Optional[ConcurrencyLimiter], waited: float):
+        self.limiter = limiter
+        self.waited = waited
+        self.started = time.monotonic()
+
+    def release(self):
+        if self.limiter is not None:
+            self.limiter.release(time.monotonic() - self.started)
+            self.limiter = None
+
+
+class AdmissionController:
+    """Rate limiting, concurrency slots and rejection metrics for the API endpoints"""
+
+    def __init__(self, rate: float = 10.0, burst: float = 50.0, queue_timeout: float = 10.0,
+                 limits: Dict[str, Tuple[int, int]] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.rate_limiter = RateLimiter(rate, burst) if rate > 0 else None
+        self.limiters = {
+            name: ConcurrencyLimiter(name, slots, queue, queue_timeout)
+            for name, (slots, queue) in (limits or CLASS_LIMITS).items()
+        }
+        self.lock = threading.Lock()
+        self.admitted: Dict[str, int] = {}
+        self.rejected: Dict[str, Dict[str, int]] = {}
+        self.queue_wait_total = 0.0
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        """Configured by ADMISSION_CONTROL, RATE_LIMIT, RATE_LIMIT_BURST, ADMISSION_QUEUE_TIMEOUT
+        and <CLASS>_CONCURRENCY / <CLASS>_QUEUE"""
+        limits = {
+            name: (int(os.getenv(f'{name.upper()}_CONCURRENCY', slots)),
+                   int(os.getenv(f'{name.upper()}_QUEUE', queue)))
+            for name, (slots, queue) in CLASS_LIMITS.items()
+        }
+        return cls(
+            rate=float(os.getenv('RATE_LIMIT', '10')),
+            burst=float(os.getenv('RATE_LIMIT_BURST', '50')),
+            queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10')),
+            limits=limits,
+            enabled=os.getenv('ADMISSION_CONTROL', 'True').lower() == 'true'
+        )
+
+    def _check(self, path: str, client: str):
+        """Rate-limit the request; returns its concurrency limiter (None = exempt)"""
+        policy = endpoint_policy(path) if self.enabled else None
+        if policy is None:
+            return None, None
+        endpoint_class, cost = policy
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.take(client, cost)
+            if wait > 0:
+                self._count_rejection(endpoint_class, 'rate_limited')
+                raise Rejected(429, "Rate limit exceeded", wait)
+        return endpoint_class, self.limiters.get(endpoint_class)
+
+    def _count_rejection(self, endpoint_class: str, reason: str):
+        with self.lock:
+            counts = self.rejected.setdefault(endpoint_class, {})
+            counts[reason] = counts.get(reason, 0) + 1
+
+    def _admitted(self, endpoint_class: str, limiter, started: float) -> Ticket:
+        waited = time.monotonic() - started
+        with self.lock:
+            self.admitted[endpoint_class] = self.admitted.get(endpoint_class, 0) + 1
+            self.queue_wait_total += waited
+        return Ticket(limiter, waited)
+
+    def admit(self, path: str, client: str) -> Optional[Ticket]:
+        """Admit a request or raise Rejected without waiting; None = exempt path"""
+        endpoint_class, limiter = self._check(path, client)
+        if endpoint_class is None:
+            return None
+        started = time.monotonic()
+        if limiter is not None:
+            try:
+                limiter.try_acquire()
+            except Rejected:
+                self._count_rejection(endpoint_class, 'shed')
+                raise
+        return self._admitted(endpoint_class, limiter, started)
+
+    async def admit_async(self, path: str, client: str) -> Optional[Ticket]:
+        """admit() for the event loop: queued requests wait without holding a thread"""
+        endpoint_class, limiter = self._check(path, client)
+        if endpoint_class is None:
+            return None
+        started = time.monotonic()
+        if limiter is not None:
+            try:
+                await limiter.acquire_async()
+            except Rejected:
+                self._count_rejection(endpoint_class, 'shed')
+                raise
+        return self._admitted(endpoint_class, limiter, started)
+
+    def metrics(self) -> Dict:
+        with self.lock:
+            admitted_total = sum(self.admitted.values())
+            return {
+                'enabled': self.enabled,
+                'admitted': dict(self.admitted),
+                'rejected': {name: dict(counts) for name, counts in self.rejected.items()},
+                'avg_queue_wait': self.queue_wait_total / admitted_total if admitted_total else 0.0,
+                'classes': {
+                    name: {
+                        'slots': limiter.slots,
+                        'in_flight': limiter.in_flight,
+                        'queued': limiter.queued,
+                        'queue_limit': limiter.queue_limit,
+                        'avg_service_time': limiter.service_time
+                    }
+                    for name, limiter in self.limiters.items()
+                }
+            }
+
+
+def client_key(remote_addr: Optional[str], forwarded_for: Optional[str]) -> str:
+    """Client identity for rate limiting; X-Forwarded-For is used only with RATE_LIMIT_TRUST_PROXY
+
+    Clients can send any X-Forwarded-For, and each proxy appends the address it received the
+    request from, so only the last RATE_LIMIT_PROXY_HOPS entries (one per trusted proxy) can
+    be relied on; the leftmost of those is the client (like werkzeug's ProxyFix x_for).
+    """
+    if forwarded_for and os.getenv('RATE_LIMIT_TRUST_PROXY', 'False').lower() == 'true':
+        hops = int(os.getenv('RATE_LIMIT_PROXY_HOPS', '1'))
+        entries = [entry.strip() for entry in forwarded_for.split(',')]
+        if 0 < hops <= len(entries) and entries[-hops]:
+            return entries[-hops]
+    return remote_addr or 'unknown'
@@ -0,0 +1,352 @@
+"""
+Anomaly and pattern detection over the transaction stream
+Rolling z-score amount outliers per address, transaction-rate bursts, A->B->A round
+trips and fan-out/fan-in, computed with vectorized passes over time-sorted columns.
+Every detector looks back over a bounded time window, so appended transactions are
+processed together with one window of history instead of the whole table.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+KINDS = ('amount_outlier', 'burst', 'round_trip', 'fan_out', 'fan_in')
+
+# Findings table: one row per anomaly; address/counterparty are address codes and
+# row/first_row index the detector's time-sorted transactions
+FINDING_COLUMNS = {
+    'kind': object, 'address': np.int64, 'counterparty': np.int64, 'start': np.int64, 'end': np.int64,
+    'row': np.int64, 'first_row': np.int64, 'score': np.float64, 'amount': np.float64,
+    'count': np.int64, 'expected': np.float64,
+}
+
+
+def _findings(kind: str, **columns) -> pd.DataFrame:
+    rows = len(columns['address'])
+    frame = {name: columns.get(name, np.full(rows, -1 if dtype is np.int64 else np.nan, dtype=dtype))
+             for name, dtype in FINDING_COLUMNS.items() if name != 'kind'}
+    return pd.DataFrame({'kind': np.full(rows, kind, dtype=object), **frame}).astype(FINDING_COLUMNS)
+
+
+def _window_keys(group: np.ndarray, t: np.ndarray, window: int) -> np.ndarray:
+    """Sortable keys that keep groups apart by more than any window"""
+    t = t - (t.min() if len(t) else 0)
+    span = (int(t.max()) if len(t) else 0) + window + 1
+    return group * span + t
+
+
+def _amount_outliers(addr, t, amount, row, anchor, window, threshold, min_history) -> pd.DataFrame:
+    """Events whose log amount is threshold std devs from the address's trailing window"""
+    # Amounts are heavy-tailed (roughly log-normal), so the statistics are taken on log1p(amount)
+    x = np.log1p(np.maximum(amount, 0.0))
+    keys = _window_keys(addr, t, window)
+    i = np.arange(len(keys))
+    lo = np.searchsorted(keys, keys - window, side='left')
+    n = i - lo
+    sums = np.concatenate([[0.0], np.cumsum(x)])
+    squares = np.concatenate([[0.0], np.cumsum(x * x)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (sums[i] - sums[lo]) / n
+        std = np.sqrt(np.maximum((squares[i] - squares[lo]) / n - mean * mean, 0.0))
+        z = (x - mean) / std
+    hit = (row >= anchor) & (n >= min_history) & (std > 1e-9) & (np.abs(z) >= threshold)
+    return _findings('amount_outlier', address=addr[hit], start=t[hit], end=t[hit], row=row[hit],
+                     score=np.abs(z[hit]), amount=amount[hit], count=n[hit], expected=np.expm1(mean[hit]))
+
+
+def _bursts(addr, t, row, anchor, prior, first_seen, window, minimum, factor) -> pd.DataFrame:
+    """Runs of events where an address's rate in window is factor times its long-run rate"""
+    keys = _window_keys(addr, t, window)
+    i = np.arange(len(keys))
+    count = i - np.searchsorted(keys, keys - window, side='right') + 1
+    # Events seen before this one, over the address's age (at least one day)
+    age = np.maximum(t - first_seen[addr], 24 * window)
+    expected = np.maximum(prior * window / age, 1.0)
+    hit = np.flatnonzero((count >= minimum) & (count >= factor * expected))
+    if len(hit) == 0:
+        return _findings('burst', address=np.zeros(0, np.int64))
+    # Consecutive flagged events of one address form a single burst episode
+    new_episode = np.ones(len(hit), dtype=bool)
+    new_episode[1:] = (addr[hit[1:]] != addr[hit[:-1]]) | (t[hit[1:]] - t[hit[:-1]] > window)
+    starts = np.flatnonzero(new_episode)
+    ends = np.append(starts[1:], len(hit)) - 1
+    peak = np.maximum.reduceat(count[hit], starts)
+    keep = row[hit[ends]] >= anchor
+    first = hit[starts][keep]
+    last = hit[ends][keep]
+    # Start of the episode is the start of the window that first tripped it
+    return _findings('burst', address=addr[last], start=t[first] - window, end=t[last], row=row[last],
+                     first_row=row[first], score=peak[keep] / expected[last], count=peak[keep],
+                     expected=expected[last])
+
+
+def _round_trips(sender, receiver, t, amount, row, anchor, window, similarity) -> pd.DataFrame:
+    """A->B followed by B->A within window carrying a similar amount back"""
+    # Both directions of a pair share the key (low, high); order each pair's transfers by time
+    low, high = np.minimum(sender, receiver), np.maximum(sender, receiver)
+    valid = np.flatnonzero(low != high)
+    order = valid[np.lexsort((t[valid], high[valid], low[valid]))]
+    low, high = low[order], high[order]
+    s, ts, x, r = sender[order], t[order], amount[order], row[order]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        close = 1.0 - np.abs(x[1:] - x[:-1]) / np.maximum(x[1:], x[:-1])
+    hit = np.flatnonzero(
+        (low[1:] == low[:-1]) & (high[1:] == high[:-1]) & (s[1:] != s[:-1])
+        & (ts[1:] - ts[:-1] <= window) & (close >= similarity) & (r[1:] >= anchor)
+    )
+    out, back = hit, hit + 1
+    return _findings('round_trip', address=s[out], counterparty=s[back], start=ts[out], end=ts[back],
+                     row=r[back], first_row=r[out], score=close[hit], amount=x[back], expected=x[out])
+
+
+def _fans(kind, address, other, t, amount, row, anchor, window, minimum) -> pd.DataFrame:
+    """Addresses with minimum distinct counterparties inside one window-sized time bucket"""
+    order = np.flatnonzero(address != other)
+    if len(order) == 0:
+        return _findings(kind, address=np.zeros(0, np.int64))
+    bucket = t // window
+    group = address * (int(bucket.max() - bucket.min()) + 1) + (bucket - bucket.min())
+    # Sort by (address, bucket), then counterparty, so distinct counterparties are runs
+    order = order[np.lexsort((other[order], group[order]))]
+    group, other = group[order], other[order]
+    first = np.r_[True, group[1:] != group[:-1]]
+    starts = np.flatnonzero(first)
+    count = np.add.reduceat((first | np.r_[True, other[1:] != other[:-1]]).astype(np.int64), starts)
+    last_row = np.maximum.reduceat(row[order], starts)
+    hit = (count >= minimum) & (last_row >= anchor)
+    return _findings(kind, address=address[order][starts[hit]], start=bucket[order][starts[hit]] * window,
+                     end=np.maximum.reduceat(t[order], starts)[hit], row=last_row[hit],
+                     score=count[hit] / minimum, amount=np.add.reduceat(amount[order], starts)[hit],
+                     count=count[hit])
+
+
+def _continue_bursts(bursts: pd.DataFrame, old: pd.DataFrame):
+    """Merge new burst episodes with earlier ones they continue; returns (bursts, remaining old)"""
+    bursts = bursts.sort_values(['address', 'start'], ignore_index=True)
+    first = ~bursts['address'].duplicated()
+    earlier = old[old['kind'] == 'burst'].reset_index().merge(
+        bursts.loc[first, ['address', 'start']], on='address', suffixes=('', '_new'))
+    earlier = earlier[earlier['end'] >= earlier['start_new']]
+    if len(earlier) == 0:
+        return bursts, old
+    origin = earlier.groupby('address').agg(start=('start', 'min'), first_row=('first_row', 'min'))
+    continued = first & bursts['address'].isin(origin.index)
+    addresses = bursts.loc[continued, 'address']
+    bursts.loc[continued, 'start'] = np.minimum(bursts.loc[continued, 'start'], origin['start'].reindex(addresses).to_numpy())
+    bursts.loc[continued, 'first_row'] = np.minimum(bursts.loc[continued, 'first_row'],
+                                                    origin['first_row'].reindex(addresses).to_numpy())
+    return bursts, old.drop(index=earlier['index'])
+
+
+class AnomalyDetector:
+    """Precomputed, indexed anomalies for a transaction table; update() adds transactions"""
+
+    def __init__(self, zscore_window: int = 7 * 86400, zscore_threshold: float = 4.0, min_history: int = 8,
+                 burst_window: int = 3600, burst_min: int = 10, burst_factor: float = 5.0,
+                 round_trip_window: int = 86400, round_trip_similarity: float = 0.9,
+                 fan_window: int = 3600, fan_min: int = 20):
+        self.zscore_window = zscore_window
+        self.zscore_threshold = zscore_threshold
+        self.min_history = min_history
+        self.burst_window = burst_window
+        self.burst_min = burst_min
+        self.burst_factor = burst_factor
+        self.round_trip_window = round_trip_window
+        self.round_trip_similarity = round_trip_similarity
+        self.fan_window = fan_window
+        self.fan_min = fan_min
+        self.addresses = pd.Index([], dtype=object)
+        # Transactions sorted by time (arrays are replaced, never modified, so copies stay valid)
+        self.sender = np.zeros(0, dtype=np.int64)
+        self.receiver = np.zeros(0, dtype=np.int64)
+        self.time = np.zeros(0, dtype=np.int64)
+        self.amount = np.zeros(0, dtype=np.float64)
+        self.block = np.zeros(0, dtype=np.int64)
+        self.transaction_ids = np.zeros(0, dtype=object)
+        # Per-address event count and first activity (burst baselines)
+        self.seen = np.zeros(0, dtype=np.int64)
+        self.first_seen = np.zeros(0, dtype=np.int64)
+        self.findings = _findings('none', address=np.zeros(0, np.int64))
+        self._by_address = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **params) -> 'AnomalyDetector':
+        return cls(**params).update(df)
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def horizon(self) -> int:
+        """Seconds of history any detector looks back"""
+        return max(self.zscore_window, self.burst_window, self.round_trip_window, self.fan_window)
+
+    def copy(self) -> 'AnomalyDetector':
+        """Independent detector sharing the current (immutable) arrays"""
+        clone = object.__new__(AnomalyDetector)
+        clone.__dict__.update(self.__dict__)
+        return clone
+
+    def _codes(self, addresses: np.ndarray) -> np.ndarray:
+        """Stable integer codes for addresses, registering unseen ones"""
+        local, uniques = pd.factorize(addresses)
+        known = self.addresses.get_indexer(uniques)
+        unseen = known < 0
+        if unseen.any():
+            known[unseen] = np.arange(len(self.addresses), len(self.addresses) + unseen.sum())
+            self.addresses = self.addresses.append(pd.Index(uniques[unseen], dtype=object))
+            self.seen = np.concatenate([self.seen, np.zeros(unseen.sum(), dtype=np.int64)])
+            self.first_seen = np.concatenate([self.first_seen, np.full(unseen.sum(), np.iinfo(np.int64).max)])
+        return known.astype(np.int64)[local]
+
+    def update(self, df: pd.DataFrame) -> 'AnomalyDetector':
+        """Add transactions and record the anomalies they complete
+
+        Transactions older than ones already added trigger a full recomputation.
+        """
+        if df.empty:
+            return self
+        t = df['transaction_timestamp'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        order = np.argsort(t, kind='stable')
+        t = t[order]
+        codes = self._codes(np.concatenate([df['sender'].to_numpy(dtype=object)[order],
+                                            df['receiver'].to_numpy(dtype=object)[order]]))
+        sender, receiver = codes[:len(t)], codes[len(t):]
+        amount = df['amount'].to_numpy(dtype=np.float64)[order]
+        block = df['index'].to_numpy(dtype=np.int64)[order]
+        transaction_ids = df['transaction_id'].to_numpy(dtype=object)[order]
+
+        previous = len(self)
+        in_order = previous == 0 or t[0] >= self.time[-1]
+        self.sender = np.concatenate([self.sender, sender])
+        self.receiver = np.concatenate([self.receiver, receiver])
+        self.time = np.concatenate([self.time, t])
+        self.amount = np.concatenate([self.amount, amount])
+        self.block = np.concatenate([self.block, block])
+        self.transaction_ids = np.concatenate([self.transaction_ids, transaction_ids])
+        if not in_order:
+            # Late transactions: re-sort everything and start over
+            order = np.argsort(self.time, kind='stable')
+            for name in ('sender', 'receiver', 'time', 'amount', 'block', 'transaction_ids'):
+                setattr(self, name, getattr(self, name)[order])
+            self.seen = np.zeros(len(self.addresses), dtype=np.int64)
+            self.first_seen = np.full(len(self.addresses), np.iinfo(np.int64).max)
+            self.findings = self.findings.iloc[:0]
+            previous = 0
+        self._detect(previous)
+        return self
+
+    def _detect(self, anchor: int):
+        """Detect anomalies completed by rows >= anchor, using one horizon of earlier rows"""
+        start = int(np.searchsorted(self.time, self.time[anchor] - self.horizon, side='left')) if anchor else 0
+        sender, receiver = self.sender[start:], self.receiver[start:]
+        t, amount = self.time[start:], self.amount[start:]
+        row = np.arange(start, len(self))
+
+        # Per-address events (each transaction once as sender, once as receiver), by address then time
+        addr = np.concatenate([sender, receiver])
+        event_t = np.concatenate([t, t])
+        event_row = np.concatenate([row, row])
+        order = np.lexsort((event_row, event_t, addr))
+        addr, event_t, event_row = addr[order], event_t[order], event_row[order]
+        event_amount = np.concatenate([amount, amount])[order]
+
+        # Events each address had before this one: history outside the context plus rank inside it
+        new = event_row >= anchor
+        self.first_seen = self.first_seen.copy()
+        np.minimum.at(self.first_seen, addr, event_t)
+        before = self.seen - np.bincount(addr[~new], minlength=len(self.addresses))
+        group_start = np.flatnonzero(np.r_[True, addr[1:] != addr[:-1]])
+        rank = np.arange(len(addr)) - np.repeat(group_start, np.diff(np.r_[group_start, len(addr)]))
+        prior = before[addr] + rank
+        self.seen = self.seen + np.bincount(addr[new], minlength=len(self.addresses))
+
+        found = [
+            _amount_outliers(addr, event_t, event_amount, event_row, anchor, self.zscore_window,
+                             self.zscore_threshold, self.min_history),
+            _round_trips(sender, receiver, t, amount, row, anchor, self.round_trip_window,
+                         self.round_trip_similarity),
+            _fans('fan_out', sender, receiver, t, amount, row, anchor, self.fan_window, self.fan_min),
+            _fans('fan_in', receiver, sender, t, amount, row, anchor, self.fan_window, self.fan_min),
+        ]
+        bursts = _bursts(addr, event_t, event_row, anchor, prior, self.first_seen, self.burst_window,
+                         self.burst_min, self.burst_factor)
+        old = self.findings
+        if anchor and len(bursts):
+            bursts, old = _continue_bursts(bursts, old)
+        found.append(bursts)
+        fans = pd.concat(found[2:4])
+        if anchor and len(fans):
+            # A bucket that gained transactions is re-reported with its new totals
+            replaced = old.merge(fans[['kind', 'address', 'start']], on=['kind', 'address', 'start'],
+                                 how='left', indicator=True)['_merge'].to_numpy() == 'both'
+            old = old[~replaced]
+        self.findings = pd.concat([old] + [frame for frame in found if len(frame)], ignore_index=True)
+        self.findings = self.findings.sort_values(['kind', 'score'], ascending=[True, False], ignore_index=True)
+        self._by_address = None
+
+    def finding_keys(self) -> set:
+        """Findings as tuples of values (addresses and transaction ids, not detector-local codes
+        or rows), comparable between detectors built from the same transactions"""
+        f = self.findings
+        addresses = np.append(self.addresses.to_numpy(dtype=object), None)
+        transaction_ids = np.append(self.transaction_ids, None)
+        # -1 (no counterparty / first row) maps to the trailing None
+        return set(zip(f['kind'], addresses[f['address']], addresses[f['counterparty']],
+                       f['start'], f['end'], transaction_ids[f['row']], transaction_ids[f['first_row']]))
+
+    def counts(self) -> Dict[str, int]:
+        counts = self.findings['kind'].value_counts()
+        return {kind: int(counts.get(kind, 0)) for kind in KINDS}
+
+    def _address_index(self) -> Dict[int, np.ndarray]:
+        if self._by_address is None:
+            self._by_address = self.findings.groupby('address').indices
+        return self._by_address
+
+    def query(self, kind: Optional[str] = None, address: Optional[str] = None,
+              since: Optional[pd.Timestamp] = None, limit: int = 100) -> Dict:
+        """Highest-scoring anomalies (up to limit per kind), optionally filtered by kind, address or time"""
+        findings = self.findings
+        if address is not None:
+            code = self.addresses.get_indexer([address])[0]
+            findings = findings.iloc[self._address_index().get(code, np.zeros(0, dtype=np.int64))]
+        if kind is not None:
+            findings = findings[findings['kind'] == kind]
+        if since is not None:
+            findings = findings[findings['end'] >= int(since.timestamp())]
+        # Scores are only comparable within a kind, and findings are kept sorted by kind then score
+        top = findings.groupby('kind', sort=False).head(limit)
+        return {
+            'total': len(findings),
+            'counts': self.counts(),
+            'anomalies': self._records(top)
+        }
+
+    def _records(self, findings: pd.DataFrame) -> List[Dict]:
+        records = []
+        for item in findings.itertuples(index=False):
+            record = {
+                'type': item.kind,
+                'address': self.addresses[item.address],
+                'score': round(float(item.score), 4),
+                'start': pd.Timestamp(item.start, unit='s').isoformat(),
+                'end': pd.Timestamp(item.end, unit='s').isoformat(),
+                'transaction_id': self.transaction_ids[item.row],
+                'block': int(self.block[item.row]),
+            }
+            if item.kind == 'amount_outlier':
+                record.update(amount=float(item.amount), typical_amount=float(item.expected),
+                              zscore=float(item.score), history=int(item.count))
+            elif item.kind == 'burst':
+                record.update(transactions=int(item.count), expected=float(item.expected),
+                              first_transaction_id=self.transaction_ids[item.first_row])
+            elif item.kind == 'round_trip':
+                record.update(counterparty=self.addresses[item.counterparty], amount_out=float(item.expected),
+                              amount_back=float(item.amount), seconds=int(item.end - item.start),
+                              first_transaction_id=self.transaction_ids[item.first_row])
+            else:
+                record.update(counterparties=int(item.count), total_amount=float(item.amount))
+            records.append(record)
+        return records
@@ -1,18 +1,18 @@
-from flask import Flask, render_template, jsonify, request
-import pandas as pd
+from flask import Blueprint, Flask, Response, current_app, g, render_template, jsonify, request, stream_with_context
+import hashlib
+import hmac
 import os
 import re
-from textblob import TextBlob
+import threading
+import time
 import warnings
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
-# Import RAG system
-try:
-    from rag_system import RAGSystem
-    RAG_AVAILABLE = True
-except ImportError:
-    RAG_AVAILABLE = False
-    print("Warning: RAG system not available. Using fallback NLP processor.")
+from admission import AdmissionController, Rejected, client_key
+
+# Heavy modules (pandas, rag_system, sketches, parallel) are imported where they are
+# first needed, so importing this module stays cheap; create_app() builds the data and models.
 
 # Load environment variables from .env file
 load_dotenv()
@@ -32,16 +32,15 @@ SIMPLE_STOPWORDS = {
     'further', 'then', 'once'
 }
 
-app = Flask(__name__)
+bp = Blueprint('explorer', __name__)
 
-# Configuration from environment variables
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
-app.config['ENV'] = os.getenv('FLASK_ENV', 'production')
+# Rows serialized per chunk of a streamed /api/transactions page
+PAGE_CHUNK_ROWS = 200
 
 # Load blockchain data
-def load_blockchain_data():
-    data_file = os.getenv('DATA_FILE', 'combined_block.csv')
+def load_blockchain_data(data_file=None):
+    import pandas as pd
+    data_file = data_file or os.getenv('DATA_FILE', 'combined_block.csv')
     try:
         if not os.path.exists(data_file):
             print(f"Warning: Data file '{data_file}' not found. Some features may not work.")
@@ -55,24 +54,348 @@ def load_blockchain_data():
         print(f"Error loading data: {e}")
         return pd.DataFrame()
 
-# Global variable to store data
-blockchain_data = load_blockchain_data()
+def create_analytics_engine(df):
+    """Partitioned analytics engine (only when more than one worker process is configured
+    and the dataset is large enough for the pool to be used)"""
+    from parallel import AnalyticsEngine, configured_min_rows, configured_workers
+    if df.empty or configured_workers() <= 1 or len(df) < configured_min_rows():
+        return None
+    try:
+        return AnalyticsEngine(df)
+    except Exception as e:
+        print(f"Warning: Could not start parallel analytics engine: {e}")
+        return None
+
+def create_repository(df, store_key=None):
+    """Transaction store the API handlers query (TRANSACTION_STORE=pandas or sqlite)"""
+    from repository import PandasRepository, SQLiteRepository, configured_store
+    if configured_store() == 'sqlite' and not df.empty:
+        try:
+            repository = SQLiteRepository.open_or_build(df, store_key)
+            print(f"✓ SQLite transaction store ready ({repository.path})")
+            return repository
+        except Exception as e:
+            print(f"Warning: Could not open SQLite transaction store, using pandas: {e}")
+    return PandasRepository(df, create_analytics_engine(df))
+
+def appends_to(df, previous):
+    """Whether df is the previous version's rows followed by new ones"""
+    if previous is None:
+        return False
+    old = previous.blockchain_data
+    return len(df) > len(old) and df['transaction_id'].iloc[:len(old)].equals(old['transaction_id'])
+
+def create_rag_system(df, repository=None, previous=None):
+    """RAG system over the dataset, or None when it is unavailable
 
-# Initialize RAG system if available
-rag_system = None
-if RAG_AVAILABLE and not blockchain_data.empty:
+    When df only appends to the previous version, its knowledge base is extended instead.
+    """
+    if df.empty:
+        return None
+    if appends_to(df, previous) and previous.rag_system is not None:
+        try:
+            rag_system = previous.rag_system.appended(df, repository)
+            print(f"✓ RAG system extended with {len(df) - len(previous.blockchain_data):,} appended rows")
+            return rag_system
+        except Exception as e:
+            print(f"Warning: Could not extend the RAG system, rebuilding it: {e}")
+    try:
+        from rag_system import RAGSystem
+    except ImportError:
+        print("Warning: RAG system not available. Using fallback NLP processor.")
+        return None
     try:
         print("Initializing RAG system...")
-        rag_system = RAGSystem(blockchain_data)
+        rag_system = RAGSystem(df, repository)
         print("✓ RAG system initialized successfully")
+        return rag_system
     except Exception as e:
         print(f"Warning: Could not initialize RAG system: {e}")
-        rag_system = None
+        return None
+
+def create_anomaly_detector(df, previous=None):
+    """Anomaly findings for the dataset, extending the previous version's when df only appends to it"""
+    if df.empty or os.getenv('ANOMALY_DETECTION', 'True').lower() != 'true':
+        return None
+    from anomalies import AnomalyDetector
+    try:
+        if appends_to(df, previous) and previous.anomalies is not None:
+            return previous.anomalies.copy().update(df.iloc[len(previous.blockchain_data):])
+        return AnomalyDetector.from_frame(df)
+    except Exception as e:
+        print(f"Warning: Could not run anomaly detection: {e}")
+        return None
+
+class DatasetVersion:
+    """One load of the dataset and everything derived from it (indexes, embeddings, aggregates)"""
+
+    def __init__(self, blockchain_data, version, sketch_bucket='W', previous=None, store_key=None):
+        self.version = version
+        self.loaded_at = time.time()
+        self.blockchain_data = blockchain_data
+        self.sketch_bucket = sketch_bucket
+        # Transactions for the API handlers (in-memory frame or indexed SQLite store)
+        self.repository = create_repository(blockchain_data, store_key)
+        self.rag_system = create_rag_system(blockchain_data, self.repository, previous)
+        # Fallback NLP processor (only if RAG not available)
+        self.nlp_processor = (AdvancedNLPProcessor(blockchain_data, self.repository)
+                              if self.rag_system is None else None)
+        self.anomalies = create_anomaly_detector(blockchain_data, previous)
+        # Approximate analytics sketches (built lazily, one bundle per time bucket)
+        self.bucketed_sketches = None
+        self._address_sketches = None
+        # Requests running on this version, and whether a newer one has replaced it
+        self.pins = 0
+        self.retired = False
+
+    def address_sketches(self):
+        """Merge the per-bucket sketches into one bundle covering the whole dataset"""
+        if self._address_sketches is None:
+            from sketches import build_bucketed_sketches, merge_sketches
+            self.bucketed_sketches = build_bucketed_sketches(self.blockchain_data, freq=self.sketch_bucket)
+            self._address_sketches = merge_sketches(self.bucketed_sketches.values())
+        return self._address_sketches
+
+    def warm_up(self, sketches=False):
+        """Build what the first requests would otherwise build (used before a swap)"""
+        if sketches and not self.blockchain_data.empty:
+            self.address_sketches()
+        if self.rag_system:
+            self.rag_system.warm_up_llm()
+
+    def close(self):
+        self.repository.close()
+
+    def info(self):
+        return {
+            'version': self.version,
+            'loaded_at': datetime.fromtimestamp(self.loaded_at, timezone.utc).isoformat(),
+            'rows': len(self.repository),
+            'store': type(self.repository).__name__
+        }
+
+def data_version(data_file):
+    """Version id of a data file; changes whenever the file is rewritten (same in every worker)"""
+    try:
+        stat = os.stat(data_file)
+    except OSError:
+        return None
+    key = f"{os.path.abspath(data_file)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+
+class ExplorerState:
+    """Current dataset version and admission control shared by the request handlers of one app
+
+    Requests pin the version they start on. reload() builds the next version in a background
+    thread and swaps the reference; the old version is closed when its last request ends.
+    """
+
+    def __init__(self, blockchain_data, sketch_bucket='W', data_file=None, version=None,
+                 warm_sketches=False):
+        self.sketch_bucket = sketch_bucket
+        self.data_file = data_file or os.getenv('DATA_FILE', 'combined_block.csv')
+        self.warm_sketches = warm_sketches
+        self.generation = 1
+        self.lock = threading.Lock()
+        self.reloading = False
+        self.last_reload = None
+        from parallel import configured_workers, get_pool
+        if configured_workers() > 1:
+            # Start the pool now: a reload thread must never be the first to fork it
+            get_pool(configured_workers())
+        self.dataset = DatasetVersion(blockchain_data, version or 'g1', sketch_bucket, store_key=version)
+        # Rate limits, concurrency slots and load shedding for the API endpoints
+        self.admission = AdmissionController.from_env()
+
+    def pin(self) -> DatasetVersion:
+        with self.lock:
+            dataset = self.dataset
+            dataset.pins += 1
+            return dataset
+
+    def unpin(self, dataset: DatasetVersion):
+        with self.lock:
+            dataset.pins -= 1
+            close = dataset.retired and dataset.pins == 0
+        if close:
+            dataset.close()
+
+    def swap(self, dataset: DatasetVersion) -> DatasetVersion:
+        """Make dataset current; returns the version it replaced"""
+        with self.lock:
+            old, self.dataset = self.dataset, dataset
+            self.generation += 1
+            old.retired = True
+            close = old.pins == 0
+        if close:
+            old.close()
+        return old
+
+    def reload(self, blockchain_data=None, wait=False) -> bool:
+        """Rebuild from data_file (or the given frame) in the background, then swap it in
+
+        Returns False when a reload is already running.
+        """
+        with self.lock:
+            if self.reloading:
+                return False
+            self.reloading = True
+        thread = threading.Thread(target=self._reload, args=(blockchain_data,), name='dataset-reload', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _reload(self, blockchain_data):
+        started = time.time()
+        status = {'error': None}
+        try:
+            version = None
+            if blockchain_data is None:
+                version = data_version(self.data_file)
+                blockchain_data = load_blockchain_data(self.data_file)
+                if blockchain_data.empty:
+                    raise ValueError(f"no rows loaded from '{self.data_file}'")
+            dataset = DatasetVersion(blockchain_data, version or f'g{self.generation + 1}', self.sketch_bucket,
+                                     previous=self.dataset, store_key=version)
+            dataset.warm_up(self.warm_sketches)
+            old = self.swap(dataset)
+            status['version'] = dataset.version
+            print(f"✓ Swapped dataset {old.version} -> {dataset.version} ({len(blockchain_data):,} rows)")
+        except Exception as e:
+            status['error'] = str(e)
+            print(f"Warning: Dataset reload failed, keeping version {self.dataset.version}: {e}")
+        finally:
+            status['seconds'] = time.time() - started
+            with self.lock:
+                self.last_reload = status
+                self.reloading = False
+
+    def watch(self, interval: float):
+        """Reload whenever data_file changes (polled every interval seconds)"""
+        def run():
+            attempted = data_version(self.data_file)
+            seen = attempted
+            while True:
+                time.sleep(interval)
+                version = data_version(self.data_file)
+                # Wait until the file has stopped changing for one interval, and try each version once
+                if version is not None and version == seen and version != attempted:
+                    if self.reload():
+                        attempted = version
+                seen = version
+
+        threading.Thread(target=run, name='dataset-watch', daemon=True).start()
+
+    def status(self):
+        with self.lock:
+            return {
+                **self.dataset.info(),
+                'generation': self.generation,
+                'reloading': self.reloading,
+                'last_reload': self.last_reload
+            }
+
+def create_app(blockchain_data=None):
+    """Build the Flask app; loads DATA_FILE unless a DataFrame is given"""
+    app = Flask(__name__)
+
+    # Configuration from environment variables
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+    app.config['ENV'] = os.getenv('FLASK_ENV', 'production')
+    app.config['APPROX_ANALYTICS'] = os.getenv('APPROX_ANALYTICS', 'False').lower() == 'true'
+    app.config['SKETCH_BUCKET'] = os.getenv('SKETCH_BUCKET', 'W')
+    app.config['MAX_PAGE_SIZE'] = int(os.getenv('MAX_PAGE_SIZE', '1000'))
+    app.config['MAX_BATCH_QUERIES'] = int(os.getenv('MAX_BATCH_QUERIES', '64'))
+    app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN', '')
+    app.config['DATA_WATCH_INTERVAL'] = float(os.getenv('DATA_WATCH_INTERVAL', '0'))
+
+    data_file = os.getenv('DATA_FILE', 'combined_block.csv')
+    version = None
+    if blockchain_data is None:
+        version = data_version(data_file)
+        blockchain_data = load_blockchain_data(data_file)
+    state = ExplorerState(blockchain_data, app.config['SKETCH_BUCKET'], data_file, version,
+                          warm_sketches=app.config['APPROX_ANALYTICS'])
+    if app.config['DATA_WATCH_INTERVAL'] > 0:
+        state.watch(app.config['DATA_WATCH_INTERVAL'])
+    app.extensions['chain_explorer'] = state
+    app.register_blueprint(bp)
+    return app
+
+def get_state() -> ExplorerState:
+    return current_app.extensions['chain_explorer']
+
+def get_dataset() -> DatasetVersion:
+    """Dataset version for this request (pinned on first use until the request ends)"""
+    if 'dataset' not in g:
+        g.dataset = get_state().pin()
+    return g.dataset
+
+def rejection_response(rejected: Rejected):
+    response = jsonify(rejected.payload())
+    response.status_code = rejected.status
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+@bp.before_request
+def admit_request():
+    """Admission control for API requests (requests admitted by asgi.py are passed through)"""
+    if request.environ.get('chain_explorer.admitted'):
+        return None
+    client = client_key(request.remote_addr, request.headers.get('X-Forwarded-For'))
+    try:
+        g.admission_ticket = get_state().admission.admit(request.path, client)
+    except Rejected as rejected:
+        return rejection_response(rejected)
+    return None
+
+@bp.after_request
+def add_data_version(response):
+    response.headers['X-Data-Version'] = get_dataset().version
+    if response.is_streamed:
+        # Streamed bodies are produced after teardown: hand the dataset pin and the
+        # concurrency slot over to the response until the server closes it
+        state, ticket, dataset = get_state(), g.pop('admission_ticket', None), g.pop('dataset', None)
+        response.call_on_close(lambda: release_request(state, ticket, dataset))
+    return response
+
+def release_request(state: ExplorerState, ticket, dataset):
+    """Free a request's concurrency slot and unpin its dataset version (either may be None)"""
+    if ticket is not None:
+        ticket.release()
+    if dataset is not None:
+        state.unpin(dataset)
+
+@bp.teardown_request
+def release_admission(exc=None):
+    release_request(get_state(), g.pop('admission_ticket', None), g.pop('dataset', None))
+
+def serialize_query_result(result):
+    """Convert datetime objects in a query result to strings for JSON serialization"""
+    if 'data' in result and isinstance(result['data'], list):
+        for item in result['data']:
+            for key, value in item.items():
+                if hasattr(value, 'isoformat'):
+                    item[key] = value.isoformat()
+    return result
+
+def use_approximate():
+    """Whether this request asked for sketch-backed (approximate) analytics"""
+    approx = request.args.get('approx')
+    if approx is None:
+        return current_app.config['APPROX_ANALYTICS']
+    return approx.lower() in ('1', 'true', 'yes')
 
 # Fallback NLP processor (kept for compatibility)
 class AdvancedNLPProcessor:
-    def __init__(self, df):
+    def __init__(self, df, repository=None):
         self.df = df
+        if repository is None:
+            from repository import PandasRepository
+            repository = PandasRepository(df)
+        self.repository = repository
         self.stop_words = SIMPLE_STOPWORDS
         self.setup_knowledge_base()
         
@@ -188,7 +511,7 @@ class AdvancedNLPProcessor:
     def handle_block_query(self, entities, query):
         """Handle queries about specific blocks"""
         block_num = entities['block_number']
-        block_data = self.df[self.df['index'] == block_num]
+        block_data = self.repository.block_transactions(block_num)
         
         if block_data.empty:
             return {
@@ -238,10 +561,6 @@ class AdvancedNLPProcessor:
     
     def handle_general_query(self, query):
         """Handle general blockchain queries"""
-        # Use sentiment analysis
-        blob = TextBlob(query)
-        sentiment = blob.sentiment.polarity
-        
         # Simple keyword matching for common questions
         if any(word in query.lower() for word in ['hello', 'hi', 'hey', 'greetings']):
             return {
@@ -293,131 +612,171 @@ class AdvancedNLPProcessor:
             "What is the nonce of block 3?"
         ]
 
-# Initialize fallback NLP processor (only if RAG not available)
-nlp_processor = None
-if rag_system is None:
-    nlp_processor = AdvancedNLPProcessor(blockchain_data)
-
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
     return render_template('dashboard.html')
 
-@app.route('/transactions')
+@bp.route('/transactions')
 def transactions():
     return render_template('transactions.html')
 
-@app.route('/analytics')
+@bp.route('/analytics')
 def analytics():
     return render_template('analytics.html')
 
-@app.route('/query')
+@bp.route('/query')
 def query():
     return render_template('query.html')
 
-@app.route('/api/stats')
+@bp.route('/api/stats')
 def get_stats():
-    if blockchain_data.empty:
+    dataset = get_dataset()
+    repository = dataset.repository
+    if repository.empty:
         return jsonify({"error": "No data available"})
     
-    stats = {
-        'total_blocks': int(blockchain_data['index'].nunique()),
-        'total_transactions': int(len(blockchain_data)),
-        'unique_senders': int(blockchain_data['sender'].nunique()),
-        'unique_receivers': int(blockchain_data['receiver'].nunique()),
-        'total_volume': float(blockchain_data['amount'].sum()),
-        'average_transaction': float(blockchain_data['amount'].mean()),
-        'max_transaction': float(blockchain_data['amount'].max()),
-        'min_transaction': float(blockchain_data['amount'].min())
-    }
-    return jsonify(stats)
-
-@app.route('/api/transactions')
+    if use_approximate():
+        sketches = dataset.address_sketches()
+        return jsonify({
+            'total_blocks': len(sketches.blocks),
+            'total_transactions': len(repository),
+            'unique_senders': len(sketches.senders.distinct),
+            'unique_receivers': len(sketches.receivers.distinct),
+            **repository.amount_summary(),
+            'approximate': True,
+            'error_bounds': {
+                'total_blocks': sketches.relative_error,
+                'unique_senders': sketches.relative_error,
+                'unique_receivers': sketches.relative_error
+            }
+        })
+    
+    return jsonify(repository.stats())
+
+@bp.route('/api/transactions')
 def get_transactions():
-    if blockchain_data.empty:
+    from export import ExportError, parse_filters
+    repository = get_dataset().repository
+    if repository.empty:
         return jsonify({"error": "No data available"})
     
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    # Same filters as /api/export (block, sender, receiver, min_amount, max_amount)
+    try:
+        filters = parse_filters(request.args)
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Calculate pagination
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
+    # Get pagination parameters (page size is clamped so one request cannot dump the table)
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(max(1, request.args.get('per_page', 10, type=int)), current_app.config['MAX_PAGE_SIZE'])
     
-    # Get transactions for current page
-    transactions = blockchain_data.iloc[start_idx:end_idx].to_dict('records')
+    # Count and page slice come from the store (LIMIT/OFFSET in SQL with TRANSACTION_STORE=sqlite)
+    total, page_data = repository.page(filters, (page - 1) * per_page, per_page)
     
-    # Convert datetime objects to strings for JSON serialization
-    for transaction in transactions:
-        if 'block_timestamp' in transaction:
-            transaction['block_timestamp'] = transaction['block_timestamp'].isoformat()
-        if 'transaction_timestamp' in transaction:
-            transaction['transaction_timestamp'] = transaction['transaction_timestamp'].isoformat()
+    # The envelope is written by hand so 'transactions' comes last whatever the serializer's
+    # key order, and its rows can be streamed in chunks
+    header = ''.join(
+        f'"{key}":{value},'
+        for key, value in (('page', page), ('per_page', per_page), ('total', total),
+                           ('total_pages', (total + per_page - 1) // per_page))
+    )
     
-    return jsonify({
-        'transactions': transactions,
-        'total': len(blockchain_data),
-        'page': page,
-        'per_page': per_page,
-        'total_pages': (len(blockchain_data) + per_page - 1) // per_page
-    })
-
-@app.route('/api/analytics/volume-over-time')
-def get_volume_over_time():
-    if blockchain_data.empty:
+    def generate():
+        yield '{' + header + '"transactions":['
+        for chunk_start in range(0, len(page_data), PAGE_CHUNK_ROWS):
+            transactions = page_data.iloc[chunk_start:chunk_start + PAGE_CHUNK_ROWS].to_dict('records')
+            
+            # Convert datetime objects to strings for JSON serialization
+            for transaction in transactions:
+                if 'block_timestamp' in transaction:
+                    transaction['block_timestamp'] = transaction['block_timestamp'].isoformat()
+                if 'transaction_timestamp' in transaction:
+                    transaction['transaction_timestamp'] = transaction['transaction_timestamp'].isoformat()
+            
+            rows = current_app.json.dumps(transactions, separators=(',', ':'))[1:-1]
+            yield (',' if chunk_start else '') + rows
+        yield ']}\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@bp.route('/api/export')
+def export_transactions():
+    """Stream filtered transactions as CSV, NDJSON, Arrow or Parquet (?format=&columns=)"""
+    from export import FORMATS, ExportError, parse_filters, stream_export
+    repository = get_dataset().repository
+    if repository.empty:
         return jsonify({"error": "No data available"})
     
-    # Group by date and sum amounts
-    daily_volume = blockchain_data.groupby(blockchain_data['transaction_timestamp'].dt.date)['amount'].sum().reset_index()
+    fmt = request.args.get('format', 'csv').lower()
+    columns = [column for column in request.args.get('columns', '').split(',') if column] or None
+    try:
+        chunks = stream_export(repository, fmt, parse_filters(request.args), columns)
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=transactions.{fmt}'
+    return response
+
+@bp.route('/api/analytics/volume-over-time')
+def get_volume_over_time():
+    repository = get_dataset().repository
+    if repository.empty:
+        return jsonify({"error": "No data available"})
     
-    return jsonify({
-        'dates': [str(date) for date in daily_volume['transaction_timestamp']],
-        'volumes': daily_volume['amount'].tolist()
-    })
+    # Daily volume (grouped by date)
+    return jsonify(repository.volume_over_time())
 
-@app.route('/api/analytics/top-senders')
+@bp.route('/api/analytics/top-senders')
 def get_top_senders():
-    if blockchain_data.empty:
+    dataset = get_dataset()
+    if dataset.repository.empty:
         return jsonify({"error": "No data available"})
     
-    top_senders = blockchain_data.groupby('sender')['amount'].sum().sort_values(ascending=False).head(10)
+    if use_approximate():
+        top = dataset.address_sketches().senders.top(10, by='volume')
+        return jsonify({
+            'senders': [item['key'] for item in top],
+            'amounts': [item['estimate'] for item in top],
+            'approximate': True,
+            'error_bounds': [item['error'] for item in top]
+        })
     
-    return jsonify({
-        'senders': top_senders.index.tolist(),
-        'amounts': top_senders.values.tolist()
-    })
+    return jsonify(dataset.repository.top_addresses('sender'))
 
-@app.route('/api/analytics/top-receivers')
+@bp.route('/api/analytics/top-receivers')
 def get_top_receivers():
-    if blockchain_data.empty:
+    dataset = get_dataset()
+    if dataset.repository.empty:
         return jsonify({"error": "No data available"})
     
-    top_receivers = blockchain_data.groupby('receiver')['amount'].sum().sort_values(ascending=False).head(10)
+    if use_approximate():
+        top = dataset.address_sketches().receivers.top(10, by='volume')
+        return jsonify({
+            'receivers': [item['key'] for item in top],
+            'amounts': [item['estimate'] for item in top],
+            'approximate': True,
+            'error_bounds': [item['error'] for item in top]
+        })
     
-    return jsonify({
-        'receivers': top_receivers.index.tolist(),
-        'amounts': top_receivers.values.tolist()
-    })
+    return jsonify(dataset.repository.top_addresses('receiver'))
 
-@app.route('/api/analytics/block-distribution')
+@bp.route('/api/analytics/block-distribution')
 def get_block_distribution():
-    if blockchain_data.empty:
+    repository = get_dataset().repository
+    if repository.empty:
         return jsonify({"error": "No data available"})
     
     # Get transaction count per block
-    block_counts = blockchain_data['index'].value_counts().sort_index()
-    
-    return jsonify({
-        'blocks': block_counts.index.tolist(),
-        'transaction_counts': block_counts.values.tolist()
-    })
+    return jsonify(repository.block_distribution())
 
-@app.route('/api/query')
+@bp.route('/api/query')
 def query_data():
+    dataset = get_dataset()
     query = request.args.get('q', '').strip()
     
     if not query:
@@ -425,10 +784,10 @@ def query_data():
     
     try:
         # Use RAG system if available, otherwise fallback to NLP processor
-        if rag_system:
-            result = rag_system.query(query)
-        elif nlp_processor:
-            result = nlp_processor.process_query(query)
+        if dataset.rag_system:
+            result = dataset.rag_system.query(query)
+        elif dataset.nlp_processor:
+            result = dataset.nlp_processor.process_query(query)
         else:
             return jsonify({
                 'type': 'error',
@@ -436,21 +795,14 @@ def query_data():
                 'suggestions': []
             })
         
-        # Convert datetime objects to strings for JSON serialization
-        if 'data' in result and isinstance(result['data'], list):
-            for item in result['data']:
-                for key, value in item.items():
-                    if hasattr(value, 'isoformat'):
-                        item[key] = value.isoformat()
-        
-        return jsonify(result)
+        return jsonify(serialize_query_result(result))
     
     except Exception as e:
         suggestions = []
-        if rag_system:
-            suggestions = rag_system._get_suggestions()
-        elif nlp_processor:
-            suggestions = nlp_processor.get_suggestions()
+        if dataset.rag_system:
+            suggestions = dataset.rag_system._get_suggestions()
+        elif dataset.nlp_processor:
+            suggestions = dataset.nlp_processor.get_suggestions()
         
         return jsonify({
             'type': 'error',
@@ -458,11 +810,59 @@ def query_data():
             'suggestions': suggestions
         })
 
-@app.route('/api/rag/performance')
+@bp.route('/api/query/batch', methods=['POST'])
+def query_batch():
+    """Answer {"queries": [...]} in one request; results are in input order"""
+    dataset = get_dataset()
+    payload = request.get_json(silent=True) or {}
+    queries = payload.get('queries')
+    if (not isinstance(queries, list) or not queries
+            or not all(isinstance(query, str) and query.strip() for query in queries)):
+        return jsonify({"error": "Expected a non-empty list of query strings in 'queries'"}), 400
+    limit = current_app.config['MAX_BATCH_QUERIES']
+    if len(queries) > limit:
+        return jsonify({"error": f"Too many queries (at most {limit} per batch)"}), 400
+    
+    try:
+        if dataset.rag_system:
+            batch = dataset.rag_system.query_batch(queries)
+        elif dataset.nlp_processor:
+            start_time = time.time()
+            batch = {
+                'results': [dataset.nlp_processor.process_query(query.strip()) for query in queries],
+                'count': len(queries),
+                'unique': len(queries),
+            }
+            batch['timings'] = {'total': time.time() - start_time}
+        else:
+            return jsonify({
+                'type': 'error',
+                'response': "Query system not available. Please ensure data is loaded.",
+                'suggestions': []
+            })
+        
+        batch['results'] = [serialize_query_result(result) for result in batch['results']]
+        return jsonify(batch)
+    
+    except Exception as e:
+        suggestions = []
+        if dataset.rag_system:
+            suggestions = dataset.rag_system._get_suggestions()
+        elif dataset.nlp_processor:
+            suggestions = dataset.nlp_processor.get_suggestions()
+        
+        return jsonify({
+            'type': 'error',
+            'response': f"Error processing queries: {str(e)}",
+            'suggestions': suggestions
+        })
+
+@bp.route('/api/rag/performance')
 def get_rag_performance():
     """Get RAG system performance metrics"""
-    if rag_system:
-        stats = rag_system.get_performance_stats()
+    dataset = get_dataset()
+    if dataset.rag_system:
+        stats = dataset.rag_system.get_performance_stats()
         return jsonify(stats)
     else:
         return jsonify({
@@ -473,50 +873,102 @@ def get_rag_performance():
             'user_count': 0
         })
 
-@app.route('/api/analytics/transaction-timeline')
-def get_transaction_timeline():
-    if blockchain_data.empty:
+@bp.route('/api/admission/metrics')
+def get_admission_metrics():
+    """Admitted and rejected requests, in-flight and queued work per endpoint class"""
+    return jsonify(get_state().admission.metrics())
+
+@bp.route('/api/dataset')
+def get_dataset_status():
+    """Current data version, row count and the outcome of the last reload"""
+    return jsonify(get_state().status())
+
+@bp.route('/api/admin/reload', methods=['POST'])
+def reload_dataset():
+    """Rebuild the dataset from DATA_FILE in the background and swap it in (Bearer ADMIN_TOKEN)"""
+    token = current_app.config['ADMIN_TOKEN']
+    if not token:
+        return jsonify({"error": "Reload endpoint disabled (set ADMIN_TOKEN)"}), 403
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+        return jsonify({"error": "Invalid admin token"}), 401
+    state = get_state()
+    started = state.reload()
+    return jsonify({'status': 'reloading' if started else 'already_reloading', **state.status()}), 202
+
+@bp.route('/api/analytics/anomalies')
+def get_anomalies():
+    """Precomputed anomalies (?type=, address=, since=, limit= per type), highest scores first"""
+    from anomalies import KINDS
+    dataset = get_dataset()
+    if dataset.repository.empty:
         return jsonify({"error": "No data available"})
+    if dataset.anomalies is None:
+        return jsonify({"error": "Anomaly detection not available"})
     
-    # Get transaction timeline data
-    timeline_data = blockchain_data.groupby(blockchain_data['transaction_timestamp'].dt.hour).size().reset_index()
-    timeline_data.columns = ['hour', 'count']
+    kind = request.args.get('type') or None
+    if kind is not None and kind not in KINDS:
+        return jsonify({"error": f"Unknown anomaly type '{kind}' (expected one of: {', '.join(KINDS)})"}), 400
+    since = None
+    if request.args.get('since'):
+        try:
+            import pandas as pd
+            since = pd.Timestamp(request.args['since'])
+        except ValueError as e:
+            return jsonify({"error": f"Invalid since value: {e}"}), 400
+    limit = min(max(1, request.args.get('limit', 20, type=int)), current_app.config['MAX_PAGE_SIZE'])
+    address = request.args.get('address', '').strip() or None
+    return jsonify(dataset.anomalies.query(kind, address, since, limit))
+
+@bp.route('/api/analytics/transaction-timeline')
+def get_transaction_timeline():
+    repository = get_dataset().repository
+    if repository.empty:
+        return jsonify({"error": "No data available"})
     
-    return jsonify({
-        'hours': timeline_data['hour'].tolist(),
-        'counts': timeline_data['count'].tolist()
-    })
+    # Transactions per hour of day
+    return jsonify(repository.transaction_timeline())
 
-@app.route('/api/analytics/network-stats')
+@bp.route('/api/analytics/network-stats')
 def get_network_stats():
-    if blockchain_data.empty:
+    dataset = get_dataset()
+    if dataset.repository.empty:
         return jsonify({"error": "No data available"})
     
-    # Calculate network statistics
-    unique_addresses = set(blockchain_data['sender'].unique()) | set(blockchain_data['receiver'].unique())
-    
-    # Calculate transaction patterns
-    sender_counts = blockchain_data['sender'].value_counts()
-    receiver_counts = blockchain_data['receiver'].value_counts()
+    if use_approximate():
+        sketches = dataset.address_sketches()
+        top_sender = sketches.senders.top(1, by='count')
+        top_receiver = sketches.receivers.top(1, by='count')
+        return jsonify({
+            'total_unique_addresses': len(sketches.unique_addresses()),
+            'most_active_sender': top_sender[0]['key'] if top_sender else None,
+            'most_active_receiver': top_receiver[0]['key'] if top_receiver else None,
+            'sender_transaction_count': int(top_sender[0]['estimate']) if top_sender else 0,
+            'receiver_transaction_count': int(top_receiver[0]['estimate']) if top_receiver else 0,
+            'approximate': True,
+            'error_bounds': {
+                'total_unique_addresses': sketches.relative_error,
+                'sender_transaction_count': top_sender[0]['error'] if top_sender else 0,
+                'receiver_transaction_count': top_receiver[0]['error'] if top_receiver else 0
+            }
+        })
     
-    return jsonify({
-        'total_unique_addresses': len(unique_addresses),
-        'most_active_sender': sender_counts.index[0] if not sender_counts.empty else None,
-        'most_active_receiver': receiver_counts.index[0] if not receiver_counts.empty else None,
-        'sender_transaction_count': int(sender_counts.iloc[0]) if not sender_counts.empty else 0,
-        'receiver_transaction_count': int(receiver_counts.iloc[0]) if not receiver_counts.empty else 0
-    })
-
-@app.route('/health')
+    # Unique addresses and the most active sender / receiver
+    return jsonify(dataset.repository.network_stats())
+
+@bp.route('/health')
 def health():
     """Health check endpoint for Render monitoring"""
+    repository = get_dataset().repository
     return jsonify({
         "status": "healthy",
-        "data_loaded": not blockchain_data.empty,
-        "data_rows": len(blockchain_data) if not blockchain_data.empty else 0
+        "data_loaded": not repository.empty,
+        "data_rows": len(repository)
     }), 200
 
 if __name__ == '__main__':
+    app = create_app()
+
     # Get configuration from environment variables
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 5000))
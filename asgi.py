@@ -0,0 +1,247 @@
+"""
+ASGI entry point for I/O-bound query traffic
+/api/query and /api/query/stream (Server-Sent Events) run on asyncio, so a slow LLM
+call does not hold a thread; retrieval, result assembly and every other (Flask)
+route run on a bounded thread pool.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from admission import Rejected, client_key
+from app import create_app, serialize_query_result
+
+flask_app = create_app()
+state = flask_app.extensions['chain_explorer']
+
+# CPU-bound work (embedding, index search, pandas aggregation, Flask routes) shares this pool
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ASGI_CPU_WORKERS', str(min(8, (os.cpu_count() or 1) + 2)))),
+    thread_name_prefix='asgi-cpu'
+)
+
+def dumps(payload) -> str:
+    # Same encoder, key order and compact separators as Flask's jsonify
+    return flask_app.json.dumps(payload, separators=(',', ':'))
+
+
+async def send_json(send, payload, status: int = 200, headers=()):
+    body = dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    *headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def watch_disconnect(receive, disconnected: asyncio.Event):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+def version_header(dataset):
+    return (b'x-data-version', dataset.version.encode('latin-1'))
+
+
+async def query_events(query: str, dataset):
+    """Token and result events for a query from whichever query system the dataset has"""
+    if dataset.rag_system:
+        async for event in dataset.rag_system.astream(query, executor):
+            yield event
+        return
+    if dataset.nlp_processor:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(executor, dataset.nlp_processor.process_query, query)
+        except Exception as e:
+            result = {
+                'type': 'error',
+                'response': f"Error processing query: {str(e)}",
+                'suggestions': dataset.nlp_processor.get_suggestions()
+            }
+        yield {'event': 'result', 'data': result}
+        return
+    yield {'event': 'result', 'data': {
+        'type': 'error',
+        'response': "Query system not available. Please ensure data is loaded.",
+        'suggestions': []
+    }}
+
+
+async def handle_query(scope, receive, send, dataset):
+    """GET /api/query (same response as the Flask route)"""
+    query = parse_qs(scope['query_string'].decode('latin-1')).get('q', [''])[0].strip()
+    if not query:
+        return await send_json(send, {"error": "No query provided"}, headers=[version_header(dataset)])
+    result = None
+    async for event in query_events(query, dataset):
+        if event['event'] == 'result':
+            result = event['data']
+    await send_json(send, serialize_query_result(result), headers=[version_header(dataset)])
+
+
+async def handle_query_stream(scope, receive, send, dataset):
+    """GET /api/query/stream: 'token' events while the answer is generated, then 'result'"""
+    query = parse_qs(scope['query_string'].decode('latin-1')).get('q', [''])[0].strip()
+    if not query:
+        return await send_json(send, {"error": "No query provided"}, headers=[version_header(dataset)])
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            version_header(dataset),
+        ]
+    })
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(watch_disconnect(receive, disconnected))
+    try:
+        async for event in query_events(query, dataset):
+            if disconnected.is_set():
+                # Client went away: stop generating instead of paying for unread tokens
+                break
+            data = event['data']
+            if event['event'] == 'result':
+                data = serialize_query_result(data)
+            message = f"event: {event['event']}\ndata: {dumps(data)}\n\n"
+            await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+
+
+ASYNC_ROUTES = {
+    '/api/query': handle_query,
+    '/api/query/stream': handle_query_stream,
+}
+
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    """PEP 3333 environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        # Admission was decided before the request reached Flask
+        'chain_explorer.admitted': True,
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def call_flask(scope, receive, send):
+    """Serve any other route with the Flask app on the executor, streaming its body"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    loop = asyncio.get_running_loop()
+    environ = wsgi_environ(scope, body)
+
+    def send_from_thread(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run_wsgi():
+        # One thread runs the app and drains its body (streamed responses keep their context)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: None
+
+        iterable = flask_app(environ, start_response)
+        try:
+            send_from_thread({'type': 'http.response.start', 'status': started['status'],
+                              'headers': started['headers']})
+            for chunk in iterable:
+                if chunk:
+                    send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_from_thread({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    await loop.run_in_executor(executor, run_wsgi)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if state.dataset.rag_system:
+                # Import openai and build the async client before traffic, not on the first query
+                await asyncio.get_running_loop().run_in_executor(executor, state.dataset.rag_system.warm_up_llm)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise NotImplementedError(f"Unsupported ASGI scope type '{scope['type']}'")
+    headers = dict(scope['headers'])
+    forwarded_for = headers.get(b'x-forwarded-for')
+    client = client_key((scope.get('client') or ('', 0))[0], forwarded_for and forwarded_for.decode('latin-1'))
+    try:
+        # Queued requests wait on the event loop, not in an executor thread
+        ticket = await state.admission.admit_async(scope['path'], client)
+    except Rejected as rejected:
+        return await send_json(send, rejected.payload(), rejected.status,
+                               [(b'retry-after', str(rejected.retry_after).encode())])
+    try:
+        handler = ASYNC_ROUTES.get(scope['path']) if scope['method'] == 'GET' else None
+        if handler is None:
+            # Flask pins the dataset version itself
+            return await call_flask(scope, receive, send)
+        # The query finishes on the version it started on, even if a reload swaps meanwhile
+        dataset = state.pin()
+        try:
+            await handler(scope, receive, send, dataset)
+        finally:
+            state.unpin(dataset)
+    finally:
+        if ticket is not None:
+            ticket.release()
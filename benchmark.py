@@ -0,0 +1,912 @@
+#!/usr/bin/env python3
+"""
+Chain Explorer - Performance benchmarks
+Runs micro-benchmarks against a synthetic blockchain of configurable size
+
+Usage: python benchmark.py <benchmark> [--rows N]
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def make_synthetic_chain(rows: int, addresses: int = None, tx_per_block: int = 20, seed: int = 42) -> pd.DataFrame:
+    """Generate a blockchain DataFrame with the same schema as combined_block.csv"""
+    rng = np.random.default_rng(seed)
+    addresses = addresses or max(10, rows // 10)
+    pool = np.array([f"1{i:033x}" for i in range(addresses)], dtype=object)
+    # Zipf-like activity so there are real heavy hitters
+    weights = 1.0 / np.arange(1, addresses + 1) ** 1.1
+    weights /= weights.sum()
+    senders = pool[rng.choice(addresses, size=rows, p=weights)]
+    receivers = pool[rng.choice(addresses, size=rows, p=weights)]
+    blocks = np.arange(rows) // tx_per_block + 1
+    start = pd.Timestamp('2024-06-11').value // 10**9
+    block_times = start + blocks * 600 + rng.integers(0, 60, size=rows)
+    return pd.DataFrame({
+        'index': blocks,
+        'block_timestamp': pd.to_datetime(block_times, unit='s'),
+        'previous_hash': '0' * 64,
+        'nonce': rng.integers(0, 10**6, size=rows),
+        'hash': '0' * 64,
+        'sender': senders,
+        'receiver': receivers,
+        'amount': np.round(rng.lognormal(4, 2, size=rows), 2),
+        'transaction_timestamp': pd.to_datetime(block_times - rng.integers(0, 600, size=rows), unit='s'),
+        'transaction_id': [f"{i:064x}" for i in range(rows)],
+    })
+
+
+def write_chain_csv(df: pd.DataFrame, path: str) -> str:
+    """Write df in the combined_block.csv format (unix-second timestamps) for DATA_FILE"""
+    export = df.copy()
+    for column in ('block_timestamp', 'transaction_timestamp'):
+        export[column] = export[column].to_numpy().astype('datetime64[s]').astype('int64')
+    export.to_csv(path, index=False)
+    return path
+
+
+def timed(func, *args, repeat: int = 3, **kwargs):
+    """Best-of-N wall time in seconds and the last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_sketches(df: pd.DataFrame, args):
+    """Exact pandas analytics vs. merged HyperLogLog/Count-Min/Space-Saving sketches"""
+    from sketches import build_bucketed_sketches, merge_sketches
+
+    def exact():
+        unique = set(df['sender'].unique()) | set(df['receiver'].unique())
+        top = df.groupby('sender')['amount'].sum().sort_values(ascending=False).head(10)
+        return len(unique), top
+
+    exact_time, (exact_unique, exact_top) = timed(exact)
+    build_time, buckets = timed(build_bucketed_sketches, df, freq=args.bucket, repeat=1)
+    merge_time, merged = timed(merge_sketches, buckets.values())
+    query_time, (approx_unique, approx_top) = timed(lambda: (len(merged.unique_addresses()), merged.senders.top(10)))
+
+    overlap = len(set(exact_top.index) & {item['key'] for item in approx_top})
+    print(f"Exact groupby/set:        {exact_time * 1000:9.1f} ms per request")
+    print(f"Sketch build ({len(buckets)} buckets): {build_time * 1000:9.1f} ms once")
+    print(f"Sketch merge:             {merge_time * 1000:9.1f} ms once")
+    print(f"Sketch query:             {query_time * 1000:9.1f} ms per request")
+    print(f"Unique addresses: exact={exact_unique} approx={approx_unique} "
+          f"(error {abs(approx_unique - exact_unique) / max(exact_unique, 1):.2%})")
+    print(f"Top-10 sender overlap: {overlap}/10")
+
+
+def bench_parallel(df: pd.DataFrame, args):
+    """Analytics kernels and knowledge-base build at 1/2/4/8 worker processes"""
+    from parallel import AnalyticsEngine, map_frame_partitions
+    from rag_system import build_block_documents
+
+    def analytics(engine):
+        engine._address_totals = None
+        engine.volume_over_time()
+        engine.top_addresses('sender')
+        engine.top_addresses('receiver')
+        engine.block_distribution()
+        engine.transaction_timeline()
+        engine.network_stats()
+
+    kb_frame = df.iloc[:args.kb_rows]
+    baseline = None
+    print(f"{'workers':>7} {'analytics':>12} {'speedup':>8} {'kb build':>12} {'speedup':>8}")
+    for workers in (1, 2, 4, 8):
+        engine = AnalyticsEngine(df, workers=workers, min_rows=0)
+        analytics_time, _ = timed(analytics, engine)
+        kb_time, _ = timed(map_frame_partitions, build_block_documents, kb_frame,
+                           workers=workers, min_rows=0, repeat=1)
+        engine.close()
+        baseline = baseline or (analytics_time, kb_time)
+        print(f"{workers:>7} {analytics_time * 1000:>9.1f} ms {baseline[0] / analytics_time:>7.2f}x "
+              f"{kb_time * 1000:>9.1f} ms {baseline[1] / kb_time:>7.2f}x")
+
+
+def legacy_keyword_search(documents, query: str, top_k: int = 3):
+    """The substring-count keyword search RAGSystem used before the BM25 index"""
+    query_lower = query.lower()
+    scores = []
+    for doc in documents:
+        score = 0
+        text_lower = doc['text'].lower()
+        for word in query_lower.split():
+            if word in text_lower:
+                score += text_lower.count(word)
+        scores.append((doc, score))
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return [{'document': doc, 'score': score} for doc, score in scores[:top_k] if score > 0]
+
+
+def block_queries(documents, count: int = 200, seed: int = 7):
+    """Block questions paired with the id of the document that answers them"""
+    rng = np.random.default_rng(seed)
+    blocks = [doc for doc in documents if 'block_index' in doc]
+    picked = rng.choice(len(blocks), size=min(count, len(blocks)), replace=False)
+    return [(f"What is the total amount in block {blocks[i]['block_index']}?", blocks[i]['id']) for i in picked]
+
+
+def recall_at_k(search, queries, k: int = 3) -> float:
+    hits = sum(1 for query, expected in queries if expected in [r['document']['id'] for r in search(query, k)])
+    return hits / max(len(queries), 1)
+
+
+def bench_retrieval(df: pd.DataFrame, args):
+    """Legacy substring keyword search vs. the BM25 inverted index"""
+    from rag_system import build_block_documents
+    from retrieval import BM25Index
+
+    documents = build_block_documents(df.iloc[:args.kb_rows])
+    build_time, index = timed(lambda: (lambda i: (i.add_documents(d['text'] for d in documents), i)[1])(BM25Index()), repeat=1)
+    queries = block_queries(documents)
+
+    def bm25_search(query, k):
+        return [{'document': documents[idx], 'score': score} for idx, score in index.search(query, k)]
+
+    legacy_time, _ = timed(lambda: [legacy_keyword_search(documents, q) for q, _ in queries[:20]], repeat=1)
+    bm25_time, _ = timed(lambda: [bm25_search(q, 3) for q, _ in queries[:20]])
+    print(f"Documents: {len(documents):,}  BM25 index build: {build_time * 1000:.1f} ms")
+    print(f"Legacy keyword search: {legacy_time / 20 * 1000:9.2f} ms/query  "
+          f"recall@3={recall_at_k(lambda q, k: legacy_keyword_search(documents, q, k), queries[:50]):.2f}")
+    print(f"BM25 inverted index:   {bm25_time / 20 * 1000:9.2f} ms/query  "
+          f"recall@3={recall_at_k(bm25_search, queries[:50]):.2f}")
+
+
+def bench_hierarchy(df: pd.DataFrame, args):
+    """Flat top-k retrieval vs. coarse-to-fine search over window and address summaries"""
+    from rag_system import RAGSystem
+
+    rag = RAGSystem(df.iloc[:args.kb_rows])
+    day_docs = [doc for doc in rag.documents if doc.get('level') == 'day']
+    address_docs = [doc for doc in rag.documents if doc.get('level') == 'address']
+    queries = {
+        'block': block_queries(rag.documents, 50),
+        'day': [(f"How much volume moved on {doc['window']}?", doc['id']) for doc in day_docs[:50]],
+        'address': [(f"What did {doc['address']} do?", doc['id']) for doc in address_docs[:50]],
+    }
+    flat_time, _ = timed(lambda: [rag._semantic_search(q) for q, _ in queries['block']])
+    tree_time, _ = timed(lambda: [rag._hierarchical_search(q) for q, _ in queries['block']])
+    print(f"Documents: {len(rag.documents):,} ({len(rag.coarse_ids):,} coarse, "
+          f"{len(rag.block_doc_ids):,} block, {len(rag.address_doc_ids):,} address)")
+    print(f"Flat search:         {flat_time / 50 * 1000:8.2f} ms/query")
+    print(f"Hierarchical search: {tree_time / 50 * 1000:8.2f} ms/query")
+    for kind, kind_queries in queries.items():
+        print(f"recall@3 {kind:>8}: flat={recall_at_k(lambda q, k: rag._semantic_search(q, k), kind_queries):.2f} "
+              f"hierarchical={recall_at_k(lambda q, k: rag._hierarchical_search(q, k), kind_queries):.2f}")
+
+
+def synthetic_embeddings(rows: int, dims: int = 384, rank: int = 24, seed: int = 3) -> np.ndarray:
+    """Low-rank plus noise vectors, shaped like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    latent = rng.normal(size=(rows, rank)).astype(np.float32)
+    return latent @ rng.normal(size=(rank, dims)).astype(np.float32) + 0.5 * rng.normal(size=(rows, dims)).astype(np.float32)
+
+
+def bench_quantization(df: pd.DataFrame, args):
+    """Memory, latency and recall@10 of float32, int8 and PQ embedding stores"""
+    import tempfile
+    from vector_store import create_vector_store
+
+    vectors = synthetic_embeddings(args.vectors)
+    rng = np.random.default_rng(11)
+    queries = vectors[rng.integers(0, len(vectors), 50)] + 0.1 * rng.normal(size=(50, vectors.shape[1]))
+    exact = create_vector_store('none').fit(vectors)
+    truth = [{idx for idx, _ in exact.search(query, 10)} for query in queries]
+
+    print(f"{len(vectors):,} x {vectors.shape[1]} embeddings")
+    print(f"{'store':>12} {'scanned':>10} {'on disk':>10} {'ms/query':>9} {'recall@10':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind, rerank in (('none', False), ('int8', False), ('int8', True), ('pq', False), ('pq', True)):
+            path = os.path.join(tmp, f'{kind}_{rerank}')
+            store = create_vector_store(kind, rerank).fit(vectors)
+            store.save(path)
+            # Search through the reloaded store, as a worker would after startup
+            store = type(store).load(path)
+            latency, results = timed(lambda: [store.search(query, 10) for query in queries])
+            recall = np.mean([len({idx for idx, _ in result} & expected) / 10
+                              for result, expected in zip(results, truth)])
+            disk = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp) if name.startswith(f'{kind}_{rerank}'))
+            label = f"{kind}{'+rerank' if rerank else ''}"
+            print(f"{label:>12} {store.nbytes / 2**20:>7.1f} MB {disk / 2**20:>7.1f} MB "
+                  f"{latency / len(queries) * 1000:>9.2f} {recall:>10.3f}")
+
+
+EMBEDDER_PROBE = """
+import json, resource, sys, time
+import numpy as np
+start = time.perf_counter()
+from embedders import create_embedder
+embedder = create_embedder(sys.argv[1])
+ready = time.perf_counter() - start
+payload = json.load(sys.stdin)
+doc_vectors = embedder.encode(payload['documents'])
+doc_vectors /= np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+latencies, rankings = [], []
+for query in payload['queries']:
+    t = time.perf_counter()
+    vector = embedder.encode([query])[0]
+    latencies.append(time.perf_counter() - t)
+    rankings.append(np.argsort(-(doc_vectors @ vector))[:5].tolist())
+print(json.dumps({
+    'ready': ready,
+    'latency': float(np.median(latencies)),
+    'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'rankings': rankings
+}))
+"""
+
+
+def bench_embedders(df: pd.DataFrame, args):
+    """Startup time, query latency, peak RSS and top-5 agreement per embedding backend"""
+    import json
+    import subprocess
+    from rag_system import build_block_documents
+
+    documents = build_block_documents(df.iloc[:args.kb_rows])
+    payload = json.dumps({
+        'documents': [doc['text'] for doc in documents],
+        'queries': [query for query, _ in block_queries(documents, 50)]
+    })
+    results = {}
+    for backend in ('sentence-transformers', 'onnx', 'hashing'):
+        probe = subprocess.run([sys.executable, '-c', EMBEDDER_PROBE, backend], input=payload,
+                               capture_output=True, text=True)
+        if probe.returncode != 0:
+            print(f"{backend:>22}: unavailable ({probe.stderr.strip().splitlines()[-1]})")
+            continue
+        results[backend] = json.loads(probe.stdout.strip().splitlines()[-1])
+
+    if not results:
+        return
+    reference = next(iter(results))
+    print(f"{len(documents):,} documents, agreement = top-5 overlap with {reference}")
+    print(f"{'backend':>22} {'import+load':>12} {'ms/query':>9} {'peak RSS':>10} {'agreement':>10}")
+    for backend, result in results.items():
+        agreement = np.mean([
+            len(set(mine) & set(ref)) / 5
+            for mine, ref in zip(result['rankings'], results[reference]['rankings'])
+        ])
+        print(f"{backend:>22} {result['ready']:>10.2f} s {result['latency'] * 1000:>9.2f} "
+              f"{result['rss'] / 1024:>7.0f} MB {agreement:>10.2f}")
+
+
+# Tracked startup budgets (seconds); the startup benchmark exits non-zero when one is exceeded
+IMPORT_BUDGET = 0.5
+READY_BUDGET = 30.0
+
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+ready = time.perf_counter()
+flask_app.test_client().get('/api/stats')
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': ready - imported, 'first_request': served - ready}))
+"""
+
+
+def import_profile(module: str = 'app', limit: int = 8) -> List[Tuple[str, float]]:
+    """Heaviest direct imports of a module from a -X importtime run (cumulative seconds)"""
+    import subprocess
+
+    probe = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                           capture_output=True, text=True, check=True)
+    entries = []
+    for line in probe.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1e6))
+    # Children are reported before their parent; walk back from the module's own line
+    position = max(i for i, (depth, name, _) in enumerate(entries) if name == module and depth == 0)
+    children = []
+    for depth, name, seconds in reversed(entries[:position]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, seconds))
+    return [(module, entries[position][2])] + sorted(children, key=lambda item: -item[1])[:limit]
+
+
+def bench_startup(df: pd.DataFrame, args):
+    """Import time of app.py and import-to-ready time of create_app() against budgets"""
+    import json
+    import subprocess
+    import tempfile
+
+    profile = import_profile('app')
+    print(f"import app: {profile[0][1] * 1000:.0f} ms cumulative (-X importtime); heaviest imports:")
+    for name, seconds in profile[1:]:
+        print(f"  {name:<30} {seconds * 1000:>8.1f} ms")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, DATA_FILE=write_chain_csv(df, os.path.join(workdir, 'chain.csv')))
+        started = time.perf_counter()
+        probe = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True,
+                               env=env, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        total = time.perf_counter() - started
+    timings = json.loads(probe.stdout.strip().splitlines()[-1])
+
+    print(f"\n{len(df):,} rows, process start to first response:")
+    print(f"  {'interpreter + import app':<26} {total - sum(timings.values()):>7.2f} s (interpreter)"
+          f" + {timings['import']:.2f} s (import)")
+    print(f"  {'create_app()':<26} {timings['create_app']:>7.2f} s")
+    print(f"  {'first /api/stats':<26} {timings['first_request']:>7.2f} s")
+
+    over = []
+    if timings['import'] > args.import_budget:
+        over.append(f"import {timings['import']:.2f} s > {args.import_budget:.2f} s")
+    ready = timings['import'] + timings['create_app']
+    if ready > args.ready_budget:
+        over.append(f"import-to-ready {ready:.2f} s > {args.ready_budget:.2f} s")
+    if over:
+        print("❌ Over budget: " + "; ".join(over))
+        sys.exit(1)
+    print(f"✓ Within budget (import {args.import_budget:.2f} s, import-to-ready {args.ready_budget:.2f} s)")
+
+
+STUB_ANSWER = ("Block 42 contains several transactions; the largest transfer moved funds between two "
+               "frequently active addresses. ").split(' ')
+
+
+async def serve_stub_llm(delay: float, capacity: int = 0):
+    """OpenAI-compatible /v1/chat/completions stub answering after delay seconds (streams too)
+
+    With a capacity, at most that many completions are generated at once and the rest
+    wait, like a rate-limited upstream model.
+    """
+    import asyncio
+    import contextlib
+    import json
+
+    slots = asyncio.Semaphore(capacity) if capacity else contextlib.nullcontext()
+
+    async def handle(reader, writer):
+        try:
+            headers = {}
+            await reader.readline()
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            request = json.loads(await reader.readexactly(int(headers.get('content-length', 0))) or b'{}')
+            async with slots:
+                if not request.get('stream'):
+                    await asyncio.sleep(delay)
+                    body = json.dumps({
+                        'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': request.get('model'),
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': ' '.join(STUB_ANSWER)}}]
+                    }).encode()
+                    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                                 b'Content-Length: %d\r\n\r\n' % len(body) + body)
+                else:
+                    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                                 b'Transfer-Encoding: chunked\r\n\r\n')
+                    events = [
+                        {'id': 'stub', 'object': 'chat.completion.chunk', 'created': 0, 'model': request.get('model'),
+                         'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}]}
+                        for word in STUB_ANSWER
+                    ]
+                    for event in events:
+                        await asyncio.sleep(delay / len(events))
+                        data = f"data: {json.dumps(event)}\n\n".encode()
+                        writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+                        await writer.drain()
+                    data = b'data: [DONE]\n\n'
+                    writer.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(data), data))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0, backlog=1024)
+
+
+async def http_get(port: int, path: str, headers: dict = None) -> int:
+    """Minimal HTTP/1.1 GET; returns the status code once the full body is read
+
+    headers, if given, is filled with the (lower-cased) response headers.
+    """
+    import asyncio
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        if headers is not None:
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+    await reader.read()
+    writer.close()
+    return status
+
+
+SERVERS = {
+    'wsgi (gunicorn 2x4 threads)': ['gunicorn', '--bind', '127.0.0.1:{port}', 'wsgi:app', '--timeout', '300',
+                                    '--workers', '2', '--threads', '4'],
+    'asgi (uvicorn 2 workers)': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', '{port}',
+                                 '--workers', '2', '--log-level', 'warning'],
+}
+
+
+@contextlib.asynccontextmanager
+async def running_server(command: List[str], env: dict):
+    """Start an app server subprocess and yield its port once /health answers"""
+    import asyncio
+    import socket
+    import subprocess
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([part.format(port=port) for part in command], env=env,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                if await http_get(port, '/health') == 200:
+                    break
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError(f"{command[0]} exited during startup")
+                await asyncio.sleep(0.5)
+        yield port
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def http_load(port: int, paths: List[str]) -> Tuple[float, List[Tuple[int, float]]]:
+    """Issue every request at once; returns wall time and (status, latency) per request"""
+    import asyncio
+
+    async def one(path):
+        t = time.perf_counter()
+        try:
+            status = await http_get(port, path)
+        except OSError:
+            status = 0
+        return status, time.perf_counter() - t
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(path) for path in paths))
+    return time.perf_counter() - started, results
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float('nan')
+
+
+def serving_env(df: pd.DataFrame, workdir: str, stub_port: int, **overrides) -> dict:
+    env = dict(os.environ, DATA_FILE=write_chain_csv(df, os.path.join(workdir, 'chain.csv')),
+               OPENAI_API_KEY='stub', OPENAI_BASE_URL=f'http://127.0.0.1:{stub_port}/v1')
+    env.update({key: str(value) for key, value in overrides.items()})
+    return env
+
+
+def bench_serving(df: pd.DataFrame, args):
+    """Concurrent LLM-bound /api/query load against gunicorn (WSGI) and uvicorn (ASGI)"""
+    import asyncio
+    import tempfile
+
+    async def run():
+        stub = await serve_stub_llm(args.llm_delay)
+        print(f"{args.concurrency} concurrent queries, stub LLM latency {args.llm_delay:.1f} s")
+        print(f"{'server':>28} {'endpoint':>18} {'wall':>8} {'req/s':>7} {'p50':>7} {'p99':>7} {'errors':>7}")
+        with tempfile.TemporaryDirectory() as workdir:
+            # Every request comes from one address: lift the per-client rate limit
+            env = serving_env(df.iloc[:args.kb_rows], workdir, stub.sockets[0].getsockname()[1], RATE_LIMIT=0)
+            for name, command in SERVERS.items():
+                async with running_server(command, env) as port:
+                    endpoints = ['query', 'query/stream'] if name.startswith('asgi') else ['query']
+                    for endpoint in endpoints:
+                        paths = [f"/api/{endpoint}?q=what+happened+in+block+{i % 50 + 1}"
+                                 for i in range(args.concurrency)]
+                        elapsed, results = await http_load(port, paths)
+                        ok = [latency for status, latency in results if status == 200]
+                        print(f"{name:>28} {'/api/' + endpoint:>18} {elapsed:>6.1f} s {len(ok) / elapsed:>7.1f} "
+                              f"{percentile(ok, 50):>6.2f}s {percentile(ok, 99):>6.2f}s "
+                              f"{args.concurrency - len(ok):>7}")
+        stub.close()
+
+    asyncio.run(run())
+
+
+def bench_admission(df: pd.DataFrame, args):
+    """Overload /api/query against a capacity-limited stub LLM with and without admission control"""
+    import asyncio
+    import tempfile
+
+    capacity = args.llm_capacity
+    scenarios = {
+        'no admission control': {'ADMISSION_CONTROL': 'False'},
+        'slots + bounded queue': {'ADMISSION_CONTROL': 'True', 'RATE_LIMIT': 0,
+                                  'QUERY_CONCURRENCY': capacity, 'QUERY_QUEUE': capacity,
+                                  'ADMISSION_QUEUE_TIMEOUT': 2 * args.llm_delay},
+        'per-client rate limit': {'ADMISSION_CONTROL': 'True', 'RATE_LIMIT': 10, 'RATE_LIMIT_BURST': 50},
+    }
+
+    async def run():
+        stub = await serve_stub_llm(args.llm_delay, capacity)
+        print(f"{args.concurrency} concurrent queries on one uvicorn worker; stub LLM serves {capacity} "
+              f"at a time in {args.llm_delay:.1f} s")
+        print(f"{'scenario':>24} {'200':>6} {'429':>6} {'503':>6} {'p50 ok':>8} {'p99 ok':>8} {'p99 all':>8}")
+        command = SERVERS['asgi (uvicorn 2 workers)'][:-4] + ['--log-level', 'warning']
+        with tempfile.TemporaryDirectory() as workdir:
+            for name, overrides in scenarios.items():
+                env = serving_env(df.iloc[:args.kb_rows], workdir, stub.sockets[0].getsockname()[1], **overrides)
+                async with running_server(command, env) as port:
+                    paths = [f"/api/query?q=what+happened+in+block+{i % 50 + 1}" for i in range(args.concurrency)]
+                    _, results = await http_load(port, paths)
+                statuses = [status for status, _ in results]
+                ok = [latency for status, latency in results if status == 200]
+                print(f"{name:>24} {statuses.count(200):>6} {statuses.count(429):>6} {statuses.count(503):>6} "
+                      f"{percentile(ok, 50):>7.2f}s {percentile(ok, 99):>7.2f}s "
+                      f"{percentile([latency for _, latency in results], 99):>7.2f}s")
+        stub.close()
+
+    asyncio.run(run())
+
+
+def bench_reload(df: pd.DataFrame, args):
+    """Latency and errors under steady load while the data file is replaced and hot-reloaded"""
+    import asyncio
+    import tempfile
+
+    async def run():
+        with tempfile.TemporaryDirectory() as workdir:
+            data_file = write_chain_csv(df.iloc[:args.kb_rows], os.path.join(workdir, 'chain.csv'))
+            env = dict(os.environ, DATA_FILE=data_file, DATA_WATCH_INTERVAL='0.5', RATE_LIMIT='0', OPENAI_API_KEY='')
+            async with running_server(SERVERS['asgi (uvicorn 2 workers)'], env) as port:
+                samples = []
+                stop = asyncio.Event()
+
+                async def client(i):
+                    while not stop.is_set():
+                        path = f"/api/query?q=what+happened+in+block+{i % 50 + 1}" if i % 2 else '/api/stats'
+                        headers = {}
+                        started = time.perf_counter()
+                        try:
+                            status = await http_get(port, path, headers)
+                        except OSError:
+                            status = 0
+                        samples.append((started, status, time.perf_counter() - started,
+                                        headers.get('x-data-version')))
+
+                clients = [asyncio.create_task(client(i)) for i in range(args.reload_clients)]
+                await asyncio.sleep(args.reload_phase)
+                old_versions = {version for _, _, _, version in samples}
+                swap_started = time.perf_counter()
+                # Each worker notices the new file on its own and swaps when its build is done
+                write_chain_csv(df.iloc[args.kb_rows:2 * args.kb_rows], data_file + '.new')
+                os.replace(data_file + '.new', data_file)
+                while True:
+                    await asyncio.sleep(0.2)
+                    recent = [sample for sample in samples if sample[0] > time.perf_counter() - 1.0]
+                    if recent and not {version for _, _, _, version in recent} & old_versions:
+                        break
+                swap_finished = time.perf_counter()
+                await asyncio.sleep(args.reload_phase)
+                stop.set()
+                await asyncio.gather(*clients)
+
+        print(f"{args.reload_clients} closed-loop clients (/api/query and /api/stats), 2 uvicorn workers, "
+              f"{args.kb_rows:,} -> {args.kb_rows:,} rows")
+        print(f"{'phase':>16} {'requests':>9} {'errors':>7} {'p50':>8} {'p99':>8} {'max':>8}  versions")
+        phases = {
+            'before reload': lambda t: t < swap_started,
+            'during reload': lambda t: swap_started <= t < swap_finished,
+            'after reload': lambda t: t >= swap_finished,
+        }
+        for name, in_phase in phases.items():
+            phase = [sample for sample in samples if in_phase(sample[0])]
+            latencies = [latency for _, status, latency, _ in phase if status == 200]
+            print(f"{name:>16} {len(phase):>9} {sum(1 for _, status, _, _ in phase if status != 200):>7} "
+                  f"{percentile(latencies, 50) * 1000:>6.1f}ms {percentile(latencies, 99) * 1000:>6.1f}ms "
+                  f"{max(latencies, default=float('nan')) * 1000:>6.1f}ms  "
+                  f"{','.join(sorted({version for _, _, _, version in phase if version}))}")
+        print(f"Swap completed in both workers {swap_finished - swap_started:.1f} s after the file was replaced")
+
+    asyncio.run(run())
+
+
+def plant_anomalies(df: pd.DataFrame, seed: int = 5):
+    """Add known anomalies to a synthetic chain; returns (frame, planted) with planted[kind] = set of keys"""
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    senders = df['sender'].value_counts()
+    addresses = senders.index.to_numpy()
+    planted = {}
+    # Amount outliers: 100 transfers of active senders become ~e^12 times larger
+    active = df.index[df['sender'].isin(senders.index[senders >= 50])]
+    rows = rng.choice(active, 100, replace=False)
+    df.loc[rows, 'amount'] *= np.exp(12)
+    planted['amount_outlier'] = set(df.loc[rows, 'transaction_id'])
+
+    extra = []
+
+    def add(template, sender, receiver, amount, ts):
+        # Planted transfers copy the block fields of an existing transaction
+        row = df.loc[template].to_dict()
+        row.update(sender=sender, receiver=receiver, amount=round(float(amount), 2),
+                   transaction_timestamp=ts, transaction_id=f"planted{len(extra):058x}")
+        extra.append(row)
+
+    def anchor():
+        template = rng.integers(len(df))
+        return template, df['transaction_timestamp'].iloc[template]
+
+    # Bursts: 20 moderately active addresses send 30 transfers within 10 minutes
+    quiet = addresses[200:2000]
+    planted['burst'] = set(rng.choice(quiet, 20, replace=False))
+    for address in planted['burst']:
+        template, ts = anchor()
+        for k in range(30):
+            add(template, address, rng.choice(addresses), rng.lognormal(4, 2), ts + pd.Timedelta(seconds=20 * k))
+    # Round trips: A sends to B, B sends 97% back three hours later
+    planted['round_trip'] = set()
+    for _ in range(50):
+        a, b = rng.choice(addresses, 2, replace=False)
+        template, ts = anchor()
+        amount = rng.lognormal(6, 1)
+        add(template, a, b, amount, ts)
+        add(template, b, a, amount * 0.97, ts + pd.Timedelta(hours=3))
+        planted['round_trip'].add((a, b))
+    # Fan-out / fan-in: 40 distinct counterparties inside one hour
+    for kind in ('fan_out', 'fan_in'):
+        planted[kind] = set(rng.choice(quiet, 20, replace=False))
+        for address in planted[kind]:
+            template, ts = anchor()
+            ts = ts.floor('h')
+            for other in rng.choice(addresses, 40, replace=False):
+                pair = (address, other) if kind == 'fan_out' else (other, address)
+                add(template, *pair, rng.lognormal(4, 2), ts + pd.Timedelta(seconds=int(rng.integers(3600))))
+    df = pd.concat([df, pd.DataFrame(extra)], ignore_index=True)
+    return df.sort_values(['index', 'transaction_timestamp'], ignore_index=True), planted
+
+
+def bench_anomalies(df: pd.DataFrame, args):
+    """Full and incremental anomaly detection throughput, with recall of planted anomalies"""
+    from anomalies import KINDS, AnomalyDetector
+
+    df, planted = plant_anomalies(df)
+    df = df.sort_values('transaction_timestamp', kind='stable', ignore_index=True)
+    build_time, detector = timed(AnomalyDetector.from_frame, df, repeat=1)
+    findings = detector.findings
+    print(f"{len(df):,} transactions: full detection {build_time:.2f} s ({len(df) / build_time:,.0f} rows/s)")
+
+    def found(kind):
+        hits = findings[findings['kind'] == kind]
+        if kind == 'amount_outlier':
+            return set(detector.transaction_ids[hits['row']])
+        if kind == 'round_trip':
+            return set(zip(detector.addresses[hits['address']], detector.addresses[hits['counterparty']]))
+        return set(detector.addresses[hits['address']])
+
+    print(f"{'kind':>16} {'findings':>9} {'planted':>8} {'recall':>7}")
+    for kind in KINDS:
+        print(f"{kind:>16} {detector.counts()[kind]:>9,} {len(planted[kind]):>8} "
+              f"{len(planted[kind] & found(kind)) / len(planted[kind]):>7.0%}")
+
+    # Incremental: detect on 90% of the chain, then append the rest in batches
+    split = int(len(df) * 0.9)
+    incremental = AnomalyDetector.from_frame(df.iloc[:split])
+    started = time.perf_counter()
+    for start in range(split, len(df), args.append_rows):
+        incremental.update(df.iloc[start:start + args.append_rows])
+    append_time = time.perf_counter() - started
+
+    full_keys = detector.finding_keys()
+    matching = len(incremental.finding_keys() & full_keys) / max(len(full_keys), 1)
+    print(f"Appending {len(df) - split:,} rows in batches of {args.append_rows:,}: {append_time:.2f} s "
+          f"({(len(df) - split) / append_time:,.0f} rows/s); {matching:.1%} of findings match the full run")
+    query_time, _ = timed(lambda: [detector.query(kind, limit=20) for kind in KINDS], repeat=5)
+    address = detector.addresses[findings['address'].iloc[0]]
+    address_time, _ = timed(detector.query, None, address, repeat=5)
+    print(f"Query: {query_time / len(KINDS) * 1000:.2f} ms top-20 per type, {address_time * 1000:.2f} ms per address")
+
+
+def bench_export(df: pd.DataFrame, args):
+    """Rows per second and peak memory of /api/export formats versus paging /api/transactions"""
+    import tracemalloc
+    from types import SimpleNamespace
+    from flask import Flask
+    from admission import AdmissionController
+    from app import bp
+
+    # Data-only app state: the export and paging routes need no query engines
+    app = Flask(__name__)
+    app.config['MAX_PAGE_SIZE'] = 1000
+    from repository import PandasRepository
+    dataset = SimpleNamespace(blockchain_data=df, repository=PandasRepository(df), version='bench')
+    app.extensions['chain_explorer'] = SimpleNamespace(
+        pin=lambda: dataset, unpin=lambda pinned: None, admission=AdmissionController(enabled=False)
+    )
+    app.register_blueprint(bp)
+    client = app.test_client()
+
+    def paging():
+        size, page = 0, 1
+        while True:
+            response = client.get(f'/api/transactions?page={page}&per_page=1000')
+            size += len(response.data)
+            if page >= response.get_json()['total_pages']:
+                return size
+            page += 1
+
+    def export(fmt):
+        def run():
+            response = client.get(f'/api/export?format={fmt}', buffered=False)
+            size = sum(len(chunk) for chunk in response.response)
+            response.close()
+            return size
+        return run
+
+    methods = {'paging (1000/page)': paging}
+    methods.update({f'export {fmt}': export(fmt) for fmt in ('csv', 'ndjson', 'arrow', 'parquet')})
+    print(f"{len(df):,} rows")
+    print(f"{'method':>20} {'time':>8} {'rows/s':>11} {'output':>9} {'peak traced':>12}")
+    for name, method in methods.items():
+        try:
+            started = time.perf_counter()
+            size = method()
+            elapsed = time.perf_counter() - started
+        except Exception as e:
+            print(f"{name:>20} unavailable ({e})")
+            continue
+        tracemalloc.start()
+        method()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:>20} {elapsed:>6.2f} s {len(df) / elapsed:>11,.0f} {size / 2**20:>6.0f} MB "
+              f"{peak / 2**20:>9.0f} MB")
+
+
+def bench_repository(df: pd.DataFrame, args):
+    """Pandas vs. SQLite transaction store: build, paging with filters, point lookups and aggregates"""
+    import tempfile
+    from repository import PandasRepository, SQLiteRepository, frame_fingerprint
+
+    directory = tempfile.mkdtemp(prefix='transaction_store_')
+    fingerprint_time, _ = timed(frame_fingerprint, df, repeat=1)
+    build_time, store = timed(SQLiteRepository.open_or_build, df, directory=directory, repeat=1)
+    open_time, _ = timed(SQLiteRepository, store.path, repeat=1)
+    print(f"{len(df):,} rows: frame {df.memory_usage(deep=True).sum() / 2**20:,.0f} MB in memory, "
+          f"store {os.path.getsize(store.path) / 2**20:,.0f} MB on disk")
+    print(f"SQLite build {build_time:.2f} s (fingerprint {fingerprint_time:.2f} s), "
+          f"opening the built store {open_time * 1000:.1f} ms")
+
+    pandas_repo = PandasRepository(df)
+    sender = df['sender'].value_counts().index[len(df['sender'].unique()) // 2]
+    block = int(df['index'].iloc[len(df) // 2])
+    lookups = {
+        'page 1 (no filter)': lambda repo: repo.page({}, 0, 50),
+        'page 1000 (no filter)': lambda repo: repo.page({}, 999 * 50, 50),
+        'page by sender': lambda repo: repo.page({'sender': sender}, 0, 50),
+        'page by block': lambda repo: repo.page({'block': block}, 0, 50),
+        'page amount range': lambda repo: repo.page({'min_amount': 1000, 'max_amount': 1100}, 0, 50),
+        'block lookup': lambda repo: repo.block_transactions(block),
+        'address lookup': lambda repo: repo.address_transactions(sender),
+    }
+    print(f"{'operation':>24} {'pandas':>10} {'sqlite':>10} {'speedup':>8}")
+    for name, lookup in lookups.items():
+        pandas_time, expected = timed(lookup, pandas_repo)
+        sqlite_time, result = timed(lookup, store)
+        if isinstance(expected, tuple):
+            assert expected[0] == result[0], name
+            expected, result = expected[1], result[1]
+        assert expected.reset_index(drop=True).equals(result), name
+        print(f"{name:>24} {pandas_time * 1000:8.1f}ms {sqlite_time * 1000:8.1f}ms {pandas_time / sqlite_time:7.1f}x")
+
+    # Aggregates: the first SQLite call runs the query, later workers read the stored result
+    aggregates = {
+        'stats': lambda repo: repo.stats(),
+        'volume over time': lambda repo: repo.volume_over_time(),
+        'top senders': lambda repo: repo.top_addresses('sender'),
+        'block distribution': lambda repo: repo.block_distribution(),
+        'transaction timeline': lambda repo: repo.transaction_timeline(),
+        'network stats': lambda repo: repo.network_stats(),
+    }
+    print(f"{'aggregate':>24} {'pandas':>10} {'sqlite':>10} {'stored':>10}")
+    for name, aggregate in aggregates.items():
+        pandas_time, _ = timed(aggregate, pandas_repo, repeat=1)
+        sqlite_time, _ = timed(aggregate, store, repeat=1)
+        stored_time, _ = timed(lambda: aggregate(SQLiteRepository(store.path)), repeat=1)
+        print(f"{name:>24} {pandas_time * 1000:8.1f}ms {sqlite_time * 1000:8.1f}ms {stored_time * 1000:8.1f}ms")
+    store.close()
+    os.remove(store.path)
+    os.rmdir(directory)
+
+
+def bench_batch(df: pd.DataFrame, args):
+    """Sequential RAGSystem.query() vs. query_batch(), without and with a (stub) LLM"""
+    import asyncio
+    import threading
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    stub = asyncio.run_coroutine_threadsafe(serve_stub_llm(args.llm_delay), loop).result()
+    # Point the OpenAI client at the stub before rag_system reads the environment
+    os.environ.update(OPENAI_API_KEY='stub', OPENAI_BASE_URL=f'http://127.0.0.1:{stub.sockets[0].getsockname()[1]}/v1')
+    import rag_system
+    from rag_system import RAGSystem
+
+    rag = RAGSystem(df.iloc[:args.kb_rows])
+    # About a quarter of the batch repeats an earlier question
+    distinct = max(1, args.batch_size * 3 // 4)
+    queries = [f"What happened in block {i % distinct + 1}?" for i in range(args.batch_size)]
+    print(f"{len(queries)} queries ({distinct} distinct), stub LLM latency {args.llm_delay:.1f} s")
+    print(f"{'generation':>12} {'sequential':>11} {'batch':>9} {'speedup':>8}")
+    for generation, llm in (('template', False), ('llm', True)):
+        rag_system.OPENAI_AVAILABLE = llm
+        repeat = 1 if llm else 3
+        sequential, answers = timed(lambda: [rag.query(q) for q in queries], repeat=repeat)
+        batch, result = timed(rag.query_batch, queries, repeat=repeat)
+        assert [a['response'] for a in answers] == [r['response'] for r in result['results']]
+        print(f"{generation:>12} {sequential:10.3f}s {batch:8.3f}s {sequential / batch:7.1f}x")
+    loop.call_soon_threadsafe(stub.close)
+
+
+BENCHMARKS = {
+    'anomalies': bench_anomalies,
+    'batch': bench_batch,
+    'embedders': bench_embedders,
+    'export': bench_export,
+    'admission': bench_admission,
+    'hierarchy': bench_hierarchy,
+    'parallel': bench_parallel,
+    'quantization': bench_quantization,
+    'reload': bench_reload,
+    'repository': bench_repository,
+    'retrieval': bench_retrieval,
+    'serving': bench_serving,
+    'sketches': bench_sketches,
+    'startup': bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--rows', type=int, default=1_000_000, help='synthetic transactions to generate')
+    parser.add_argument('--bucket', default='W', help='time bucket for sketch partitions')
+    parser.add_argument('--kb-rows', type=int, default=100_000, help='rows used for the knowledge-base build')
+    parser.add_argument('--vectors', type=int, default=200_000, help='embeddings for the quantization benchmark')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET, help='seconds allowed for import app')
+    parser.add_argument('--ready-budget', type=float, default=READY_BUDGET, help='seconds allowed for import + create_app')
+    parser.add_argument('--concurrency', type=int, default=200, help='simultaneous queries for the serving benchmark')
+    parser.add_argument('--llm-capacity', type=int, default=16, help='completions the stub LLM runs at once')
+    parser.add_argument('--llm-delay', type=float, default=2.0, help='stub LLM response time in seconds')
+    parser.add_argument('--reload-clients', type=int, default=16, help='concurrent clients for the reload benchmark')
+    parser.add_argument('--reload-phase', type=float, default=5.0, help='seconds of load before and after a reload')
+    parser.add_argument('--append-rows', type=int, default=10_000, help='rows per append for incremental anomaly detection')
+    parser.add_argument('--batch-size', type=int, default=32, help='queries per batch for the batch benchmark')
+    args = parser.parse_args()
+
+    print(f"📊 Generating synthetic chain with {args.rows:,} transactions...")
+    df = make_synthetic_chain(args.rows)
+    print("-" * 50)
+    BENCHMARKS[args.benchmark](df, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Embedding backends for the RAG system
+SentenceTransformer (torch), ONNX Runtime int8 MiniLM and a zero-dependency
+hashing vectorizer behind one encode() interface
+
+Export the ONNX model once with: python embedders.py export models/minilm-int8
+"""
+
+import abc
+import argparse
+import importlib.util
+import os
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+from retrieval import tokenize
+
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+
+
+class Embedder(abc.ABC):
+    """Sentence embedding backend (mirrors SentenceTransformer.encode)"""
+
+    name = 'base'
+
+    @abc.abstractmethod
+    def encode(self, texts: List[str], show_progress_bar: bool = False, batch_size: int = 32) -> np.ndarray:
+        """Embeddings of texts, one row per text"""
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """The original torch-based sentence-transformers model"""
+
+    name = 'sentence-transformers'
+
+    def __init__(self, model_name: str = DEFAULT_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.name = f'sentence-transformers:{model_name}'
+
+    def encode(self, texts: List[str], show_progress_bar: bool = False, batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(texts, show_progress_bar=show_progress_bar, batch_size=batch_size)
+
+
+class OnnxEmbedder(Embedder):
+    """int8-quantized MiniLM on ONNX Runtime with mean pooling (no torch needed)"""
+
+    name = 'onnx'
+
+    def __init__(self, model_dir: str, max_length: int = 256):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token='[PAD]')
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv('ONNX_THREADS', '1'))
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, 'model_int8.onnx'), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.name = f'onnx:{os.path.basename(os.path.normpath(model_dir))}'
+
+    def encode(self, texts: List[str], show_progress_bar: bool = False, batch_size: int = 32) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            feeds = {
+                'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+                'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            tokens = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            # Mean pooling over real tokens, then L2 normalization (as the MiniLM pipeline does)
+            mask = feeds['attention_mask'][:, :, None].astype(np.float32)
+            pooled = (tokens * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            batches.append(pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12))
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(batches).astype(np.float32)
+
+
+class HashingEmbedder(Embedder):
+    """Signed feature hashing of unigrams and bigrams with sublinear TF weighting"""
+
+    name = 'hashing'
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self.name = f'hashing:{dimension}'
+
+    def _features(self, text: str) -> List[str]:
+        tokens = tokenize(text)
+        return tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+    def encode(self, texts: List[str], show_progress_bar: bool = False, batch_size: int = 32) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in self._features(text):
+                counts[feature] = counts.get(feature, 0) + 1
+            for feature, count in counts.items():
+                digest = zlib.crc32(feature.encode('utf-8'))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dimension] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+BACKENDS = ('auto', 'sentence-transformers', 'onnx', 'hashing', 'none')
+
+
+def create_embedder(backend: str = None) -> Optional[Embedder]:
+    """Embedder selected by EMBEDDING_BACKEND; None means keyword-only retrieval
+
+    'auto' keeps the original behaviour: sentence-transformers when installed.
+    """
+    backend = (backend or os.getenv('EMBEDDING_BACKEND', 'auto')).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'")
+    if backend == 'auto':
+        backend = 'sentence-transformers' if importlib.util.find_spec('sentence_transformers') else 'none'
+    if backend == 'sentence-transformers':
+        return SentenceTransformerEmbedder(os.getenv('EMBEDDING_MODEL', DEFAULT_MODEL))
+    if backend == 'onnx':
+        return OnnxEmbedder(os.getenv('ONNX_MODEL_DIR', 'models/minilm-int8'))
+    if backend == 'hashing':
+        return HashingEmbedder(int(os.getenv('HASHING_DIMENSION', '384')))
+    return None
+
+
+def export_onnx_model(output_dir: str, model_name: str = f'sentence-transformers/{DEFAULT_MODEL}'):
+    """Export MiniLM to ONNX and quantize its weights to int8 (needs torch and transformers once)"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(['export sample'], return_tensors='pt')
+    names = ['input_ids', 'attention_mask', 'token_type_ids']
+    float_path = os.path.join(output_dir, 'model.onnx')
+    torch.onnx.export(
+        model, tuple(sample[name] for name in names), float_path,
+        input_names=names, output_names=['last_hidden_state'],
+        dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in names + ['last_hidden_state']},
+        opset_version=14
+    )
+    quantize_dynamic(float_path, os.path.join(output_dir, 'model_int8.onnx'), weight_type=QuantType.QInt8)
+    os.remove(float_path)
+    print(f"✓ Exported int8 ONNX model to {output_dir}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Embedding backend utilities')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help='export the int8 ONNX MiniLM model')
+    export.add_argument('output_dir')
+    export.add_argument('--model', default=f'sentence-transformers/{DEFAULT_MODEL}')
+    args = parser.parse_args()
+    export_onnx_model(args.output_dir, args.model)
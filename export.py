@@ -0,0 +1,177 @@
+"""
+Streaming bulk export of transactions
+Filters are applied one column slice at a time and each slice is encoded as CSV,
+NDJSON, Arrow IPC or a Parquet row group, so memory stays constant however many
+rows are exported
+"""
+
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Rows per slice: one Parquet row group / Arrow record batch, or one block of CSV/NDJSON text
+# (text encoders hold several copies of a slice, so their slices are smaller)
+EXPORT_CHUNK_ROWS = 50000
+TEXT_CHUNK_ROWS = 10000
+
+# Export format -> content type
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    """Invalid export request (bad filter value, format or column)"""
+
+
+def parse_filters(args) -> Dict:
+    """Transaction filters from request args (block, sender, receiver, min_amount, max_amount)"""
+    filters = {}
+    try:
+        if args.get('block'):
+            filters['block'] = int(args['block'])
+        for key in ('min_amount', 'max_amount'):
+            if args.get(key):
+                filters[key] = float(args[key])
+    except ValueError as e:
+        raise ExportError(f"Invalid filter value: {e}")
+    for key in ('sender', 'receiver'):
+        if args.get(key):
+            filters[key] = args[key].strip()
+    return filters
+
+
+def filter_mask(df: pd.DataFrame, filters: Dict) -> Optional[np.ndarray]:
+    """Boolean row mask for the filters, or None when nothing is filtered"""
+    mask = None
+
+    def both(condition):
+        return condition if mask is None else mask & condition
+
+    if 'block' in filters:
+        mask = both(df['index'].to_numpy() == filters['block'])
+    if 'sender' in filters:
+        mask = both(df['sender'].to_numpy() == filters['sender'])
+    if 'receiver' in filters:
+        mask = both(df['receiver'].to_numpy() == filters['receiver'])
+    if 'min_amount' in filters:
+        mask = both(df['amount'].to_numpy() >= filters['min_amount'])
+    if 'max_amount' in filters:
+        mask = both(df['amount'].to_numpy() <= filters['max_amount'])
+    return mask
+
+
+def filtered_slices(df: pd.DataFrame, filters: Dict, columns: Optional[List[str]] = None,
+                    chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Matching rows as a sequence of DataFrame slices of at most chunk_rows source rows"""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        mask = filter_mask(chunk, filters)
+        if mask is not None:
+            chunk = chunk[mask]
+        if columns:
+            chunk = chunk[columns]
+        if len(chunk):
+            yield chunk
+
+
+def iter_csv(slices: Iterator[pd.DataFrame], columns: List[str]) -> Iterator[str]:
+    yield ','.join(columns) + '\n'
+    for chunk in slices:
+        yield chunk.to_csv(index=False, header=False)
+
+
+def iter_ndjson(slices: Iterator[pd.DataFrame]) -> Iterator[str]:
+    for chunk in slices:
+        lines = chunk.to_json(orient='records', lines=True, date_format='iso', date_unit='ns')
+        yield lines if lines.endswith('\n') else lines + '\n'
+
+
+class _Buffer:
+    """Write-only file object whose contents are drained after every batch"""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _arrow_writer(kind: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError(f"{kind} export requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+def iter_arrow(slices: Iterator[pd.DataFrame], empty: pd.DataFrame, kind: str = 'arrow') -> Iterator[bytes]:
+    """Arrow IPC stream (one record batch per slice) or Parquet (one row group per slice)"""
+    pa, pq = _arrow_writer(kind)
+    sink = _Buffer()
+
+    def open_writer(schema):
+        return pq.ParquetWriter(sink, schema) if kind == 'parquet' else pa.ipc.new_stream(sink, schema)
+
+    writer = None
+    try:
+        for chunk in slices:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = open_writer(table.schema)
+            writer.write_table(table)
+            yield sink.drain()
+        if writer is None:
+            # No matching rows: still a valid file, with the columns and no rows
+            writer = open_writer(pa.Schema.from_pandas(empty, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+def stream_export(repository, fmt: str, filters: Dict, columns: Optional[List[str]] = None,
+                  chunk_rows: int = None) -> Iterator:
+    """Encoded chunks of the filtered transactions in the requested format
+
+    repository is a repository.TransactionRepository; slices come from its slices().
+    Raises ExportError before anything is streamed when the request is invalid.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown export format '{fmt}' (expected one of: {', '.join(FORMATS)})")
+    if fmt in ('arrow', 'parquet'):
+        _arrow_writer(fmt)
+    columns = columns or list(repository.columns)
+    unknown = [column for column in columns if column not in repository.columns]
+    if unknown:
+        raise ExportError(f"Unknown column(s): {', '.join(unknown)}")
+    if chunk_rows is None:
+        chunk_rows = TEXT_CHUNK_ROWS if fmt in ('csv', 'ndjson') else EXPORT_CHUNK_ROWS
+    slices = repository.slices(filters, columns, chunk_rows)
+    if fmt == 'csv':
+        return iter_csv(slices, columns)
+    if fmt == 'ndjson':
+        return iter_ndjson(slices)
+    return iter_arrow(slices, repository.schema(columns), fmt)
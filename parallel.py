@@ -0,0 +1,358 @@
+"""
+Parallel analytics execution for large blockchain datasets
+Partitions the transaction table by block range, runs aggregate kernels over a
+process pool against shared-memory columns and merges the partial results
+"""
+
+import atexit
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+
+def configured_workers() -> int:
+    """Number of analytics worker processes (ANALYTICS_WORKERS, 1 = run inline)"""
+    workers = os.getenv('ANALYTICS_WORKERS', '1').strip().lower()
+    if workers in ('auto', '0'):
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def configured_min_rows() -> int:
+    """Datasets smaller than this are aggregated inline (PARALLEL_MIN_ROWS)"""
+    return int(os.getenv('PARALLEL_MIN_ROWS', '200000'))
+
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+
+
+def _start_method() -> str:
+    default = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    return os.getenv('PARALLEL_START_METHOD', default)
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared process pool per worker count, started eagerly
+
+    Pools are created by create_app(), before the server starts its
+    request threads, so forked workers never inherit locks held by other threads.
+    """
+    if workers not in _pools:
+        # Workers must inherit the parent's resource tracker: a worker forked before it exists
+        # starts its own, which reports the segments it attached to as leaked and unlinks them
+        resource_tracker.ensure_running()
+        pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(_start_method())
+        )
+        pool.submit(os.getpid).result()
+        _pools[workers] = pool
+    return _pools[workers]
+
+
+@atexit.register
+def shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+    _pools.clear()
+
+
+def block_partitions(block_index: np.ndarray, partitions: int) -> List[Tuple[int, int]]:
+    """Split rows sorted by block index into contiguous, block-aligned row ranges"""
+    rows = len(block_index)
+    if rows == 0:
+        return []
+    partitions = max(1, min(partitions, rows))
+    cuts = [0]
+    for i in range(1, partitions):
+        # Move each cut to the start of the block it lands in so no block is split
+        cut = int(np.searchsorted(block_index, block_index[rows * i // partitions], side='left'))
+        if cut > cuts[-1]:
+            cuts.append(cut)
+    cuts.append(rows)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+class SharedColumns:
+    """Numeric transaction columns copied once into shared memory, sorted by block"""
+
+    def __init__(self, df: pd.DataFrame):
+        order = np.argsort(df['index'].to_numpy(), kind='stable')
+        # Senders and receivers share one code space so address sets can be unioned
+        codes, self.addresses = pd.factorize(
+            np.concatenate([df['sender'].to_numpy()[order], df['receiver'].to_numpy()[order]])
+        )
+        rows = len(df)
+        columns = {
+            'index': df['index'].to_numpy(dtype=np.int64)[order],
+            'amount': df['amount'].to_numpy(dtype=np.float64)[order],
+            'timestamp': df['transaction_timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)[order],
+            'sender': codes[:rows].astype(np.int64),
+            'receiver': codes[rows:].astype(np.int64),
+        }
+        # Alphabetical rank of each address code, used to break ties like the pandas path
+        self.address_rank = np.argsort(np.argsort(np.asarray(self.addresses, dtype=object), kind='stable'))
+        self.rows = rows
+        self.segments, self.spec = _share(columns)
+        self.block_index = self.column('index')
+        self._finalizer = weakref.finalize(self, _release_segments, list(self.segments.values()))
+
+    def column(self, name: str) -> np.ndarray:
+        _, dtype, length = self.spec[name]
+        return np.ndarray((length,), dtype=np.dtype(dtype), buffer=self.segments[name].buf)
+
+    def close(self):
+        """Release and unlink the shared segments"""
+        self.block_index = None
+        self.segments = {}
+        self._finalizer()
+
+
+class SharedFrame:
+    """Every column of a frame copied into shared memory, sorted by block
+
+    Text columns are stored as fixed-width UTF-8 bytes; workers rebuild a frame for
+    their row range with frame() instead of unpickling a slice sent with the task.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.sort_values('index', kind='stable')
+        columns = {}
+        self.text: List[str] = []
+        for name in df.columns:
+            values = df[name].to_numpy()
+            if values.dtype == object:
+                values = np.char.encode(values.astype(str), 'utf-8')
+                self.text.append(name)
+            columns[name] = values
+        self.rows = len(df)
+        self.segments, self.spec = _share(columns)
+        self.partition_index = columns['index']
+        self._finalizer = weakref.finalize(self, _release_segments, list(self.segments.values()))
+
+    def close(self):
+        self.partition_index = None
+        self.segments = {}
+        self._finalizer()
+
+
+def _share(columns: Dict[str, np.ndarray]):
+    """Copy arrays into new shared-memory segments; returns (segments, spec) keyed by column"""
+    segments: Dict[str, shared_memory.SharedMemory] = {}
+    spec: Dict[str, Tuple[str, str, int]] = {}
+    for name, values in columns.items():
+        segment = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)[:] = values
+        segments[name] = segment
+        spec[name] = (segment.name, values.dtype.str, len(values))
+    return segments, spec
+
+
+def _release_segments(segments: List[shared_memory.SharedMemory]):
+    for segment in segments:
+        segment.close()
+        segment.unlink()
+
+
+# Worker side --------------------------------------------------------------
+
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach(spec: Dict[str, Tuple[str, str, int]], start: int, stop: int) -> Dict[str, np.ndarray]:
+    # Segments of retired dataset versions are unlinked by the parent; unmap them here too
+    current = {segment_name for segment_name, _, _ in spec.values()}
+    for segment_name in [name for name in _attached if name not in current]:
+        try:
+            _attached.pop(segment_name).close()
+        except BufferError:
+            pass
+    columns = {}
+    for name, (segment_name, dtype, length) in spec.items():
+        segment = _attached.get(segment_name)
+        if segment is None:
+            # Workers share the parent's resource tracker (see get_pool), which owns the segment
+            segment = shared_memory.SharedMemory(name=segment_name)
+            _attached[segment_name] = segment
+        columns[name] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=segment.buf)[start:stop]
+    return columns
+
+
+def _kernel_volume_by_day(cols, n_addresses):
+    days, inverse = np.unique(cols['timestamp'] // NS_PER_DAY, return_inverse=True)
+    return days, np.bincount(inverse, weights=cols['amount'])
+
+
+def _kernel_address_totals(cols, n_addresses):
+    return {
+        'sender_volume': np.bincount(cols['sender'], weights=cols['amount'], minlength=n_addresses),
+        'receiver_volume': np.bincount(cols['receiver'], weights=cols['amount'], minlength=n_addresses),
+        'sender_count': np.bincount(cols['sender'], minlength=n_addresses),
+        'receiver_count': np.bincount(cols['receiver'], minlength=n_addresses),
+    }
+
+
+def _kernel_block_counts(cols, n_addresses):
+    return np.unique(cols['index'], return_counts=True)
+
+
+def _kernel_hourly_counts(cols, n_addresses):
+    return np.bincount((cols['timestamp'] // NS_PER_HOUR) % 24, minlength=24)
+
+
+KERNELS: Dict[str, Callable] = {
+    'volume_by_day': _kernel_volume_by_day,
+    'address_totals': _kernel_address_totals,
+    'block_counts': _kernel_block_counts,
+    'hourly_counts': _kernel_hourly_counts,
+}
+
+
+def run_kernel(kernel: str, spec, start: int, stop: int, n_addresses: int):
+    """Entry point executed in a worker process for one block range"""
+    return KERNELS[kernel](_attach(spec, start, stop), n_addresses)
+
+
+def run_on_frame(func: Callable, spec, text: List[str], start: int, stop: int):
+    """Entry point for map_frame_partitions: func over one block range of a SharedFrame"""
+    columns = _attach(spec, start, stop)
+    return func(pd.DataFrame({
+        name: np.char.decode(values, 'utf-8') if name in text else values.copy()
+        for name, values in columns.items()
+    }))
+
+
+# Parent side --------------------------------------------------------------
+
+class AnalyticsEngine:
+    """Runs the /api/analytics/* aggregations over block-range partitions"""
+
+    def __init__(self, df: pd.DataFrame, workers: int = None, min_rows: int = None):
+        self.workers = workers if workers is not None else configured_workers()
+        self.min_rows = min_rows if min_rows is not None else configured_min_rows()
+        self.columns = SharedColumns(df)
+        self.n_addresses = len(self.columns.addresses)
+        self.partitions = block_partitions(self.columns.block_index, self.workers)
+        self._address_totals = None
+        if self.parallel:
+            get_pool(self.workers)
+
+    @property
+    def parallel(self) -> bool:
+        return self.workers > 1 and self.columns.rows >= self.min_rows and len(self.partitions) > 1
+
+    def map(self, kernel: str) -> List:
+        """Run a kernel over every partition and return the partial results"""
+        spec = self.columns.spec
+        if not self.parallel:
+            columns = {name: self.columns.column(name) for name in spec}
+            return [KERNELS[kernel](columns, self.n_addresses)]
+        pool = get_pool(self.workers)
+        futures = [
+            pool.submit(run_kernel, kernel, spec, start, stop, self.n_addresses)
+            for start, stop in self.partitions
+        ]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.columns.close()
+
+    def _totals(self) -> Dict[str, np.ndarray]:
+        # One pass produces every per-address aggregate; cache it for the other endpoints
+        if self._address_totals is None:
+            partials = self.map('address_totals')
+            self._address_totals = {key: sum(part[key] for part in partials) for key in partials[0]}
+        return self._address_totals
+
+    def _top(self, values: np.ndarray, present: np.ndarray, k: int) -> np.ndarray:
+        """Codes of the k largest values among present addresses; ties go to the smaller address"""
+        candidates = np.flatnonzero(present)
+        k = min(k, len(candidates))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        scores = values[candidates]
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = candidates[scores >= threshold]
+        order = np.lexsort((self.columns.address_rank[candidates], -values[candidates]))
+        return candidates[order[:k]]
+
+    def volume_over_time(self) -> Dict:
+        days = {}
+        for part_days, part_volumes in self.map('volume_by_day'):
+            for day, volume in zip(part_days.tolist(), part_volumes.tolist()):
+                days[day] = days.get(day, 0.0) + volume
+        ordered = sorted(days)
+        return {
+            'dates': [str(pd.Timestamp(day * NS_PER_DAY).date()) for day in ordered],
+            'volumes': [days[day] for day in ordered]
+        }
+
+    def top_addresses(self, role: str, k: int = 10) -> Dict:
+        totals = self._totals()
+        volumes = totals[f'{role}_volume']
+        top = self._top(volumes, totals[f'{role}_count'] > 0, k)
+        return {
+            f'{role}s': self.columns.addresses[top].tolist(),
+            'amounts': volumes[top].tolist()
+        }
+
+    def block_distribution(self) -> Dict:
+        # Partitions are block-aligned and ordered, so partials simply concatenate
+        partials = self.map('block_counts')
+        return {
+            'blocks': np.concatenate([blocks for blocks, _ in partials]).tolist(),
+            'transaction_counts': np.concatenate([counts for _, counts in partials]).tolist()
+        }
+
+    def transaction_timeline(self) -> Dict:
+        counts = sum(self.map('hourly_counts'))
+        hours = np.flatnonzero(counts)
+        return {
+            'hours': hours.tolist(),
+            'counts': counts[hours].tolist()
+        }
+
+    def network_stats(self) -> Dict:
+        totals = self._totals()
+        sender_counts, receiver_counts = totals['sender_count'], totals['receiver_count']
+        has_rows = self.columns.rows > 0
+        top_sender = int(self._top(sender_counts, sender_counts > 0, 1)[0]) if has_rows else None
+        top_receiver = int(self._top(receiver_counts, receiver_counts > 0, 1)[0]) if has_rows else None
+        return {
+            'total_unique_addresses': int(np.count_nonzero(sender_counts + receiver_counts)),
+            'most_active_sender': self.columns.addresses[top_sender] if has_rows else None,
+            'most_active_receiver': self.columns.addresses[top_receiver] if has_rows else None,
+            'sender_transaction_count': int(sender_counts[top_sender]) if has_rows else 0,
+            'receiver_transaction_count': int(receiver_counts[top_receiver]) if has_rows else 0
+        }
+
+
+def map_frame_partitions(func: Callable, df: pd.DataFrame, workers: int = None,
+                         min_rows: int = None) -> List:
+    """Apply a picklable func to block-range slices of df, in a process pool when large
+
+    The frame is shared with the workers through shared memory (see SharedFrame); each
+    task only carries its row range.
+    """
+    workers = workers if workers is not None else configured_workers()
+    min_rows = min_rows if min_rows is not None else configured_min_rows()
+    if workers <= 1 or len(df) < min_rows:
+        return [func(df)]
+    frame = SharedFrame(df)
+    try:
+        pool = get_pool(workers)
+        futures = [
+            pool.submit(run_on_frame, func, frame.spec, frame.text, start, stop)
+            for start, stop in block_partitions(frame.partition_index, workers)
+        ]
+        return [future.result() for future in futures]
+    finally:
+        frame.close()
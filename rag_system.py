@@ -3,34 +3,46 @@ RAG (Retrieval Augmented Generation) System for Blockchain Data
 Implements vector embeddings, semantic search, and LLM integration
 """
 
+import asyncio
+import bisect
+import copy
+import hashlib
+import importlib.util
 import os
+import re
+import threading
 import time
 import numpy as np
 import pandas as pd
-from typing import List, Dict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
 from dotenv import load_dotenv
 
+from parallel import map_frame_partitions
+from repository import PandasRepository
+from retrieval import BM25Index, reciprocal_rank_fusion, top_k_scores
+from vector_store import VectorStore, create_vector_store
+from embedders import create_embedder
+
 load_dotenv()
 
-# Try to import vector embeddings library
-try:
-    from sentence_transformers import SentenceTransformer
-    EMBEDDINGS_AVAILABLE = True
-except ImportError:
-    EMBEDDINGS_AVAILABLE = False
+# Embedding backends are imported on demand (see embedders.py); only check availability here
+EMBEDDINGS_AVAILABLE = importlib.util.find_spec('sentence_transformers') is not None
+if not EMBEDDINGS_AVAILABLE:
     print("Warning: sentence-transformers not available. Using fallback embeddings.")
 
-# Try to import OpenAI
+# OpenAI is imported on the first LLM call; only check that it is usable here
 OPENAI_AVAILABLE = False
-try:
-    import openai
-    # Check if API key is available
-    if os.getenv('OPENAI_API_KEY'):
-        OPENAI_AVAILABLE = True
-    else:
-        print("Info: OpenAI API key not found. Using fallback text generation.")
-except ImportError:
+if importlib.util.find_spec('openai') is None:
     print("Info: OpenAI package not installed. Using fallback text generation.")
+elif os.getenv('OPENAI_API_KEY'):
+    OPENAI_AVAILABLE = True
+else:
+    print("Info: OpenAI API key not found. Using fallback text generation.")
+
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+# LLM calls in flight at once for one query_batch()
+LLM_BATCH_CONCURRENCY = int(os.getenv('LLM_BATCH_CONCURRENCY', '8'))
 
 # Performance tracking
 class PerformanceTracker:
@@ -77,14 +89,189 @@ class PerformanceTracker:
         }
 
 
+def create_block_summary(block_data: pd.DataFrame, block_idx: int) -> str:
+    """Convert blockchain log data to natural language summary"""
+    transaction_count = len(block_data)
+    total_amount = block_data['amount'].sum()
+    unique_senders = block_data['sender'].nunique()
+    unique_receivers = block_data['receiver'].nunique()
+    avg_amount = block_data['amount'].mean()
+    
+    # Get timestamps
+    if 'block_timestamp' in block_data.columns and not block_data['block_timestamp'].empty:
+        timestamp = block_data['block_timestamp'].iloc[0]
+        if hasattr(timestamp, 'strftime'):
+            time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            time_str = str(timestamp)
+    else:
+        time_str = "unknown time"
+    
+    summary = (
+        f"Block {block_idx} contains {transaction_count} transaction(s) "
+        f"with a total volume of ${total_amount:,.2f}. "
+        f"The block involves {unique_senders} unique sender(s) and {unique_receivers} unique receiver(s). "
+        f"The average transaction amount is ${avg_amount:,.2f}. "
+        f"This block was created at {time_str}."
+    )
+    
+    # Add top transactions if available
+    if transaction_count > 0:
+        top_transactions = block_data.nlargest(3, 'amount')
+        if len(top_transactions) > 0:
+            summary += " Top transactions include: "
+            for idx, tx in top_transactions.iterrows():
+                summary += (
+                    f"${tx['amount']:,.2f} from {tx['sender'][:8]}... "
+                    f"to {tx['receiver'][:8]}...; "
+                )
+    
+    return summary
+
+
+def build_block_documents(df: pd.DataFrame) -> List[Dict]:
+    """Create one summary document per block (runs in analytics worker processes)"""
+    documents = []
+    for block_idx, block_data in df.groupby('index', sort=False):
+        documents.append({
+            'id': f'block_{block_idx}',
+            'block_index': block_idx,
+            'text': create_block_summary(block_data, block_idx),
+            'data': block_data.to_dict('records'),
+            'window': block_data['block_timestamp'].iloc[0].strftime('%Y-%m-%d')
+        })
+    return documents
+
+
+def build_window_documents(df: pd.DataFrame, freq: str, level: str) -> List[Dict]:
+    """Create one summary document per time window ('D' = daily, 'W' = weekly)"""
+    periods = df['block_timestamp'].dt.to_period(freq)
+    windows = df.groupby(periods).agg(
+        transactions=('amount', 'size'),
+        volume=('amount', 'sum'),
+        senders=('sender', 'nunique'),
+        receivers=('receiver', 'nunique'),
+        blocks=('index', 'nunique'),
+        first_block=('index', 'min'),
+        last_block=('index', 'max')
+    )
+    sender_volume = df.groupby([periods, 'sender'])['amount'].sum()
+    top_senders = sender_volume.loc[sender_volume.groupby(level=0).idxmax()]
+    
+    documents = []
+    for period, row in windows.iterrows():
+        start, end = period.start_time.strftime('%Y-%m-%d'), period.end_time.strftime('%Y-%m-%d')
+        top_sender, top_volume = next(
+            (sender, volume) for (_, sender), volume in top_senders.loc[[period]].items()
+        )
+        span = f"On {start}" if level == 'day' else f"In the week of {start} to {end}"
+        text = (
+            f"{'Daily' if level == 'day' else 'Weekly'} summary. {span} the chain recorded {int(row['transactions'])} transaction(s) "
+            f"across {int(row['blocks'])} block(s) (blocks {int(row['first_block'])} to {int(row['last_block'])}) "
+            f"with a total volume of ${row['volume']:,.2f}. "
+            f"{int(row['senders'])} unique sender(s) and {int(row['receivers'])} unique receiver(s) were active. "
+            f"The largest sender by volume was {top_sender[:8]}... with ${top_volume:,.2f}."
+        )
+        documents.append({
+            'id': f'{level}_{start}',
+            'type': 'window',
+            'level': level,
+            'window': start,
+            'week': pd.Period(period.start_time, 'W').start_time.strftime('%Y-%m-%d'),
+            'text': text
+        })
+    return documents
+
+
+def address_profiles(df: pd.DataFrame) -> pd.DataFrame:
+    """Per-address activity aggregates, indexed by address"""
+    def role_stats(role: str) -> pd.DataFrame:
+        return df.groupby(role).agg(**{
+            f'{role}_count': ('amount', 'size'),
+            f'{role}_volume': ('amount', 'sum'),
+            f'{role}_first_block': ('index', 'min'),
+            f'{role}_last_block': ('index', 'max'),
+            f'{role}_first_seen': ('transaction_timestamp', 'min'),
+            f'{role}_last_seen': ('transaction_timestamp', 'max')
+        })
+    
+    profiles = role_stats('sender').join(role_stats('receiver'), how='outer')
+    edges = pd.concat([
+        df[['sender', 'receiver']].set_axis(['address', 'counterparty'], axis=1),
+        df[['receiver', 'sender']].set_axis(['address', 'counterparty'], axis=1)
+    ])
+    profiles['counterparties'] = edges.drop_duplicates().groupby('address').size()
+    for role in ('sender', 'receiver'):
+        profiles[[f'{role}_count', f'{role}_volume']] = profiles[[f'{role}_count', f'{role}_volume']].fillna(0)
+    profiles['activity'] = profiles['sender_count'] + profiles['receiver_count']
+    return profiles
+
+
+def create_address_profile(address: str, profile: pd.Series) -> Dict:
+    """Convert an address_profiles() row to a profile document"""
+    first_block = min(b for b in (profile['sender_first_block'], profile['receiver_first_block']) if pd.notna(b))
+    last_block = max(b for b in (profile['sender_last_block'], profile['receiver_last_block']) if pd.notna(b))
+    first_seen = min(t for t in (profile['sender_first_seen'], profile['receiver_first_seen']) if pd.notna(t))
+    last_seen = max(t for t in (profile['sender_last_seen'], profile['receiver_last_seen']) if pd.notna(t))
+    text = (
+        f"Address profile for {address}. The address sent {int(profile['sender_count'])} transaction(s) "
+        f"totalling ${profile['sender_volume']:,.2f} and received {int(profile['receiver_count'])} "
+        f"transaction(s) totalling ${profile['receiver_volume']:,.2f}. "
+        f"It was active in blocks {int(first_block)} to {int(last_block)} between "
+        f"{first_seen.strftime('%Y-%m-%d %H:%M:%S')} and {last_seen.strftime('%Y-%m-%d %H:%M:%S')}, "
+        f"interacting with {int(profile['counterparties'])} distinct counterpart address(es)."
+    )
+    return {
+        'id': f'address_{address}',
+        'type': 'address',
+        'level': 'address',
+        'address': address,
+        'text': text
+    }
+
+
+def build_address_documents(df: pd.DataFrame, limit: int) -> List[Dict]:
+    """Profile documents for the most active addresses"""
+    profiles = address_profiles(df).nlargest(limit, 'activity')
+    return [create_address_profile(address, row) for address, row in profiles.iterrows()]
+
+
+# Request threads share the memo caches of a dataset version
+_cache_lock = threading.Lock()
+
+
+def _remember(cache: Dict, key, value, limit: int = 1024):
+    """Bounded memo: drop the oldest entry once the cache is full"""
+    with _cache_lock:
+        if len(cache) >= limit and key not in cache:
+            cache.pop(next(iter(cache)), None)
+        cache[key] = value
+
+
 class RAGSystem:
-    def __init__(self, df: pd.DataFrame):
+    def __init__(self, df: pd.DataFrame, repository=None):
         self.df = df
+        # Point lookups (block summaries, on-demand address profiles) go through the store
+        self.repository = repository if repository is not None else PandasRepository(df)
         self.embeddings_model = None
-        self.document_embeddings = None
+        # Document embeddings (float32, int8 or product-quantized; see EMBEDDING_QUANTIZATION)
+        self.vector_store = None
+        self.embedding_store_path = os.getenv('EMBEDDING_STORE_PATH')
         self.documents = []
+        self.keyword_index = BM25Index()
+        # 'semantic', 'hybrid' (BM25 + cosine with reciprocal rank fusion) or 'bm25'
+        self.retrieval_mode = os.getenv('RETRIEVAL_MODE', 'hybrid').lower()
+        # Coarse-to-fine retrieval over window and address summaries
+        self.hierarchical = os.getenv('HIERARCHICAL_INDEX', 'True').lower() == 'true'
+        self.address_profile_limit = int(os.getenv('ADDRESS_PROFILES', '500'))
+        self.coarse_ids = None
         self.performance_tracker = PerformanceTracker()
         self.user_count = 150  # Track 150+ users
+        self._client = None
+        self._async_client = None
+        # Results of per-address / per-block table scans reused across queries
+        self._profile_cache = {}
+        self._summary_cache = {}
         
         # Initialize embeddings
         self._initialize_embeddings()
@@ -93,34 +280,24 @@ class RAGSystem:
         self._build_knowledge_base()
     
     def _initialize_embeddings(self):
-        """Initialize embedding model"""
-        if EMBEDDINGS_AVAILABLE:
-            try:
-                # Use a lightweight model for faster inference
-                self.embeddings_model = SentenceTransformer('all-MiniLM-L6-v2')
-                print("✓ Loaded sentence-transformers model")
-            except Exception as e:
-                print(f"Warning: Could not load embeddings model: {e}")
-                self.embeddings_model = None
+        """Initialize embedding model (backend chosen by EMBEDDING_BACKEND)"""
+        try:
+            self.embeddings_model = create_embedder()
+        except Exception as e:
+            print(f"Warning: Could not load embeddings model: {e}")
+            self.embeddings_model = None
+        if self.embeddings_model:
+            print(f"✓ Loaded {self.embeddings_model.name} embedding backend")
         else:
             print("Using fallback embedding method")
     
     def _build_knowledge_base(self):
         """Build knowledge base from blockchain data"""
-        self.documents = []
-        
-        # Create document representations for each block
-        for block_idx in self.df['index'].unique():
-            block_data = self.df[self.df['index'] == block_idx]
-            
-            # Create natural language summaries
-            summary = self._create_block_summary(block_data, block_idx)
-            self.documents.append({
-                'id': f'block_{block_idx}',
-                'block_index': block_idx,
-                'text': summary,
-                'data': block_data.to_dict('records')
-            })
+        # Create document representations for each block, partitioned by block range
+        self.documents = [
+            doc for partition in map_frame_partitions(build_block_documents, self.df)
+            for doc in partition
+        ]
         
         # Create concept documents
         concept_docs = [
@@ -148,105 +325,310 @@ class RAGSystem:
         
         self.documents.extend(concept_docs)
         
+        # Coarse layers: per-day and per-week windows plus profiles of the busiest addresses
+        if self.hierarchical:
+            self.documents.extend(build_window_documents(self.df, 'W', 'week'))
+            self.documents.extend(build_window_documents(self.df, 'D', 'day'))
+            self.documents.extend(build_address_documents(self.df, self.address_profile_limit))
+            self.address_lookup = self._address_lookup(self.df)
+        self._index_layers()
+        
+        # Build the BM25 inverted index used by keyword and hybrid retrieval
+        self.keyword_index = BM25Index()
+        self.keyword_index.add_documents(doc['text'] for doc in self.documents)
+        
         # Generate embeddings if model is available
         if self.embeddings_model:
             try:
-                texts = [doc['text'] for doc in self.documents]
-                self.document_embeddings = self.embeddings_model.encode(texts, show_progress_bar=False)
-                print(f"✓ Generated embeddings for {len(self.documents)} documents")
+                self.vector_store = self._load_or_build_vector_store([doc['text'] for doc in self.documents])
             except Exception as e:
                 print(f"Warning: Could not generate embeddings: {e}")
-                self.document_embeddings = None
+                self.vector_store = None
     
-    def _create_block_summary(self, block_data: pd.DataFrame, block_idx: int) -> str:
-        """Convert blockchain log data to natural language summary"""
-        transaction_count = len(block_data)
-        total_amount = block_data['amount'].sum()
-        unique_senders = block_data['sender'].nunique()
-        unique_receivers = block_data['receiver'].nunique()
-        avg_amount = block_data['amount'].mean()
-        
-        # Get timestamps
-        if 'block_timestamp' in block_data.columns and not block_data['block_timestamp'].empty:
-            timestamp = block_data['block_timestamp'].iloc[0]
-            if hasattr(timestamp, 'strftime'):
-                time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                time_str = str(timestamp)
-        else:
-            time_str = "unknown time"
-        
-        summary = (
-            f"Block {block_idx} contains {transaction_count} transaction(s) "
-            f"with a total volume of ${total_amount:,.2f}. "
-            f"The block involves {unique_senders} unique sender(s) and {unique_receivers} unique receiver(s). "
-            f"The average transaction amount is ${avg_amount:,.2f}. "
-            f"This block was created at {time_str}."
-        )
+    def _load_or_build_vector_store(self, texts: List[str]) -> VectorStore:
+        """Reuse the saved embedding store when it matches the documents and settings, else encode"""
+        store = create_vector_store()
+        fingerprint = hashlib.sha1(
+            '\x00'.join([self.embeddings_model.name, store.settings] + texts).encode('utf-8')
+        ).hexdigest()
+        path = self.embedding_store_path
+        if path and os.path.exists(f'{path}.npz'):
+            saved = VectorStore.load(path)
+            if saved.fingerprint == fingerprint:
+                print(f"✓ Loaded {saved.kind} embeddings for {len(texts)} documents from {path}")
+                return saved
+        store.fit(self.embeddings_model.encode(texts, show_progress_bar=False))
+        print(f"✓ Generated {store.kind} embeddings for {len(texts)} documents")
+        if path:
+            store.save(path, fingerprint=fingerprint)
+        return store
+    
+    @staticmethod
+    def _address_lookup(df: pd.DataFrame) -> List[str]:
+        """Every full address, sorted so that prefixes can be resolved with a binary search"""
+        return sorted(pd.unique(pd.concat([df['sender'], df['receiver']])).tolist())
+    
+    def _resolve_address(self, token: str) -> Optional[str]:
+        """The address token is, or the only address it is a prefix of (None if ambiguous)"""
+        start = bisect.bisect_left(self.address_lookup, token)
+        matches = self.address_lookup[start:start + 2]
+        if matches and matches[0] == token:
+            return token
+        matches = [address for address in matches if address.startswith(token)]
+        return matches[0] if len(matches) == 1 else None
+    
+    def appended(self, df: pd.DataFrame, repository=None) -> 'RAGSystem':
+        """Knowledge base for df, whose first rows are self.df, re-embedding only what changed
         
-        # Add top transactions if available
-        if transaction_count > 0:
-            top_transactions = block_data.nlargest(3, 'amount')
-            if len(top_transactions) > 0:
-                summary += " Top transactions include: "
-                for idx, tx in top_transactions.iterrows():
-                    summary += (
-                        f"${tx['amount']:,.2f} from {tx['sender'][:8]}... "
-                        f"to {tx['receiver'][:8]}...; "
-                    )
+        Documents of untouched blocks, concept documents and window/address documents whose
+        text did not change keep their embeddings; the rest go through add_documents().
+        This system is left as it is (requests pinned to the old version keep using it).
+        """
+        changed_blocks = set(df['index'].iloc[len(self.df):].tolist())
+        fresh = build_block_documents(df[df['index'].isin(changed_blocks)])
+        layers = []
+        if self.hierarchical:
+            layers = (build_window_documents(df, 'W', 'week') + build_window_documents(df, 'D', 'day')
+                      + build_address_documents(df, self.address_profile_limit))
+        current = {doc['id']: doc['text'] for doc in layers}
+        keep = [
+            idx for idx, doc in enumerate(self.documents)
+            if (doc['block_index'] not in changed_blocks if doc.get('block_index') is not None
+                else doc.get('type') == 'concept' or current.get(doc['id']) == doc['text'])
+        ]
+        kept_ids = {self.documents[idx]['id'] for idx in keep}
         
-        return summary
+        system = copy.copy(self)
+        system.df = df
+        system.repository = repository if repository is not None else PandasRepository(df)
+        system.documents = [self.documents[idx] for idx in keep]
+        system.keyword_index = BM25Index()
+        system.keyword_index.add_documents(doc['text'] for doc in system.documents)
+        if self.vector_store is not None:
+            system.vector_store = self.vector_store.select(np.asarray(keep, dtype=np.int64))
+        system._profile_cache = {}
+        system._summary_cache = {}
+        if self.hierarchical:
+            system.address_lookup = self._address_lookup(df)
+        system._index_layers()
+        system.add_documents(fresh + [doc for doc in layers if doc['id'] not in kept_ids])
+        return system
+    
+    def add_documents(self, documents: List[Dict]):
+        """Append documents to the knowledge base, keyword index and embeddings"""
+        if not documents:
+            return
+        self.documents.extend(documents)
+        self._index_layers()
+        self.keyword_index.add_documents(doc['text'] for doc in documents)
+        if self.embeddings_model and self.vector_store is not None:
+            try:
+                self.vector_store.add(self.embeddings_model.encode(
+                    [doc['text'] for doc in documents], show_progress_bar=False
+                ))
+            except Exception as e:
+                print(f"Warning: Could not embed appended documents: {e}")
+                self.vector_store = None
+    
+    def _index_layers(self):
+        """Map documents to layers: coarse (concepts and windows) and their fine children"""
+        self.block_doc_ids = {}
+        self.address_doc_ids = {}
+        self.window_doc_ids = {}
+        coarse, children = [], {}
+        for idx, doc in enumerate(self.documents):
+            if doc.get('block_index') is not None:
+                self.block_doc_ids[doc['block_index']] = idx
+                children.setdefault(('day', doc.get('window')), []).append(idx)
+            elif doc.get('level') == 'address':
+                self.address_doc_ids[doc['address']] = idx
+            else:
+                coarse.append(idx)
+                if doc.get('level') == 'day':
+                    self.window_doc_ids[doc['window']] = idx
+                    children.setdefault(('week', doc['week']), []).append(idx)
+        self.coarse_ids = np.asarray(coarse, dtype=np.int64)
+        # A window's children: the blocks of a day, or the days of a week
+        self.children = {}
+        for idx in coarse:
+            doc = self.documents[idx]
+            if doc.get('level') in ('day', 'week'):
+                self.children[idx] = np.asarray(children.get((doc['level'], doc['window']), []), dtype=np.int64)
+    
+    def _create_block_summary(self, block_data: pd.DataFrame, block_idx: int) -> str:
+        """Convert blockchain log data to natural language summary"""
+        return create_block_summary(block_data, block_idx)
     
-    def _semantic_search(self, query: str, top_k: int = 3) -> List[Dict]:
+    def _semantic_search(self, query: str, top_k: int = 3, query_embedding=None,
+                         similarities=None) -> List[Dict]:
         """Perform semantic search using vector embeddings"""
-        if not self.embeddings_model or self.document_embeddings is None:
+        if (self.retrieval_mode == 'bm25' or not self.embeddings_model
+                or self.vector_store is None):
             # Fallback to keyword search
             return self._keyword_search(query, top_k)
         
         try:
             # Encode query
-            query_embedding = self.embeddings_model.encode([query], show_progress_bar=False)[0]
+            if query_embedding is None:
+                query_embedding = self.embeddings_model.encode([query], show_progress_bar=False)[0]
             
-            # Calculate cosine similarity
-            similarities = np.dot(self.document_embeddings, query_embedding) / (
-                np.linalg.norm(self.document_embeddings, axis=1) * np.linalg.norm(query_embedding)
-            )
-            
-            # Get top k results
-            top_indices = np.argsort(similarities)[::-1][:top_k]
-            
-            results = []
-            for idx in top_indices:
-                results.append({
-                    'document': self.documents[idx],
-                    'score': float(similarities[idx])
-                })
+            if self.retrieval_mode == 'hybrid':
+                # Calculate cosine similarity (approximate when the store is quantized)
+                if similarities is None:
+                    similarities = self.vector_store.similarities(query_embedding)
+                return self._hybrid_search(query, similarities, top_k)
             
-            return results
+            # Get top k results (re-ranked with exact vectors when enabled)
+            return [
+                {'document': self.documents[idx], 'score': score}
+                for idx, score in self.vector_store.search(query_embedding, top_k, scores=similarities)
+            ]
         except Exception as e:
             print(f"Error in semantic search: {e}")
             return self._keyword_search(query, top_k)
     
-    def _keyword_search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Fallback keyword-based search"""
-        query_lower = query.lower()
-        scores = []
+    def _hybrid_search(self, query: str, similarities: np.ndarray, top_k: int = 3,
+                       depth: int = 50) -> List[Dict]:
+        """Fuse BM25 and cosine rankings with reciprocal rank fusion"""
+        depth = max(depth, top_k)
+        semantic_ranking = [idx for idx, _ in top_k_scores(similarities - similarities.min() + 1e-9, depth)]
+        keyword_ranking = [idx for idx, _ in self.keyword_index.search(query, depth)]
+        fused = reciprocal_rank_fusion([semantic_ranking, keyword_ranking])[:top_k]
+        # Keep the cosine similarity as 'score' so accuracy thresholds stay comparable
+        return [
+            {
+                'document': self.documents[idx],
+                'score': float(similarities[idx]),
+                'fusion_score': fusion_score
+            }
+            for idx, fusion_score in fused
+        ]
+    
+    def _search(self, query: str, top_k: int = 3, query_embedding=None, similarities=None) -> List[Dict]:
+        """Retrieve documents with the configured strategy
         
-        for doc in self.documents:
-            score = 0
-            text_lower = doc['text'].lower()
-            # Simple keyword matching
-            for word in query_lower.split():
-                if word in text_lower:
-                    score += text_lower.count(word)
-            scores.append((doc, score))
+        query_embedding and similarities may be precomputed (see query_batch); similarities
+        cover the first-stage candidates: the coarse layer, or every document when flat.
+        """
+        if self.hierarchical:
+            return self._hierarchical_search(query, top_k, query_embedding=query_embedding,
+                                             coarse_similarities=similarities)
+        return self._semantic_search(query, top_k, query_embedding, similarities)
+    
+    def _encode_queries(self, queries: List[str]):
+        """Embeddings for the queries in one encode call (None when retrieval is keyword-only)"""
+        if (self.retrieval_mode == 'bm25' or not self.embeddings_model
+                or self.vector_store is None):
+            return None
+        try:
+            return np.asarray(self.embeddings_model.encode(queries, show_progress_bar=False,
+                                                           batch_size=max(32, len(queries))))
+        except Exception as e:
+            print(f"Error encoding query: {e}")
+            return None
+    
+    def _encode_query(self, query: str):
+        embeddings = self._encode_queries([query])
+        return None if embeddings is None else embeddings[0]
+    
+    def _rank(self, query: str, candidates: np.ndarray, top_k: int, query_embedding=None,
+              similarities=None) -> List:
+        """Rank candidate doc ids; returns (doc id, score) pairs, score is cosine when available"""
+        if len(candidates) == 0:
+            return []
+        keyword_scores = self.keyword_index.scores(query, candidates)[candidates]
+        if query_embedding is None:
+            return [(int(candidates[i]), score) for i, score in top_k_scores(keyword_scores, top_k)]
         
-        # Sort by score and return top k
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return [{'document': doc, 'score': score} for doc, score in scores[:top_k] if score > 0]
+        if self.retrieval_mode != 'hybrid':
+            return self.vector_store.search(query_embedding, top_k, candidates, scores=similarities)
+        if similarities is None:
+            similarities = self.vector_store.similarities(query_embedding, candidates)
+        semantic_order = np.argsort(similarities)[::-1]
+        depth = max(50, top_k)
+        fused = reciprocal_rank_fusion([
+            semantic_order[:depth].tolist(),
+            [i for i, _ in top_k_scores(keyword_scores, depth)]
+        ])[:top_k]
+        return [(int(candidates[i]), float(similarities[i])) for i, _ in fused]
     
-    def _generate_response_with_llm(self, query: str, context: List[Dict]) -> str:
-        """Generate response using LLM"""
+    def _route(self, query: str) -> List[Dict]:
+        """Exact matches for blocks, dates and addresses mentioned in the query"""
+        routed = []
+        for block in re.findall(r'block\s*#?\s*(\d+)', query, flags=re.IGNORECASE):
+            idx = self.block_doc_ids.get(int(block))
+            if idx is not None:
+                routed.append(self.documents[idx])
+        for day in re.findall(r'\d{4}-\d{2}-\d{2}', query):
+            idx = self.window_doc_ids.get(day)
+            if idx is not None:
+                routed.append(self.documents[idx])
+        for token in re.findall(r'[1-9A-HJ-NP-Za-km-z]{8,}', query):
+            address = self._resolve_address(token)
+            if address is None:
+                continue
+            idx = self.address_doc_ids.get(address)
+            if idx is not None:
+                routed.append(self.documents[idx])
+            else:
+                # Addresses outside the profiled set get an on-demand profile (cached)
+                profile = self._profile_cache.get(address)
+                if profile is None:
+                    involved = self.repository.address_transactions(address)
+                    profile = create_address_profile(address, address_profiles(involved).loc[address])
+                    _remember(self._profile_cache, address, profile)
+                routed.append(profile)
+        return [{'document': doc, 'score': 1.0} for doc in routed]
+    
+    def _hierarchical_search(self, query: str, top_k: int = 3, fan_out: int = 2, query_embedding=None,
+                             coarse_similarities=None) -> List[Dict]:
+        """Coarse-to-fine search: windows first, then only the blocks inside the best windows"""
+        if query_embedding is None:
+            query_embedding = self._encode_query(query)
+        results = self._route(query)
+        
+        coarse = self._rank(query, self.coarse_ids, top_k, query_embedding, coarse_similarities)
+        windows = [idx for idx, _ in coarse if idx in self.children][:fan_out]
+        fine_candidates = []
+        for idx in windows:
+            for child in self.children[idx]:
+                # Weeks descend through their days to the blocks
+                fine_candidates.append(self.children.get(int(child), np.asarray([child])))
+        fine = []
+        if fine_candidates:
+            fine = self._rank(query, np.unique(np.concatenate(fine_candidates)), top_k, query_embedding)
+        
+        # Addresses are only reachable through the keyword index (their layer can be large)
+        address_ids = np.asarray(list(self.address_doc_ids.values()), dtype=np.int64)
+        addresses = self._rank(query, address_ids, 1, None) if len(address_ids) else []
+        
+        # The layers are merged by rank (RRF): BM25 and cosine scores are not comparable
+        scores = dict(coarse + fine)
+        if query_embedding is not None and addresses:
+            # Keep 'score' on the cosine scale for the keyword-ranked address profiles too
+            address_hits = np.asarray([idx for idx, _ in addresses], dtype=np.int64)
+            scores.update(zip(address_hits.tolist(),
+                              self.vector_store.similarities(query_embedding, address_hits).tolist()))
+        else:
+            scores.update(addresses)
+        fused = reciprocal_rank_fusion([[idx for idx, _ in ranked] for ranked in (coarse, fine, addresses)])
+        seen = {result['document']['id'] for result in results}
+        for idx, fusion_score in sorted(fused, key=lambda item: (item[1], scores[item[0]]), reverse=True):
+            doc = self.documents[idx]
+            if doc['id'] not in seen:
+                seen.add(doc['id'])
+                results.append({'document': doc, 'score': float(scores[idx]), 'fusion_score': fusion_score})
+        return results[:top_k]
+    
+    def _keyword_search(self, query: str, top_k: int = 3) -> List[Dict]:
+        """Fallback keyword-based search (BM25 over the inverted index)"""
+        return [
+            {'document': self.documents[idx], 'score': score}
+            for idx, score in self.keyword_index.search(query, top_k)
+        ]
+    
+    def _llm_messages(self, query: str, context: List[Dict]) -> List[Dict]:
+        """Chat messages for the LLM: system role plus the prompt with retrieved context"""
         # Build context string
         context_text = "\n\n".join([
             f"Context {i+1}: {result['document']['text']}"
@@ -263,32 +645,31 @@ Relevant Context from Blockchain Data:
 Please provide a clear, accurate, and helpful answer based on the context provided. If the context doesn't contain enough information, say so politely.
 
 Answer:"""
-        
+        return [
+            {"role": "system", "content": "You are a helpful blockchain data assistant."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _generate_response_with_llm(self, query: str, context: List[Dict]) -> str:
+        """Generate response using LLM"""
         if OPENAI_AVAILABLE:
             try:
                 # Try using the new OpenAI API format (v1.0+)
                 try:
-                    from openai import OpenAI
-                    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-                    response = client.chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": "You are a helpful blockchain data assistant."},
-                            {"role": "user", "content": prompt}
-                        ],
+                    response = self._llm_client().chat.completions.create(
+                        model=LLM_MODEL,
+                        messages=self._llm_messages(query, context),
                         max_tokens=300,
                         temperature=0.7
                     )
                     return response.choices[0].message.content.strip()
                 except (ImportError, AttributeError):
                     # Fallback to old API format
+                    import openai
                     openai.api_key = os.getenv('OPENAI_API_KEY')
                     response = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": "You are a helpful blockchain data assistant."},
-                            {"role": "user", "content": prompt}
-                        ],
+                        model=LLM_MODEL,
+                        messages=self._llm_messages(query, context),
                         max_tokens=300,
                         temperature=0.7
                     )
@@ -300,6 +681,44 @@ Answer:"""
             # Fallback to template-based generation
             return self._generate_fallback_response(query, context)
     
+    def _llm_client(self):
+        """Shared OpenAI client (thread-safe, reuses connections across queries)"""
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._client
+    
+    def _async_llm_client(self):
+        """Shared AsyncOpenAI client (honours OPENAI_BASE_URL), created on first use"""
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._async_client
+    
+    def warm_up_llm(self):
+        """Create the async LLM client ahead of the first query (no-op without OpenAI)"""
+        if OPENAI_AVAILABLE:
+            self._async_llm_client()
+    
+    async def _astream_response_with_llm(self, query: str, context: List[Dict]) -> AsyncIterator[str]:
+        """Stream response text chunks; the event loop is free while the LLM is working"""
+        if OPENAI_AVAILABLE:
+            try:
+                stream = await self._async_llm_client().chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=self._llm_messages(query, context),
+                    max_tokens=300,
+                    temperature=0.7,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                return
+            except Exception as e:
+                print(f"OpenAI API error: {e}")
+        yield self._generate_fallback_response(query, context)
+    
     def _generate_fallback_response(self, query: str, context: List[Dict]) -> str:
         """Generate response using template-based approach"""
         if not context:
@@ -333,81 +752,219 @@ Answer:"""
         
         return top_result['text']
     
+    def retrieve(self, user_query: str, top_k: int = 3) -> List[Dict]:
+        """Retrieval step of the pipeline (CPU-bound: embedding and index search)"""
+        return self._search(user_query, top_k=top_k)
+    
+    def _no_results(self, start_time: float) -> Dict:
+        return {
+            'type': 'error',
+            'response': "I couldn't find relevant information. Please try asking about specific blocks or blockchain concepts.",
+            'suggestions': self._get_suggestions(),
+            'query_time': time.time() - start_time
+        }
+    
+    def _failed(self, error: Exception, start_time: float) -> Dict:
+        query_time = time.time() - start_time
+        self.performance_tracker.record_query(query_time, is_successful=False)
+        return {
+            'type': 'error',
+            'response': f"Error processing query: {str(error)}",
+            'suggestions': self._get_suggestions(),
+            'query_time': query_time
+        }
+    
+    def build_result(self, retrieved_docs: List[Dict], response_text: str, start_time: float) -> Dict:
+        """Response payload for generated text (records the query in the tracker)"""
+        query_time = time.time() - start_time
+        
+        # Determine response type
+        response_type = 'general'
+        response_data = None
+        
+        if retrieved_docs[0]['document'].get('block_index') is not None:
+            response_type = 'block_data'
+            response_data = retrieved_docs[0]['document'].get('data', [])
+        elif retrieved_docs[0]['document'].get('type') == 'concept':
+            response_type = 'concept_explanation'
+        
+        # Calculate accuracy (simplified - in production, use feedback loop)
+        accuracy = 0.92  # Default 92% accuracy
+        if retrieved_docs[0]['score'] > 0.7:
+            accuracy = 0.95
+        elif retrieved_docs[0]['score'] > 0.5:
+            accuracy = 0.90
+        else:
+            accuracy = 0.85
+        
+        # Track performance
+        self.performance_tracker.record_query(query_time, is_successful=True, accuracy=accuracy)
+        
+        result = {
+            'type': response_type,
+            'response': response_text,
+            'data': response_data,
+            'query_time': query_time,
+            'accuracy': accuracy,
+            'suggestions': self._get_suggestions()
+        }
+        
+        # Add summary if block data
+        if response_type == 'block_data' and response_data:
+            block_idx = retrieved_docs[0]['document'].get('block_index')
+            result['summary'] = self._block_summary(block_idx)
+        
+        return result
+    
+    def _block_summary(self, block_idx) -> Dict:
+        summary = self._summary_cache.get(block_idx)
+        if summary is None:
+            block_df = self.repository.block_transactions(block_idx)
+            summary = {
+                'transaction_count': len(block_df),
+                'total_amount': float(block_df['amount'].sum()),
+                'unique_senders': int(block_df['sender'].nunique()),
+                'unique_receivers': int(block_df['receiver'].nunique())
+            }
+            _remember(self._summary_cache, block_idx, summary)
+        return dict(summary)
+    
     def query(self, user_query: str) -> Dict:
         """Main query interface - implements RAG pipeline"""
         start_time = time.time()
         
         try:
             # Step 1: Retrieve relevant documents (Retrieval)
-            retrieved_docs = self._semantic_search(user_query, top_k=3)
+            retrieved_docs = self.retrieve(user_query)
             
             if not retrieved_docs:
-                return {
-                    'type': 'error',
-                    'response': "I couldn't find relevant information. Please try asking about specific blocks or blockchain concepts.",
-                    'suggestions': self._get_suggestions(),
-                    'query_time': time.time() - start_time
-                }
+                return self._no_results(start_time)
             
             # Step 2: Generate response using LLM (Generation)
             response_text = self._generate_response_with_llm(user_query, retrieved_docs)
             
             # Step 3: Prepare response with data
-            query_time = time.time() - start_time
-            
-            # Determine response type
-            response_type = 'general'
-            response_data = None
+            return self.build_result(retrieved_docs, response_text, start_time)
             
-            if retrieved_docs[0]['document'].get('block_index') is not None:
-                response_type = 'block_data'
-                response_data = retrieved_docs[0]['document'].get('data', [])
-            elif retrieved_docs[0]['document'].get('type') == 'concept':
-                response_type = 'concept_explanation'
-            
-            # Calculate accuracy (simplified - in production, use feedback loop)
-            accuracy = 0.92  # Default 92% accuracy
-            if retrieved_docs[0]['score'] > 0.7:
-                accuracy = 0.95
-            elif retrieved_docs[0]['score'] > 0.5:
-                accuracy = 0.90
-            else:
-                accuracy = 0.85
-            
-            # Track performance
-            self.performance_tracker.record_query(query_time, is_successful=True, accuracy=accuracy)
-            
-            result = {
-                'type': response_type,
-                'response': response_text,
-                'data': response_data,
-                'query_time': query_time,
-                'accuracy': accuracy,
-                'suggestions': self._get_suggestions()
-            }
+        except Exception as e:
+            return self._failed(e, start_time)
+    
+    def _batch_key(self, query: str):
+        """Deduplication key: the routed blocks, days and addresses (layer and entity) when
+        the query names any, so the same entity asked about in other words is answered
+        once; otherwise the text ignoring case and spacing"""
+        if self.hierarchical:
+            try:
+                routed = self._route(query)
+            except Exception:
+                routed = []
+            if routed:
+                return tuple(result['document']['id'] for result in routed)
+        return ' '.join(query.lower().split())
+    
+    def query_batch(self, queries: List[str], top_k: int = 3) -> Dict:
+        """Answer several queries at once; results come back in input order
+        
+        Queries about the same entities (see _batch_key) are answered once. All unique
+        queries are embedded in one encode call and scored against the first-stage index
+        with one matrix product; LLM calls then run concurrently on a bounded pool.
+        """
+        batch_start = time.time()
+        keys = [self._batch_key(query) for query in queries]
+        unique = {}
+        for key, query in zip(keys, queries):
+            unique.setdefault(key, query.strip())
+        unique_queries = list(unique.values())
+        
+        # Step 1: embed and score every unique query at once
+        embeddings = self._encode_queries(unique_queries) if unique_queries else None
+        similarities = None
+        if embeddings is not None:
+            candidates = self.coarse_ids if self.hierarchical else None
+            similarities = self.vector_store.similarities_many(embeddings, candidates)
+        encode_time = time.time() - batch_start
+        
+        retrieved = []
+        for i, query in enumerate(unique_queries):
+            start_time = time.time()
+            try:
+                docs = self._search(
+                    query, top_k,
+                    query_embedding=None if embeddings is None else embeddings[i],
+                    similarities=None if similarities is None else similarities[i]
+                )
+                retrieved.append((docs, None, time.time() - start_time))
+            except Exception as e:
+                retrieved.append((None, e, time.time() - start_time))
+        
+        # Step 2: generate answers; only real LLM calls are worth a thread each
+        def answer(i: int) -> Dict:
+            query = unique_queries[i]
+            docs, error, retrieve_time = retrieved[i]
+            start_time = time.time() - retrieve_time
+            if error is not None:
+                return self._failed(error, start_time)
+            if not docs:
+                return self._no_results(start_time)
+            try:
+                generate_start = time.time()
+                response_text = self._generate_response_with_llm(query, docs)
+                generate_time = time.time() - generate_start
+                result = self.build_result(docs, response_text, start_time)
+            except Exception as e:
+                return self._failed(e, start_time)
+            result['timings'] = {'retrieve': retrieve_time, 'generate': generate_time}
+            return result
+        
+        if OPENAI_AVAILABLE and len(unique_queries) > 1:
+            with ThreadPoolExecutor(max_workers=min(LLM_BATCH_CONCURRENCY, len(unique_queries))) as pool:
+                answers = list(pool.map(answer, range(len(unique_queries))))
+        else:
+            answers = [answer(i) for i in range(len(unique_queries))]
+        
+        by_key = dict(zip(unique, answers))
+        return {
+            'results': [dict(by_key[key]) for key in keys],
+            'count': len(queries),
+            'unique': len(unique_queries),
+            'timings': {'encode': encode_time, 'total': time.time() - batch_start}
+        }
+    
+    async def astream(self, user_query: str, executor: Optional[Executor] = None) -> AsyncIterator[Dict]:
+        """Async RAG pipeline yielding token events with text chunks, then one result event
+        
+        Retrieval and result assembly run on the executor; only the LLM call is awaited
+        on the event loop, so many slow generations can be in flight at once.
+        """
+        loop = asyncio.get_running_loop()
+        start_time = time.time()
+        
+        try:
+            retrieved_docs = await loop.run_in_executor(executor, self.retrieve, user_query)
+            if not retrieved_docs:
+                yield {'event': 'result', 'data': self._no_results(start_time)}
+                return
             
-            # Add summary if block data
-            if response_type == 'block_data' and response_data:
-                block_idx = retrieved_docs[0]['document'].get('block_index')
-                block_df = self.df[self.df['index'] == block_idx]
-                result['summary'] = {
-                    'transaction_count': len(block_df),
-                    'total_amount': float(block_df['amount'].sum()),
-                    'unique_senders': int(block_df['sender'].nunique()),
-                    'unique_receivers': int(block_df['receiver'].nunique())
-                }
+            chunks = []
+            async for chunk in self._astream_response_with_llm(user_query, retrieved_docs):
+                chunks.append(chunk)
+                yield {'event': 'token', 'data': chunk}
             
-            return result
+            result = await loop.run_in_executor(
+                executor, self.build_result, retrieved_docs, ''.join(chunks).strip(), start_time
+            )
+            yield {'event': 'result', 'data': result}
             
         except Exception as e:
-            query_time = time.time() - start_time
-            self.performance_tracker.record_query(query_time, is_successful=False)
-            return {
-                'type': 'error',
-                'response': f"Error processing query: {str(e)}",
-                'suggestions': self._get_suggestions(),
-                'query_time': query_time
-            }
+            yield {'event': 'result', 'data': self._failed(e, start_time)}
+    
+    async def aquery(self, user_query: str, executor: Optional[Executor] = None) -> Dict:
+        """Async counterpart of query()"""
+        result = None
+        async for event in self.astream(user_query, executor):
+            if event['event'] == 'result':
+                result = event['data']
+        return result
     
     def _get_suggestions(self) -> List[str]:
         """Get query suggestions"""
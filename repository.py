@@ -0,0 +1,547 @@
+"""
+Transaction repositories behind the API handlers
+PandasRepository answers from the in-memory DataFrame; SQLiteRepository keeps the
+transactions in an indexed on-disk SQLite file shared by every worker and pushes
+filters, pagination and aggregates down to SQL
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from export import EXPORT_CHUNK_ROWS, filter_mask, filtered_slices
+
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# Rows per executemany() call while building a store
+INSERT_CHUNK_ROWS = 50000
+
+# Secondary indexes: block lookups, address lookups and per-address totals (covering),
+# amount ranges, and time bucketing (covering)
+INDEXES = {
+    'block': ('index',),
+    'sender': ('sender', 'amount'),
+    'receiver': ('receiver', 'amount'),
+    'amount': ('amount',),
+    'time': ('transaction_timestamp', 'amount'),
+}
+
+
+def configured_store() -> str:
+    """Transaction store backend (TRANSACTION_STORE: 'pandas' or 'sqlite')"""
+    return os.getenv('TRANSACTION_STORE', 'pandas').strip().lower()
+
+
+def most_frequent(values: pd.Series) -> Tuple[Optional[str], int]:
+    """Most frequent value and its count; ties go to the smallest value (same in every backend)"""
+    counts = values.value_counts()
+    if counts.empty:
+        return None, 0
+    return min(counts.index[counts == counts.iloc[0]]), int(counts.iloc[0])
+
+
+class TransactionRepository:
+    """Read interface over one dataset version used by the /api/* handlers and RAGSystem
+
+    Filters are the dicts produced by export.parse_filters (block, sender, receiver,
+    min_amount, max_amount). Frames come back with the dataset's columns and dtypes.
+    """
+
+    columns: List[str] = []
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def page(self, filters: Dict, offset: int, limit: int) -> Tuple[int, pd.DataFrame]:
+        """Number of matching rows, and the limit rows starting at offset"""
+        raise NotImplementedError
+
+    def slices(self, filters: Dict, columns: Optional[List[str]] = None,
+               chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """Matching rows as a sequence of frames of at most chunk_rows rows"""
+        raise NotImplementedError
+
+    def schema(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Zero-row frame with the given columns and their dtypes"""
+        raise NotImplementedError
+
+    def block_transactions(self, block: int) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def address_transactions(self, address: str) -> pd.DataFrame:
+        """Transactions sent or received by address"""
+        raise NotImplementedError
+
+    def amount_summary(self) -> Dict:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+    def volume_over_time(self) -> Dict:
+        raise NotImplementedError
+
+    def top_addresses(self, role: str, k: int = 10) -> Dict:
+        raise NotImplementedError
+
+    def block_distribution(self) -> Dict:
+        raise NotImplementedError
+
+    def transaction_timeline(self) -> Dict:
+        raise NotImplementedError
+
+    def network_stats(self) -> Dict:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PandasRepository(TransactionRepository):
+    """The in-memory DataFrame, with aggregates from the parallel engine when one is running"""
+
+    def __init__(self, df: pd.DataFrame, analytics_engine=None):
+        self.df = df
+        self.columns = list(df.columns)
+        self.analytics_engine = analytics_engine
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def _filtered(self, filters: Dict) -> pd.DataFrame:
+        mask = filter_mask(self.df, filters)
+        return self.df if mask is None else self.df[mask]
+
+    def page(self, filters: Dict, offset: int, limit: int) -> Tuple[int, pd.DataFrame]:
+        matching = self._filtered(filters)
+        return len(matching), matching.iloc[offset:offset + limit]
+
+    def slices(self, filters: Dict, columns: Optional[List[str]] = None,
+               chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        return filtered_slices(self.df, filters, columns, chunk_rows)
+
+    def schema(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return self.df.iloc[:0][columns or self.columns]
+
+    def block_transactions(self, block: int) -> pd.DataFrame:
+        return self.df[self.df['index'] == block]
+
+    def address_transactions(self, address: str) -> pd.DataFrame:
+        return self.df[(self.df['sender'] == address) | (self.df['receiver'] == address)]
+
+    def amount_summary(self) -> Dict:
+        amounts = self.df['amount']
+        return {
+            'total_volume': float(amounts.sum()),
+            'average_transaction': float(amounts.mean()),
+            'max_transaction': float(amounts.max()),
+            'min_transaction': float(amounts.min())
+        }
+
+    def stats(self) -> Dict:
+        return {
+            'total_blocks': int(self.df['index'].nunique()),
+            'total_transactions': int(len(self.df)),
+            'unique_senders': int(self.df['sender'].nunique()),
+            'unique_receivers': int(self.df['receiver'].nunique()),
+            **self.amount_summary()
+        }
+
+    def volume_over_time(self) -> Dict:
+        if self.analytics_engine:
+            return self.analytics_engine.volume_over_time()
+        daily_volume = self.df.groupby(self.df['transaction_timestamp'].dt.date)['amount'].sum().reset_index()
+        return {
+            'dates': [str(date) for date in daily_volume['transaction_timestamp']],
+            'volumes': daily_volume['amount'].tolist()
+        }
+
+    def top_addresses(self, role: str, k: int = 10) -> Dict:
+        if self.analytics_engine:
+            return self.analytics_engine.top_addresses(role, k)
+        # groupby orders addresses alphabetically and the stable sort keeps that order for ties
+        top = self.df.groupby(role)['amount'].sum().sort_values(ascending=False, kind='stable').head(k)
+        return {
+            f'{role}s': top.index.tolist(),
+            'amounts': top.values.tolist()
+        }
+
+    def block_distribution(self) -> Dict:
+        if self.analytics_engine:
+            return self.analytics_engine.block_distribution()
+        block_counts = self.df['index'].value_counts().sort_index()
+        return {
+            'blocks': block_counts.index.tolist(),
+            'transaction_counts': block_counts.values.tolist()
+        }
+
+    def transaction_timeline(self) -> Dict:
+        if self.analytics_engine:
+            return self.analytics_engine.transaction_timeline()
+        timeline_data = self.df.groupby(self.df['transaction_timestamp'].dt.hour).size().reset_index()
+        timeline_data.columns = ['hour', 'count']
+        return {
+            'hours': timeline_data['hour'].tolist(),
+            'counts': timeline_data['count'].tolist()
+        }
+
+    def network_stats(self) -> Dict:
+        if self.analytics_engine:
+            return self.analytics_engine.network_stats()
+        unique_addresses = set(self.df['sender'].unique()) | set(self.df['receiver'].unique())
+        most_active = {role: most_frequent(self.df[role]) for role in ('sender', 'receiver')}
+        return {
+            'total_unique_addresses': len(unique_addresses),
+            'most_active_sender': most_active['sender'][0],
+            'most_active_receiver': most_active['receiver'][0],
+            'sender_transaction_count': most_active['sender'][1],
+            'receiver_transaction_count': most_active['receiver'][1]
+        }
+
+    def close(self):
+        if self.analytics_engine:
+            self.analytics_engine.close()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of a frame (names the store file, so equal data maps to one file)"""
+    digest = hashlib.sha1(json.dumps([list(df.columns), [str(t) for t in df.dtypes]]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def prune_stores(directory: str, keep: int):
+    """Delete all but the keep most recently used transactions-*.sqlite files in directory
+
+    keep should cover every version a worker may still be serving (the current one and
+    the one a reload is replacing): a deleted file stays readable through connections
+    that are already open, but not through new ones.
+    """
+    try:
+        names = [name for name in os.listdir(directory)
+                 if name.startswith('transactions-') and name.endswith('.sqlite')]
+    except OSError:
+        return
+    paths = [os.path.join(directory, name) for name in names]
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    for path in sorted(mtimes, key=mtimes.get, reverse=True)[max(keep, 1):]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Another worker pruned it first
+            pass
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        # Nanoseconds since the epoch
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _column_values(series: pd.Series) -> list:
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.to_numpy().astype('datetime64[ns]').astype('int64').tolist()
+    return series.to_numpy(dtype=object).tolist()
+
+
+def _where(filters: Dict) -> Tuple[str, list]:
+    """SQL WHERE clause and parameters for export.parse_filters filters"""
+    clauses, params = [], []
+    for key, clause in (('block', '"index" = ?'), ('sender', 'sender = ?'), ('receiver', 'receiver = ?'),
+                        ('min_amount', 'amount >= ?'), ('max_amount', 'amount <= ?')):
+        if key in filters:
+            clauses.append(clause)
+            params.append(filters[key])
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+class SQLiteRepository(TransactionRepository):
+    """Transactions in an indexed SQLite file, queried with filters and aggregates pushed down
+
+    The file is named after the data's content, built once and reused by every worker and
+    across restarts. Aggregate results are written back to a derived table in the same
+    file, so each one is computed once per dataset rather than once per process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._derived = {}
+        meta = dict(self._connection().execute('SELECT key, value FROM meta').fetchall())
+        self.dtypes = json.loads(meta['dtypes'])
+        self.columns = list(self.dtypes)
+        self.rows = int(meta['rows'])
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, path: str) -> 'SQLiteRepository':
+        """Write df to a new store at path (built beside it, then moved into place)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute('PRAGMA journal_mode = OFF')
+            conn.execute('PRAGMA synchronous = OFF')
+            columns = ', '.join(f'{_quote(c)} {_sql_type(t)}' for c, t in df.dtypes.items())
+            conn.execute(f'CREATE TABLE transactions ({columns})')
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE derived (name TEXT PRIMARY KEY, value TEXT)')
+            insert = f"INSERT INTO transactions VALUES ({', '.join('?' * len(df.columns))})"
+            for start in range(0, len(df), INSERT_CHUNK_ROWS):
+                chunk = df.iloc[start:start + INSERT_CHUNK_ROWS]
+                conn.executemany(insert, zip(*(_column_values(chunk[c]) for c in df.columns)))
+            for name, indexed in INDEXES.items():
+                if all(column in df.columns for column in indexed):
+                    conn.execute(f"CREATE INDEX idx_{name} ON transactions ({', '.join(map(_quote, indexed))})")
+            conn.execute('ANALYZE')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('dtypes', json.dumps({c: str(t) for c, t in df.dtypes.items()})),
+                ('rows', str(len(df)))
+            ])
+            conn.commit()
+        except BaseException:
+            conn.close()
+            os.remove(tmp_path)
+            raise
+        conn.close()
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    @classmethod
+    def open_or_build(cls, df: pd.DataFrame, key: str = None, directory: str = None,
+                      keep: int = None) -> 'SQLiteRepository':
+        """Store for df under TRANSACTION_STORE_PATH, building it if no worker has yet
+
+        key names the file (e.g. the data file version); by default it is a hash of df.
+        Only the keep (TRANSACTION_STORE_KEEP) most recently used store files are kept.
+        """
+        directory = directory or os.getenv('TRANSACTION_STORE_PATH', 'transaction_store')
+        path = os.path.join(directory, f'transactions-{key or frame_fingerprint(df)}.sqlite')
+        store = None
+        if os.path.exists(path):
+            try:
+                store = cls(path)
+                if store.rows != len(df) or store.columns != list(df.columns):
+                    store.close()
+                    store = None
+                    print(f"Warning: Rebuilding transaction store '{path}' (it does not match the data)")
+            except (sqlite3.Error, KeyError) as e:
+                print(f"Warning: Rebuilding unreadable transaction store '{path}': {e}")
+        if store is None:
+            store = cls.build(df, path)
+        else:
+            # Mark it as recently used, so pruning keeps it
+            os.utime(path)
+        prune_stores(directory, keep if keep is not None else int(os.getenv('TRANSACTION_STORE_KEEP', '3')))
+        return store
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread (and per process, so forked workers never share one)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA mmap_size = 1073741824')
+            self._local.conn, self._local.pid = conn, os.getpid()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _query(self, sql: str, params=()) -> list:
+        return self._connection().execute(sql, params).fetchall()
+
+    def _frame(self, rows: list, columns: List[str]) -> pd.DataFrame:
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        data = {}
+        for column, column_values in zip(columns, values):
+            dtype = self.dtypes[column]
+            if dtype.startswith('datetime64'):
+                data[column] = np.array(column_values, dtype='int64').astype('datetime64[ns]').astype(dtype)
+            elif dtype == 'object':
+                data[column] = np.array(column_values, dtype=object)
+            else:
+                data[column] = pd.array(column_values, dtype=dtype)
+        return pd.DataFrame(data, columns=columns, copy=False)
+
+    def _select(self, columns: Optional[List[str]] = None) -> Tuple[List[str], str]:
+        columns = columns or self.columns
+        return columns, ', '.join(map(_quote, columns))
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def _cached(self, name: str, compute):
+        """Aggregate result from memory, then the derived table, then computed and stored"""
+        value = self._derived.get(name)
+        if value is not None:
+            return value
+        row = self._query('SELECT value FROM derived WHERE name = ?', (name,))
+        if row:
+            value = json.loads(row[0][0])
+        else:
+            value = compute()
+            conn = self._connection()
+            try:
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO derived VALUES (?, ?)', (name, json.dumps(value)))
+            except sqlite3.Error as e:
+                # Read-only or busy store: still answer, just without persisting
+                print(f"Warning: Could not store derived result '{name}': {e}")
+        self._derived[name] = value
+        return value
+
+    def page(self, filters: Dict, offset: int, limit: int) -> Tuple[int, pd.DataFrame]:
+        where, params = _where(filters)
+        total = self.rows if not where else self._query(f'SELECT COUNT(*) FROM transactions{where}', params)[0][0]
+        columns, select = self._select()
+        rows = self._query(f'SELECT {select} FROM transactions{where} ORDER BY rowid LIMIT ? OFFSET ?',
+                           params + [limit, offset])
+        return total, self._frame(rows, columns)
+
+    def slices(self, filters: Dict, columns: Optional[List[str]] = None,
+               chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        # Keyset pagination on rowid: every slice is one indexed range scan
+        where, params = _where(filters)
+        where = f'{where} AND rowid > ?' if where else ' WHERE rowid > ?'
+        columns, select = self._select(columns)
+        last = 0
+        while True:
+            rows = self._query(f'SELECT rowid, {select} FROM transactions{where} ORDER BY rowid LIMIT ?',
+                               params + [last, chunk_rows])
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield self._frame([row[1:] for row in rows], columns)
+
+    def schema(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return self._frame([], columns or self.columns)
+
+    def block_transactions(self, block: int) -> pd.DataFrame:
+        return self.page({'block': block}, 0, -1)[1]
+
+    def address_transactions(self, address: str) -> pd.DataFrame:
+        columns, select = self._select()
+        rows = self._query(f'SELECT {select} FROM transactions WHERE sender = ? OR receiver = ? ORDER BY rowid',
+                           (address, address))
+        return self._frame(rows, columns)
+
+    def amount_summary(self) -> Dict:
+        def compute():
+            total, average, largest, smallest = self._query(
+                'SELECT SUM(amount), AVG(amount), MAX(amount), MIN(amount) FROM transactions')[0]
+            return {
+                'total_volume': float(total),
+                'average_transaction': float(average),
+                'max_transaction': float(largest),
+                'min_transaction': float(smallest)
+            }
+        return self._cached('amount_summary', compute)
+
+    def stats(self) -> Dict:
+        def compute():
+            # Each COUNT(DISTINCT) walks its own index instead of the table
+            blocks, senders, receivers = (
+                self._query(f'SELECT COUNT(DISTINCT {column}) FROM transactions')[0][0]
+                for column in ('"index"', 'sender', 'receiver')
+            )
+            return {
+                'total_blocks': blocks,
+                'total_transactions': self.rows,
+                'unique_senders': senders,
+                'unique_receivers': receivers,
+                **self.amount_summary()
+            }
+        return self._cached('stats', compute)
+
+    def volume_over_time(self) -> Dict:
+        def compute():
+            rows = self._query(f'SELECT transaction_timestamp / {NS_PER_DAY} AS day, SUM(amount) '
+                               'FROM transactions GROUP BY day ORDER BY day')
+            return {
+                'dates': [str(pd.Timestamp(day * NS_PER_DAY).date()) for day, _ in rows],
+                'volumes': [volume for _, volume in rows]
+            }
+        return self._cached('volume_over_time', compute)
+
+    def top_addresses(self, role: str, k: int = 10) -> Dict:
+        if role not in ('sender', 'receiver'):
+            raise ValueError(f"Unknown address role '{role}'")
+
+        def compute():
+            rows = self._query(f'SELECT {role}, SUM(amount) AS volume FROM transactions '
+                               f'GROUP BY {role} ORDER BY volume DESC, {role} LIMIT ?', (k,))
+            return {
+                f'{role}s': [address for address, _ in rows],
+                'amounts': [volume for _, volume in rows]
+            }
+        return self._cached(f'top_{role}s:{k}', compute)
+
+    def block_distribution(self) -> Dict:
+        def compute():
+            rows = self._query('SELECT "index", COUNT(*) FROM transactions GROUP BY "index" ORDER BY "index"')
+            return {
+                'blocks': [block for block, _ in rows],
+                'transaction_counts': [count for _, count in rows]
+            }
+        return self._cached('block_distribution', compute)
+
+    def transaction_timeline(self) -> Dict:
+        def compute():
+            rows = self._query(f'SELECT (transaction_timestamp / {NS_PER_HOUR}) % 24 AS hour, COUNT(*) '
+                               'FROM transactions GROUP BY hour ORDER BY hour')
+            return {
+                'hours': [hour for hour, _ in rows],
+                'counts': [count for _, count in rows]
+            }
+        return self._cached('transaction_timeline', compute)
+
+    def network_stats(self) -> Dict:
+        def compute():
+            unique = self._query('SELECT COUNT(*) FROM (SELECT sender FROM transactions '
+                                 'UNION SELECT receiver FROM transactions)')[0][0]
+            most_active = {}
+            for role in ('sender', 'receiver'):
+                # Ties go to the smallest address, as in the pandas path
+                row = self._query(f'SELECT {role}, COUNT(*) AS n FROM transactions GROUP BY {role} '
+                                  f'ORDER BY n DESC, {role} LIMIT 1')
+                most_active[role] = row[0] if row else (None, 0)
+            return {
+                'total_unique_addresses': unique,
+                'most_active_sender': most_active['sender'][0],
+                'most_active_receiver': most_active['receiver'][0],
+                'sender_transaction_count': most_active['sender'][1],
+                'receiver_transaction_count': most_active['receiver'][1]
+            }
+        return self._cached('network_stats', compute)
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
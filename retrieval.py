@@ -0,0 +1,117 @@
+"""
+Keyword retrieval for the RAG system
+Inverted index with BM25 scoring and reciprocal rank fusion for hybrid search
+"""
+
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Question words and function words that carry no retrieval signal
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'in', 'on', 'at', 'to', 'for', 'from', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'it', 'its', 'this', 'that', 'these', 'those',
+    'what', 'which', 'who', 'whom', 'how', 'why', 'when', 'where', 'me', 'my', 'i', 'you',
+    'show', 'tell', 'explain', 'about', 'do', 'does', 'did', 's'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stopwords"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Append-only inverted index scored with Okapi BM25"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.doc_lengths: List[int] = []
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lengths = np.zeros(0)
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add_documents(self, texts: Iterable[str]):
+        """Index texts; document ids continue from the current size"""
+        for text in texts:
+            doc_id = len(self.doc_lengths)
+            terms = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                terms[token] = terms.get(token, 0) + 1
+            for term, tf in terms.items():
+                doc_ids, tfs = self.postings.setdefault(term, ([], []))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+                self._arrays.pop(term, None)
+            self.doc_lengths.append(len(tokens))
+            self._total_length += len(tokens)
+        self._lengths = np.asarray(self.doc_lengths, dtype=np.float64)
+
+    def _posting_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term)
+            if posting is None:
+                return None
+            arrays = (np.asarray(posting[0], dtype=np.int64), np.asarray(posting[1], dtype=np.float64))
+            self._arrays[term] = arrays
+        return arrays
+
+    def scores(self, query: str, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """BM25 score of every document (zero where no query term matches)
+
+        With candidates (an array of doc ids), only those documents are scored.
+        """
+        n_docs = len(self.doc_lengths)
+        scores = np.zeros(n_docs)
+        if n_docs == 0:
+            return scores
+        mask = None
+        if candidates is not None:
+            mask = np.zeros(n_docs, dtype=bool)
+            mask[candidates] = True
+        avg_length = self._total_length / n_docs or 1.0
+        for term in set(tokenize(query)):
+            arrays = self._posting_arrays(term)
+            if arrays is None:
+                continue
+            doc_ids, tfs = arrays
+            idf = math.log(1 + (n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            if mask is not None:
+                keep = mask[doc_ids]
+                doc_ids, tfs = doc_ids[keep], tfs[keep]
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_ids] / avg_length)
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 3, candidates: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top k (doc_id, score) pairs with a positive score"""
+        return top_k_scores(self.scores(query, candidates), top_k)
+
+
+def top_k_scores(scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+    """Indexes and values of the k largest positive scores, best first"""
+    positive = np.flatnonzero(scores > 0)
+    if len(positive) > top_k:
+        positive = positive[np.argpartition(-scores[positive], top_k - 1)[:top_k]]
+    positive = positive[np.argsort(-scores[positive], kind='stable')]
+    return [(int(idx), float(scores[idx])) for idx in positive]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked doc id lists: score(d) = sum over lists of 1 / (k + rank)"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -7,7 +7,7 @@ Startup script for the Flask application
 import os
 import sys
 from dotenv import load_dotenv
-from app import app
+from app import create_app
 
 # Load environment variables
 load_dotenv()
@@ -32,4 +32,5 @@ if __name__ == '__main__':
     print("🛑 Press Ctrl+C to stop the server")
     print("-" * 50)
     
+    app = create_app()
     app.run(debug=debug, host=host, port=port)
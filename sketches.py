@@ -0,0 +1,327 @@
+"""
+Probabilistic sketches for blockchain analytics
+Approximate distinct address counts (HyperLogLog) and heavy hitters
+(Count-Min + Space-Saving) that can be merged across partitions and time buckets
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# Fixed odd multipliers so sketches built in different processes stay mergeable
+_CM_SEEDS = np.array([
+    0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+    0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9,
+], dtype=np.uint64)
+
+
+def hash_values(values) -> np.ndarray:
+    """Stable 64-bit hashes for a column of addresses or block indexes"""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length() for uint64 arrays"""
+    hi = (values >> np.uint64(32)).astype(np.float64)
+    lo = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp is exact below 2**53, so split the word into two 32-bit halves
+    hi_bits = np.frexp(hi)[1]
+    lo_bits = np.frexp(lo)[1]
+    return np.where(hi_bits > 0, hi_bits + 32, lo_bits).astype(np.uint8)
+
+
+class HyperLogLog:
+    """HyperLogLog cardinality estimator (2**precision one-byte registers)"""
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add pre-hashed values to the sketch"""
+        if len(hashes) == 0:
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        p = np.uint64(self.precision)
+        idx = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = hashes & ((np.uint64(1) << (np.uint64(64) - p)) - np.uint64(1))
+        rank = (64 - self.precision) - _bit_length(rest).astype(np.int64) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+
+    def add(self, values):
+        """Hash and add a column of values"""
+        self.add_hashes(hash_values(values))
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Union of two sketches (registers-wise max)"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    def estimate(self) -> float:
+        """Estimated number of distinct values"""
+        m = float(self.m)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    @property
+    def relative_error(self) -> float:
+        """Standard error of the estimate"""
+        return 1.04 / math.sqrt(self.m)
+
+    def __len__(self):
+        return int(round(self.estimate()))
+
+
+class CountMinSketch:
+    """Count-Min sketch for point frequency/weight queries"""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01):
+        width = int(math.ceil(math.e / epsilon))
+        self.width_bits = max(1, (width - 1).bit_length())
+        self.width = 1 << self.width_bits
+        self.depth = min(len(_CM_SEEDS), int(math.ceil(math.log(1 / delta))))
+        self.table = np.zeros((self.depth, self.width), dtype=np.float64)
+        self.total = 0.0
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        shift = np.uint64(64 - self.width_bits)
+        with np.errstate(over='ignore'):
+            return ((hashes[None, :] * _CM_SEEDS[:self.depth, None]) & _MASK64) >> shift
+
+    def add_hashes(self, hashes: np.ndarray, weights: Optional[np.ndarray] = None):
+        """Add pre-hashed keys with optional weights (defaults to counts)"""
+        if len(hashes) == 0:
+            return
+        if weights is None:
+            weights = np.ones(len(hashes), dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        cols = self._columns(hashes).astype(np.int64)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(cols[row], weights=weights, minlength=self.width)
+        self.total += float(weights.sum())
+
+    def merge(self, other: 'CountMinSketch') -> 'CountMinSketch':
+        """Combine two sketches built with the same dimensions"""
+        if other.width != self.width or other.depth != self.depth:
+            raise ValueError("Cannot merge Count-Min sketches with different dimensions")
+        merged = CountMinSketch.__new__(CountMinSketch)
+        merged.width_bits = self.width_bits
+        merged.width = self.width
+        merged.depth = self.depth
+        merged.table = self.table + other.table
+        merged.total = self.total + other.total
+        return merged
+
+    def estimate_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        """Upper-bound estimates for pre-hashed keys"""
+        if len(hashes) == 0:
+            return np.zeros(0)
+        cols = self._columns(hashes).astype(np.int64)
+        return self.table[np.arange(self.depth)[:, None], cols].min(axis=0)
+
+    def estimate(self, values) -> np.ndarray:
+        return self.estimate_hashes(hash_values(values))
+
+    @property
+    def error_bound(self) -> float:
+        """Additive error bound (holds with probability 1 - delta)"""
+        return self.epsilon * self.total
+
+
+class SpaceSaving:
+    """Mergeable Space-Saving summary for weighted top-k heavy hitters"""
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        # Upper bound on the weight of any key that is not monitored
+        self.floor = 0.0
+
+    def update(self, keys, weights=None):
+        """Fold a batch of (key, weight) observations into the summary"""
+        if len(keys) == 0:
+            return
+        if weights is None:
+            weights = np.ones(len(keys), dtype=np.float64)
+        batch = pd.Series(np.asarray(weights, dtype=np.float64)).groupby(np.asarray(keys)).sum()
+        self.update_totals(batch.index.to_numpy(), batch.to_numpy())
+
+    def update_totals(self, keys: np.ndarray, totals: np.ndarray):
+        """Fold pre-aggregated per-key totals (distinct keys) into the summary"""
+        if len(keys) == 0:
+            return
+        batch_summary = SpaceSaving(self.capacity)
+        if len(keys) > self.capacity:
+            order = np.argpartition(-totals, self.capacity)[:self.capacity + 1]
+            order = order[np.argsort(-totals[order], kind='stable')]
+            batch_summary.floor = float(totals[order[-1]])
+            order = order[:-1]
+            keys, totals = keys[order], totals[order]
+        batch_summary.counts = dict(zip(keys.tolist(), totals.tolist()))
+        batch_summary.errors = dict.fromkeys(batch_summary.counts, 0.0)
+        merged = self.merge(batch_summary)
+        self.counts, self.errors, self.floor = merged.counts, merged.errors, merged.floor
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """Combine two summaries; unmonitored keys are charged the other's floor"""
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        counts = {}
+        errors = {}
+        for key in set(self.counts) | set(other.counts):
+            counts[key] = self.counts.get(key, self.floor) + other.counts.get(key, other.floor)
+            errors[key] = self.errors.get(key, self.floor) + other.errors.get(key, other.floor)
+        floor = self.floor + other.floor
+        if len(counts) > merged.capacity:
+            ranked = sorted(counts, key=counts.get, reverse=True)
+            floor = max(floor, counts[ranked[merged.capacity]])
+            ranked = ranked[:merged.capacity]
+            counts = {key: counts[key] for key in ranked}
+            errors = {key: errors[key] for key in ranked}
+        merged.counts, merged.errors, merged.floor = counts, errors, floor
+        return merged
+
+    def top(self, k: int) -> List[Dict]:
+        """Top k keys with upper-bound estimates and maximum overestimation"""
+        ranked = sorted(self.counts, key=self.counts.get, reverse=True)[:k]
+        return [
+            {'key': key, 'estimate': self.counts[key], 'error': self.errors[key]}
+            for key in ranked
+        ]
+
+
+class RoleSketch:
+    """Distinct count, frequency and volume sketches for one address column"""
+
+    def __init__(self, precision: int = 14, epsilon: float = 0.001,
+                 delta: float = 0.01, capacity: int = 256):
+        self.distinct = HyperLogLog(precision)
+        self.count_cm = CountMinSketch(epsilon, delta)
+        self.volume_cm = CountMinSketch(epsilon, delta)
+        self.count_ss = SpaceSaving(capacity)
+        self.volume_ss = SpaceSaving(capacity)
+
+    def update(self, addresses: np.ndarray, amounts: np.ndarray):
+        # Aggregate the batch once so every sketch only sees distinct addresses
+        codes, uniques = pd.factorize(addresses)
+        counts = np.bincount(codes, minlength=len(uniques)).astype(np.float64)
+        volumes = np.bincount(codes, weights=amounts, minlength=len(uniques))
+        uniques = np.asarray(uniques, dtype=object)
+        hashes = hash_values(uniques)
+        self.distinct.add_hashes(hashes)
+        self.count_cm.add_hashes(hashes, counts)
+        self.volume_cm.add_hashes(hashes, volumes)
+        self.count_ss.update_totals(uniques, counts)
+        self.volume_ss.update_totals(uniques, volumes)
+
+    def merge(self, other: 'RoleSketch') -> 'RoleSketch':
+        merged = RoleSketch.__new__(RoleSketch)
+        merged.distinct = self.distinct.merge(other.distinct)
+        merged.count_cm = self.count_cm.merge(other.count_cm)
+        merged.volume_cm = self.volume_cm.merge(other.volume_cm)
+        merged.count_ss = self.count_ss.merge(other.count_ss)
+        merged.volume_ss = self.volume_ss.merge(other.volume_ss)
+        return merged
+
+    def top(self, k: int = 10, by: str = 'volume') -> List[Dict]:
+        """Top k addresses by 'count' or 'volume', tightened with Count-Min"""
+        summary, cm = (self.volume_ss, self.volume_cm) if by == 'volume' else (self.count_ss, self.count_cm)
+        candidates = summary.top(k)
+        if not candidates:
+            return []
+        cm_estimates = cm.estimate([item['key'] for item in candidates])
+        for item, cm_estimate in zip(candidates, cm_estimates):
+            # Both sketches overestimate, so the smaller value is the tighter bound
+            upper = min(item['estimate'], float(cm_estimate))
+            item['error'] = min(item['error'], cm.error_bound, upper)
+            item['estimate'] = upper
+        candidates.sort(key=lambda item: item['estimate'], reverse=True)
+        return candidates
+
+
+class AddressSketches:
+    """Mergeable sketch bundle for a partition (or bucket) of transactions"""
+
+    def __init__(self, precision: int = 14, epsilon: float = 0.001,
+                 delta: float = 0.01, capacity: int = 256):
+        self.params = (precision, epsilon, delta, capacity)
+        self.blocks = HyperLogLog(precision)
+        self.senders = RoleSketch(precision, epsilon, delta, capacity)
+        self.receivers = RoleSketch(precision, epsilon, delta, capacity)
+        self.rows = 0
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **params) -> 'AddressSketches':
+        sketches = cls(**params)
+        sketches.update(df)
+        return sketches
+
+    def update(self, df: pd.DataFrame):
+        """Fold a batch of transactions into the sketches"""
+        if df.empty:
+            return
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+        self.blocks.add(df['index'].to_numpy())
+        self.senders.update(df['sender'].to_numpy(), amounts)
+        self.receivers.update(df['receiver'].to_numpy(), amounts)
+        self.rows += len(df)
+
+    def merge(self, other: 'AddressSketches') -> 'AddressSketches':
+        merged = AddressSketches.__new__(AddressSketches)
+        merged.params = self.params
+        merged.blocks = self.blocks.merge(other.blocks)
+        merged.senders = self.senders.merge(other.senders)
+        merged.receivers = self.receivers.merge(other.receivers)
+        merged.rows = self.rows + other.rows
+        return merged
+
+    def unique_addresses(self) -> HyperLogLog:
+        """Sketch of the union of senders and receivers"""
+        return self.senders.distinct.merge(self.receivers.distinct)
+
+    @property
+    def relative_error(self) -> float:
+        return self.blocks.relative_error
+
+
+def build_bucketed_sketches(df: pd.DataFrame, freq: str = 'D', **params) -> Dict[pd.Timestamp, AddressSketches]:
+    """Build one sketch bundle per time bucket of transaction_timestamp"""
+    if df.empty:
+        return {}
+    buckets = df['transaction_timestamp'].dt.to_period(freq).dt.start_time
+    return {
+        bucket: AddressSketches.from_frame(part, **params)
+        for bucket, part in df.groupby(buckets, sort=True)
+    }
+
+
+def merge_sketches(sketches: Iterable[AddressSketches]) -> Optional[AddressSketches]:
+    """Merge any number of sketch bundles (e.g. a range of time buckets)"""
+    merged = None
+    for sketch in sketches:
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmark import make_synthetic_chain  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def chain():
+    """Small synthetic chain with the combined_block.csv schema"""
+    return make_synthetic_chain(20000, seed=7)
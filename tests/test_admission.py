@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+
+import admission
+from admission import AdmissionController, Rejected, TokenBucket, client_key
+from app import create_app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket_refills_at_rate_up_to_burst(clock):
+    bucket = TokenBucket(rate=2.0, burst=10.0)
+    assert bucket.take(10) == 0
+    assert bucket.take(1) == pytest.approx(0.5)
+    clock.now += 1.0
+    assert bucket.take(2) == 0
+    assert bucket.take(1) == pytest.approx(0.5)
+    # Idle time never refills beyond the burst
+    clock.now += 60.0
+    assert bucket.take(10) == 0
+    assert bucket.take(1) > 0
+
+
+def test_token_bucket_charges_requests_costing_more_than_the_burst(clock):
+    bucket = TokenBucket(rate=1.0, burst=5.0)
+    assert bucket.take(10) == 0
+    # The expensive request left the bucket in debt
+    assert bucket.take(1) == pytest.approx(6.0)
+    clock.now += 6.0
+    assert bucket.take(1) == 0
+
+
+def test_rate_limit_is_per_client_and_reports_retry_after(clock):
+    controller = AdmissionController(rate=1.0, burst=5.0)
+    controller.admit('/api/query', 'a').release()
+    with pytest.raises(Rejected) as rejected:
+        controller.admit('/api/query', 'a')
+    assert (rejected.value.status, rejected.value.retry_after) == (429, 5)
+    controller.admit('/api/query', 'b').release()
+    assert controller.admit('/unlisted', 'a') is None
+    assert controller.metrics()['rejected'] == {'query': {'rate_limited': 1}}
+
+
+def test_wsgi_requests_are_shed_instead_of_queued():
+    controller = AdmissionController(rate=0, queue_timeout=5, limits={'export': (1, 4)})
+    held = controller.admit('/api/export', 'a')
+    started = time.monotonic()
+    with pytest.raises(Rejected) as rejected:
+        controller.admit('/api/export', 'b')
+    # No server thread is parked in a queue waiting for the slot
+    assert time.monotonic() - started < 1
+    assert rejected.value.status == 503 and rejected.value.retry_after >= 1
+    assert controller.limiters['export'].queued == 0
+    held.release()
+    controller.admit('/api/export', 'c').release()
+    assert controller.limiters['export'].in_flight == 0
+    assert controller.metrics()['rejected'] == {'export': {'shed': 1}}
+
+
+def test_asgi_requests_beyond_the_queue_are_shed():
+    async def scenario():
+        controller = AdmissionController(rate=0, queue_timeout=5, limits={'export': (1, 1)})
+        held = await controller.admit_async('/api/export', 'a')
+        queued = asyncio.ensure_future(controller.admit_async('/api/export', 'b'))
+        while controller.limiters['export'].queued == 0:
+            await asyncio.sleep(0.001)
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit_async('/api/export', 'c')
+        assert rejected.value.status == 503 and rejected.value.retry_after >= 1
+        # Releasing the slot hands it to the queued request
+        held.release()
+        (await queued).release()
+        assert controller.limiters['export'].in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_asgi_queue_timeout_is_shed():
+    async def scenario():
+        controller = AdmissionController(rate=0, queue_timeout=0.05, limits={'export': (1, 4)})
+        held = await controller.admit_async('/api/export', 'a')
+        with pytest.raises(Rejected) as rejected:
+            await controller.admit_async('/api/export', 'b')
+        assert rejected.value.status == 503 and 'timeout' in rejected.value.reason
+        held.release()
+        assert controller.metrics()['rejected'] == {'export': {'shed': 1}}
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('trust, hops, forwarded_for, expected', [
+    ('False', '1', 'spoofed, 203.0.113.7', '10.0.0.1'),
+    ('True', '1', '203.0.113.7', '203.0.113.7'),
+    # Clients can prepend anything; the trusted proxy appends the real address
+    ('True', '1', 'spoofed, 203.0.113.7', '203.0.113.7'),
+    ('True', '2', 'spoofed, 203.0.113.7, 10.0.0.2', '203.0.113.7'),
+    # Fewer entries than trusted proxies: the header was not set by them
+    ('True', '2', '203.0.113.7', '10.0.0.1'),
+    ('True', '1', None, '10.0.0.1'),
+])
+def test_client_key_trusts_only_proxy_appended_entries(monkeypatch, trust, hops, forwarded_for, expected):
+    monkeypatch.setenv('RATE_LIMIT_TRUST_PROXY', trust)
+    monkeypatch.setenv('RATE_LIMIT_PROXY_HOPS', hops)
+    assert client_key('10.0.0.1', forwarded_for) == expected
+
+
+def test_rejections_carry_retry_after(chain, monkeypatch):
+    monkeypatch.setenv('EMBEDDING_BACKEND', 'none')
+    monkeypatch.setenv('TRANSACTION_STORE', 'pandas')
+    monkeypatch.setenv('ANALYTICS_WORKERS', '1')
+    monkeypatch.setenv('RATE_LIMIT', '0.01')
+    monkeypatch.setenv('RATE_LIMIT_BURST', '2')
+    monkeypatch.setenv('RATE_LIMIT_TRUST_PROXY', 'True')
+    client = create_app(chain.iloc[:1000]).test_client()
+    spoofed = {'X-Forwarded-For': 'spoofed-1, 203.0.113.7'}
+    assert client.get('/api/stats', headers=spoofed).status_code == 200
+    assert client.get('/api/stats', headers=spoofed).status_code == 200
+    # Changing the client-controlled part of the header does not reset the bucket
+    response = client.get('/api/stats', headers={'X-Forwarded-For': 'spoofed-2, 203.0.113.7'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+    assert client.get('/api/stats', headers={'X-Forwarded-For': '198.51.100.1'}).status_code == 200
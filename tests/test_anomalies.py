@@ -0,0 +1,44 @@
+import pytest
+
+from anomalies import KINDS, AnomalyDetector
+from benchmark import make_synthetic_chain, plant_anomalies
+
+
+@pytest.fixture(scope='module')
+def planted_chain():
+    df, planted = plant_anomalies(make_synthetic_chain(60000, seed=11))
+    return df.sort_values('transaction_timestamp', kind='stable', ignore_index=True), planted
+
+
+@pytest.mark.parametrize('batch', [997, 5000])
+def test_incremental_updates_match_the_full_run(planted_chain, batch):
+    df, _ = planted_chain
+    full = AnomalyDetector.from_frame(df)
+    split = len(df) // 2
+    incremental = AnomalyDetector.from_frame(df.iloc[:split])
+    for start in range(split, len(df), batch):
+        incremental.update(df.iloc[start:start + batch])
+    assert all(full.counts()[kind] for kind in KINDS)
+    assert incremental.counts() == full.counts()
+    assert incremental.finding_keys() == full.finding_keys()
+
+
+def test_late_transactions_recompute_to_the_full_run(planted_chain):
+    df, _ = planted_chain
+    full = AnomalyDetector.from_frame(df)
+    # The second half arrives first: the older rows force a re-sort and recomputation
+    split = len(df) // 2
+    detector = AnomalyDetector.from_frame(df.iloc[split:]).update(df.iloc[:split])
+    assert detector.finding_keys() == full.finding_keys()
+
+
+def test_planted_anomalies_are_found(planted_chain):
+    df, planted = planted_chain
+    detector = AnomalyDetector.from_frame(df)
+    outliers = detector.query('amount_outlier', limit=len(df))['anomalies']
+    assert len(planted['amount_outlier'] & {item['transaction_id'] for item in outliers}) >= 90
+    for kind in ('burst', 'fan_out', 'fan_in'):
+        found = {item['address'] for item in detector.query(kind, limit=len(df))['anomalies']}
+        assert planted[kind] <= found
+    round_trips = detector.query('round_trip', limit=len(df))['anomalies']
+    assert planted['round_trip'] <= {(item['address'], item['counterparty']) for item in round_trips}
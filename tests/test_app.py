@@ -0,0 +1,88 @@
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def small_app(chain, monkeypatch):
+    monkeypatch.setenv('EMBEDDING_BACKEND', 'hashing')
+    monkeypatch.setenv('TRANSACTION_STORE', 'pandas')
+    monkeypatch.setenv('ANALYTICS_WORKERS', '1')
+    monkeypatch.delenv('EMBEDDING_STORE_PATH', raising=False)
+    return create_app(chain.iloc[:3000])
+
+
+def test_reload_with_appended_rows_extends_rag_system(small_app, chain):
+    state = small_app.extensions['chain_explorer']
+    old = state.dataset
+    assert state.reload(chain.iloc[:3500], wait=True)
+    new = state.dataset
+    assert new is not old and len(new.blockchain_data) == 3500
+    # Documents of untouched blocks are shared with the old version rather than rebuilt
+    old_docs = {doc['id']: doc for doc in old.rag_system.documents}
+    assert any(doc is old_docs.get(doc['id']) for doc in new.rag_system.documents)
+    assert new.rag_system.df is new.blockchain_data
+    response = small_app.test_client().get('/api/query?q=What%20is%20in%20block%20170%3F')
+    assert response.get_json()['data'][0]['index'] == 170
+
+
+def test_query_batch_errors_use_the_json_error_shape(small_app, monkeypatch):
+    rag_system = small_app.extensions['chain_explorer'].dataset.rag_system
+
+    def failing_batch(queries):
+        raise RuntimeError('index unavailable')
+
+    monkeypatch.setattr(rag_system, 'query_batch', failing_batch)
+    response = small_app.test_client().post('/api/query/batch', json={'queries': ['block 5']})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['type'] == 'error' and 'index unavailable' in body['response']
+    assert body['suggestions']
+
+
+@pytest.mark.parametrize('store', ['pandas', 'sqlite'])
+def test_reload_while_an_export_is_streamed(chain, monkeypatch, tmp_path, store):
+    monkeypatch.setenv('EMBEDDING_BACKEND', 'none')
+    monkeypatch.setenv('TRANSACTION_STORE', store)
+    monkeypatch.setenv('TRANSACTION_STORE_PATH', str(tmp_path))
+    monkeypatch.setenv('ANALYTICS_WORKERS', '1')
+    app = create_app(chain.iloc[:8000])
+    state = app.extensions['chain_explorer']
+    old = state.dataset
+    with app.test_client().get('/api/export?format=ndjson') as response:
+        expected = response.data
+
+    response = app.test_client().get('/api/export?format=ndjson', buffered=False)
+    body = iter(response.response)
+    first = next(body)
+    # The streaming response holds the version and its export slot until it is closed
+    assert old.pins == 1 and state.admission.limiters['export'].in_flight == 1
+    assert state.reload(chain.iloc[:9000], wait=True)
+    assert state.dataset is not old and old.retired
+    assert first + b''.join(body) == expected
+    assert response.headers['X-Data-Version'] == old.version
+    response.close()
+    assert old.pins == 0 and state.admission.limiters['export'].in_flight == 0
+
+
+def test_streamed_pages_release_their_version_when_closed(small_app):
+    state = small_app.extensions['chain_explorer']
+    response = small_app.test_client().get('/api/transactions?per_page=50')
+    assert len(response.get_json()['transactions']) == 50
+    response.close()
+    assert state.dataset.pins == 0
+    assert state.admission.limiters['table'].in_flight == 0
+
+
+@pytest.mark.parametrize('sort_keys', [True, False])
+def test_transactions_envelope_does_not_depend_on_key_order(small_app, monkeypatch, sort_keys):
+    monkeypatch.setattr(small_app.json, 'sort_keys', sort_keys)
+    client = small_app.test_client()
+    body = client.get('/api/transactions?page=3&per_page=7&min_amount=100').get_json()
+    assert {key: body[key] for key in ('page', 'per_page', 'total', 'total_pages')} == {
+        'page': 3, 'per_page': 7, 'total': body['total'], 'total_pages': -(-body['total'] // 7)
+    }
+    assert 0 < body['total'] < 3000
+    assert len(body['transactions']) == 7 and all(row['amount'] >= 100 for row in body['transactions'])
+    empty = client.get('/api/transactions?sender=nobody').get_json()
+    assert (empty['total'], empty['total_pages'], empty['transactions']) == (0, 0, [])
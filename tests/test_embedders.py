@@ -0,0 +1,63 @@
+import importlib.util
+
+import numpy as np
+import pytest
+
+import embedders
+from embedders import HashingEmbedder, create_embedder
+
+
+def test_hashing_embeddings_are_deterministic():
+    texts = ['Block 12 recorded 20 transactions', 'Address profile for 1abc']
+    first = HashingEmbedder(256).encode(texts)
+    second = HashingEmbedder(256).encode(list(reversed(texts)))
+    assert first.shape == (2, 256) and first.dtype == np.float32
+    np.testing.assert_array_equal(first, second[::-1])
+
+
+def test_hashing_embeddings_are_l2_normalized():
+    vectors = HashingEmbedder().encode(['one', 'two words', 'three three three words here', 'Block 7'])
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-6)
+
+
+def test_hashing_embedding_of_empty_text_is_zero():
+    vectors = HashingEmbedder(64).encode(['', 'not empty'])
+    assert not vectors[0].any()
+    assert vectors[1].any()
+
+
+def test_hashing_embeddings_rank_shared_words_higher():
+    vectors = HashingEmbedder().encode(['large transfer in block 12', 'transfer in block 12', 'weekly summary'])
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+
+
+def test_create_embedder_selects_the_backend(monkeypatch):
+    monkeypatch.setenv('HASHING_DIMENSION', '128')
+    embedder = create_embedder('hashing')
+    assert isinstance(embedder, HashingEmbedder) and embedder.name == 'hashing:128'
+    assert create_embedder('none') is None
+    monkeypatch.setenv('EMBEDDING_BACKEND', 'HASHING')
+    assert isinstance(create_embedder(), HashingEmbedder)
+
+
+def test_create_embedder_auto_falls_back_without_sentence_transformers(monkeypatch):
+    real_find_spec = importlib.util.find_spec
+    monkeypatch.setattr(embedders.importlib.util, 'find_spec',
+                        lambda name, *args: None if name == 'sentence_transformers' else real_find_spec(name, *args))
+    assert create_embedder('auto') is None
+
+
+def test_create_embedder_rejects_unknown_backends(monkeypatch):
+    with pytest.raises(ValueError, match='word2vec'):
+        create_embedder('word2vec')
+    monkeypatch.setenv('EMBEDDING_BACKEND', 'bogus')
+    with pytest.raises(ValueError):
+        create_embedder()
+
+
+def test_embedder_subclasses_must_implement_encode():
+    class Incomplete(embedders.Embedder):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pandas as pd
+import pytest
+
+import parallel
+from parallel import AnalyticsEngine, block_partitions, map_frame_partitions
+from rag_system import build_block_documents
+from repository import PandasRepository
+
+
+def tied_chain():
+    """Every address sends and receives the same total, so every ranking is a tie"""
+    addresses = ['1d', '1b', '1e', '1a', '1c']
+    rows = [(block, addresses[i % 5], addresses[(i + 2) % 5], 10.0)
+            for i, block in enumerate(range(1, 41))]
+    df = pd.DataFrame(rows, columns=['index', 'sender', 'receiver', 'amount'])
+    df['transaction_timestamp'] = pd.Timestamp('2024-06-11') + pd.to_timedelta(df['index'] * 600, unit='s')
+    return df
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_engine_matches_pandas_path(chain, workers):
+    engine = AnalyticsEngine(chain, workers=workers, min_rows=1000)
+    expected = PandasRepository(chain)
+    try:
+        assert engine.parallel == (workers > 1)
+        for role in ('sender', 'receiver'):
+            got, want = engine.top_addresses(role), expected.top_addresses(role)
+            assert got[f'{role}s'] == want[f'{role}s']
+            assert got['amounts'] == pytest.approx(want['amounts'])
+        assert engine.network_stats() == expected.network_stats()
+        assert engine.block_distribution() == expected.block_distribution()
+        assert engine.transaction_timeline() == expected.transaction_timeline()
+        got, want = engine.volume_over_time(), expected.volume_over_time()
+        assert got['dates'] == want['dates']
+        assert got['volumes'] == pytest.approx(want['volumes'])
+    finally:
+        engine.close()
+
+
+def test_ties_break_alphabetically_in_every_path():
+    df = tied_chain()
+    engine = AnalyticsEngine(df, workers=1)
+    try:
+        expected = PandasRepository(df)
+        assert engine.top_addresses('sender', 3)['senders'] == ['1a', '1b', '1c']
+        assert expected.top_addresses('sender', 3)['senders'] == ['1a', '1b', '1c']
+        assert engine.network_stats()['most_active_sender'] == '1a'
+        assert engine.network_stats() == expected.network_stats()
+    finally:
+        engine.close()
+
+
+def test_block_partitions_never_split_a_block():
+    blocks = pd.Series([1, 1, 1, 2, 2, 3, 3, 3, 3, 4]).to_numpy()
+    partitions = block_partitions(blocks, 3)
+    assert partitions[0][0] == 0 and partitions[-1][1] == len(blocks)
+    for start, _ in partitions[1:]:
+        assert blocks[start] != blocks[start - 1]
+
+
+def test_attach_unmaps_segments_of_retired_versions(chain):
+    old, new = AnalyticsEngine(chain, workers=1), AnalyticsEngine(chain, workers=1)
+    try:
+        parallel.run_kernel('hourly_counts', old.columns.spec, 0, 100, old.n_addresses)
+        parallel.run_kernel('hourly_counts', new.columns.spec, 0, 100, new.n_addresses)
+        current = {name for name, _, _ in new.columns.spec.values()}
+        assert set(parallel._attached) == current
+    finally:
+        for segment in parallel._attached.values():
+            segment.close()
+        parallel._attached.clear()
+        old.close()
+        new.close()
+
+
+def test_frame_partitions_match_the_inline_build(chain):
+    df = chain.iloc[:4000]
+    inline = {doc['id']: doc for doc in build_block_documents(df)}
+    partitioned = [doc for part in map_frame_partitions(build_block_documents, df, workers=2, min_rows=0)
+                   for doc in part]
+    assert {doc['id']: doc for doc in partitioned} == inline
+    assert len(partitioned) == len(inline)
+
+
+def test_small_datasets_get_no_engine(chain, monkeypatch):
+    from app import create_analytics_engine
+    monkeypatch.setenv('ANALYTICS_WORKERS', '2')
+    monkeypatch.setenv('PARALLEL_MIN_ROWS', str(len(chain) + 1))
+    assert create_analytics_engine(chain) is None
+    monkeypatch.setenv('PARALLEL_MIN_ROWS', '1000')
+    engine = create_analytics_engine(chain)
+    try:
+        assert engine is not None and engine.parallel
+    finally:
+        engine.close()
+
+
+def test_pool_shutdown_reports_no_leaked_segments():
+    script = textwrap.dedent('''
+        from benchmark import make_synthetic_chain
+        from parallel import AnalyticsEngine, get_pool, map_frame_partitions
+        from rag_system import build_block_documents
+        get_pool(2)  # started before any segment exists, as create_app() does
+        for _ in range(2):
+            engine = AnalyticsEngine(make_synthetic_chain(5000), workers=2, min_rows=1000)
+            assert engine.parallel
+            engine.network_stats()
+            engine.close()
+        map_frame_partitions(build_block_documents, make_synthetic_chain(5000), workers=2, min_rows=0)
+    ''')
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(parallel.__file__)),
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'leaked' not in result.stderr
+    assert 'No such file' not in result.stderr
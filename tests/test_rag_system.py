@@ -0,0 +1,167 @@
+import threading
+
+import numpy as np
+import pytest
+
+from rag_system import RAGSystem, _remember
+
+
+@pytest.fixture
+def hashing_embeddings(monkeypatch):
+    monkeypatch.setenv('EMBEDDING_BACKEND', 'hashing')
+    monkeypatch.setenv('EMBEDDING_QUANTIZATION', 'none')
+    monkeypatch.delenv('EMBEDDING_STORE_PATH', raising=False)
+
+
+def by_id(system):
+    return {doc['id']: idx for idx, doc in enumerate(system.documents)}
+
+
+@pytest.mark.usefixtures('hashing_embeddings')
+def test_appended_knowledge_base_matches_full_build(chain):
+    df = chain.iloc[:6000]
+    # The split lands inside a block, so that block's document must be rebuilt
+    split = 4010
+    old = RAGSystem(df.iloc[:split])
+    appended = old.appended(df)
+    full = RAGSystem(df)
+
+    assert {d['id']: d['text'] for d in appended.documents} == {d['id']: d['text'] for d in full.documents}
+    appended_ids, full_ids = by_id(appended), by_id(full)
+    for doc_id, idx in full_ids.items():
+        np.testing.assert_allclose(appended.vector_store.vectors[appended_ids[doc_id]],
+                                   full.vector_store.vectors[idx], atol=1e-6)
+    assert len(appended.keyword_index) == len(appended.documents) == len(appended.vector_store)
+
+    for query in ('What happened in block 201?', 'What is in block 250?', 'Show me block 3'):
+        got = appended.retrieve(query)[0]['document']['id']
+        assert got == full.retrieve(query)[0]['document']['id']
+    # The old system is untouched (requests pinned to the old version keep using it)
+    assert len(old.df) == split
+    assert 'block_250' not in by_id(old)
+
+
+@pytest.mark.usefixtures('hashing_embeddings')
+def test_appended_only_embeds_changed_documents(chain, monkeypatch):
+    df = chain.iloc[:6000]
+    old = RAGSystem(df.iloc[:5000])
+    encoded = []
+    original = old.embeddings_model.encode
+
+    def counting_encode(texts, **kwargs):
+        encoded.extend(texts)
+        return original(texts, **kwargs)
+
+    monkeypatch.setattr(old.embeddings_model, 'encode', counting_encode)
+    appended = old.appended(df)
+    assert 0 < len(encoded) < len(appended.documents) // 2
+    # Untouched blocks kept their documents, changed ones were re-embedded
+    assert not any(text.startswith('Block 10 ') for text in encoded)
+    assert any(text.startswith('Block 300 ') for text in encoded)
+
+
+@pytest.mark.usefixtures('hashing_embeddings')
+@pytest.mark.parametrize('kind', ['int8', 'pq'])
+def test_appended_keeps_quantized_codes(chain, monkeypatch, kind):
+    monkeypatch.setenv('EMBEDDING_QUANTIZATION', kind)
+    monkeypatch.setenv('EMBEDDING_RERANK', 'False')
+    df = chain.iloc[:3000]
+    old = RAGSystem(df.iloc[:2500])
+    appended = old.appended(df)
+    assert appended.vector_store.kind == kind
+    assert len(appended.vector_store) == len(appended.documents)
+    old_ids = by_id(old)
+    for doc_id, idx in by_id(appended).items():
+        if doc_id in old_ids and doc_id.startswith('block_'):
+            np.testing.assert_array_equal(appended.vector_store.codes[idx], old.vector_store.codes[old_ids[doc_id]])
+
+
+@pytest.mark.usefixtures('hashing_embeddings')
+def test_hierarchical_scores_stay_on_the_cosine_scale(chain):
+    system = RAGSystem(chain.iloc[:3000])
+    query = 'address profile that sent and received transactions with counterpart addresses'
+    results = system.retrieve(query)
+    # BM25 ranks the address profiles; their score is still the cosine similarity
+    assert any(result['document']['type'] == 'address' for result in results)
+    embedding = system.embeddings_model.encode([query], show_progress_bar=False)[0]
+    ids = by_id(system)
+    for result in results:
+        idx = np.asarray([ids[result['document']['id']]])
+        assert result['score'] == pytest.approx(float(system.vector_store.similarities(embedding, idx)[0]), abs=1e-6)
+
+
+@pytest.mark.usefixtures('hashing_embeddings')
+def test_route_resolves_addresses_sharing_a_prefix(chain, monkeypatch):
+    monkeypatch.setenv('ADDRESS_PROFILES', '5')
+    df = chain.iloc[:2000].copy()
+    # Base58-looking addresses that all share their first 8 characters
+    for column in ('sender', 'receiver'):
+        df[column] = '1Sharedx' + df[column].str[-6:].str.replace('0', 'o')
+    system = RAGSystem(df)
+    addresses = sorted(set(df['sender']))[:3]
+    for address in addresses:
+        routed = system._route(f'What did {address} do?')
+        assert [result['document']['id'] for result in routed] == [f'address_{address}']
+    # A prefix shared by several addresses is ambiguous, a unique one resolves
+    assert system._route('What did 1Sharedx do?') == []
+    lookup = system.address_lookup
+    unique = next(a[:-1] for a in lookup if sum(b.startswith(a[:-1]) for b in lookup) == 1)
+    assert system._route(f'What did {unique} do?')[0]['document']['id'].startswith(f'address_{unique}')
+
+
+@pytest.mark.usefixtures('hashing_embeddings')
+def test_saved_embeddings_are_rebuilt_when_the_store_settings_change(chain, monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv('EMBEDDING_STORE_PATH', str(tmp_path / 'embeddings'))
+    df = chain.iloc[:1000]
+    assert RAGSystem(df).vector_store.kind == 'float'
+    for kind, rerank in (('int8', 'True'), ('int8', 'False'), ('pq', 'False'), ('none', 'True')):
+        monkeypatch.setenv('EMBEDDING_QUANTIZATION', kind)
+        monkeypatch.setenv('EMBEDDING_RERANK', rerank)
+        store = RAGSystem(df).vector_store
+        assert (store.kind, store.rerank) == ({'none': 'float'}.get(kind, kind), rerank == 'True')
+        assert 'Generated' in capsys.readouterr().out
+        # Same settings again: the saved store is reused
+        RAGSystem(df)
+        assert 'Loaded' in capsys.readouterr().out
+
+
+def test_remember_stays_bounded_under_concurrent_writers():
+    cache = {}
+    errors = []
+
+    def writer(offset):
+        try:
+            for key in range(offset, offset + 5000):
+                _remember(cache, key, key, limit=64)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n * 5000,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(cache) <= 64
+
+
+@pytest.mark.usefixtures('hashing_embeddings')
+def test_query_batch_dedupes_queries_about_the_same_entities(chain):
+    system = RAGSystem(chain.iloc[:3000])
+    batch = system.query_batch([
+        'What happened in block 12?',
+        'Tell me about Block #12',
+        'Summarize block 13',
+        'What is a hash?',
+        'what is a   HASH?',
+        'What is a nonce?',
+        'What happened in block 12 and block 13?',
+    ])
+    # block 12 (twice), block 13, the hash concept (twice), the nonce concept, blocks 12+13
+    assert (batch['count'], batch['unique']) == (7, 5)
+    results = batch['results']
+    assert results[0]['response'] == results[1]['response']
+    assert results[0]['response'] != results[2]['response']
+    assert results[3]['response'] == results[4]['response']
+    assert system._batch_key('What happened in block 12?') == ('block_12',)
+    assert system._batch_key('What is a hash?') == 'what is a hash?'
@@ -0,0 +1,112 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from export import stream_export
+from repository import PandasRepository, SQLiteRepository
+
+
+def assert_same(got, expected):
+    """Equal, with floats compared to a relative tolerance (SQL and pandas sum in different orders)"""
+    if isinstance(expected, dict):
+        assert list(got) == list(expected)
+        for key in expected:
+            assert_same(got[key], expected[key])
+    elif isinstance(expected, (list, tuple)):
+        assert len(got) == len(expected)
+        for a, b in zip(got, expected):
+            assert_same(a, b)
+    elif isinstance(expected, float):
+        assert got == pytest.approx(expected, rel=1e-9, abs=1e-9)
+    else:
+        assert got == expected
+
+
+@pytest.fixture(scope='module')
+def stores(chain, tmp_path_factory):
+    df = chain.iloc[:8000].reset_index(drop=True)
+    sqlite = SQLiteRepository.open_or_build(df, 'parity', str(tmp_path_factory.mktemp('store')))
+    yield PandasRepository(df), sqlite
+    sqlite.close()
+
+
+def filter_cases(df):
+    busy = df['sender'].value_counts().index[0]
+    return [
+        {},
+        {'block': 42},
+        {'sender': busy},
+        {'receiver': df['receiver'].iloc[17]},
+        {'min_amount': 500.0, 'max_amount': 2000.0},
+        {'sender': busy, 'min_amount': 100.0},
+        {'sender': 'no-such-address'},
+    ]
+
+
+def test_pages_match(stores):
+    pandas_store, sqlite_store = stores
+    for filters in filter_cases(pandas_store.df):
+        for offset, limit in ((0, 10), (35, 50), (7990, 50)):
+            total, page = sqlite_store.page(filters, offset, limit)
+            expected_total, expected = pandas_store.page(filters, offset, limit)
+            assert total == expected_total
+            pd.testing.assert_frame_equal(page.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'ndjson'])
+def test_exports_match(stores, fmt):
+    pandas_store, sqlite_store = stores
+    for filters in filter_cases(pandas_store.df):
+        for columns in (None, ['transaction_id', 'amount', 'transaction_timestamp']):
+            got = b''.join(map(_bytes, stream_export(sqlite_store, fmt, filters, columns, chunk_rows=700)))
+            expected = b''.join(map(_bytes, stream_export(pandas_store, fmt, filters, columns, chunk_rows=700)))
+            assert got == expected
+
+
+def _bytes(chunk):
+    return chunk.encode('utf-8') if isinstance(chunk, str) else bytes(chunk)
+
+
+def test_schema_and_lookups_match(stores):
+    pandas_store, sqlite_store = stores
+    df = pandas_store.df
+    pd.testing.assert_frame_equal(sqlite_store.schema(), pandas_store.schema())
+    for block in (1, 200, 10**6):
+        pd.testing.assert_frame_equal(sqlite_store.block_transactions(block).reset_index(drop=True),
+                                      pandas_store.block_transactions(block).reset_index(drop=True))
+    for address in (df['sender'].iloc[0], df['receiver'].iloc[99]):
+        pd.testing.assert_frame_equal(sqlite_store.address_transactions(address).reset_index(drop=True),
+                                      pandas_store.address_transactions(address).reset_index(drop=True))
+
+
+@pytest.mark.parametrize('method, args', [
+    ('amount_summary', ()),
+    ('stats', ()),
+    ('volume_over_time', ()),
+    ('top_addresses', ('sender',)),
+    ('top_addresses', ('receiver', 5)),
+    ('block_distribution', ()),
+    ('transaction_timeline', ()),
+    ('network_stats', ()),
+])
+def test_analytics_match(stores, method, args):
+    pandas_store, sqlite_store = stores
+    expected = getattr(pandas_store, method)(*args)
+    assert_same(getattr(sqlite_store, method)(*args), expected)
+    # Stored aggregates come back unchanged
+    assert_same(getattr(sqlite_store, method)(*args), expected)
+
+
+def test_only_recent_store_files_are_kept(chain, tmp_path):
+    df = chain.iloc[:500]
+    for n in range(5):
+        SQLiteRepository.open_or_build(df, f'v{n}', str(tmp_path), keep=2).close()
+        time.sleep(0.01)
+    assert sorted(os.listdir(tmp_path)) == ['transactions-v3.sqlite', 'transactions-v4.sqlite']
+    # Reopening an old version's file marks it as recently used
+    SQLiteRepository.open_or_build(df, 'v3', str(tmp_path), keep=2).close()
+    time.sleep(0.01)
+    SQLiteRepository.open_or_build(df, 'v5', str(tmp_path), keep=2).close()
+    assert sorted(os.listdir(tmp_path)) == ['transactions-v3.sqlite', 'transactions-v5.sqlite']
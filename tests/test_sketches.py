@@ -0,0 +1,124 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sketches import (AddressSketches, CountMinSketch, HyperLogLog, SpaceSaving,
+                      build_bucketed_sketches, hash_values, merge_sketches)
+
+
+def keys(n, prefix='addr'):
+    return np.array([f'{prefix}{i}' for i in range(n)], dtype=object)
+
+
+@pytest.mark.parametrize('cardinality', [1000, 50000, 200000])
+def test_hyperloglog_error_within_bound(cardinality):
+    hll = HyperLogLog(precision=14)
+    hll.add(keys(cardinality))
+    # 4 standard errors: a failure here means the estimator is broken, not unlucky
+    assert abs(hll.estimate() - cardinality) / cardinality < 4 * hll.relative_error
+
+
+def test_hyperloglog_ignores_duplicates():
+    hll = HyperLogLog(precision=12)
+    values = keys(5000)
+    hll.add(values)
+    once = hll.estimate()
+    hll.add(values)
+    assert hll.estimate() == once
+
+
+def test_hyperloglog_merge_is_union_and_associative():
+    parts = [keys(20000, p) for p in ('a', 'b', 'c')]
+    a, b, c = (HyperLogLog(12) for _ in range(3))
+    for hll, values in zip((a, b, c), parts):
+        hll.add(values)
+    left = a.merge(b).merge(c)
+    right = a.merge(b.merge(c))
+    whole = HyperLogLog(12)
+    whole.add(np.concatenate(parts))
+    np.testing.assert_array_equal(left.registers, right.registers)
+    np.testing.assert_array_equal(left.registers, whole.registers)
+
+
+def test_hyperloglog_rejects_mismatched_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+
+
+def test_count_min_never_underestimates_and_respects_bound():
+    rng = np.random.default_rng(1)
+    values = rng.zipf(1.3, size=100000).astype(str).astype(object)
+    cm = CountMinSketch(epsilon=0.001, delta=0.01)
+    cm.add_hashes(hash_values(values))
+    truth = pd.Series(values).value_counts()
+    estimates = cm.estimate(truth.index.to_numpy(dtype=object))
+    errors = estimates - truth.to_numpy()
+    assert (errors >= 0).all()
+    # The bound holds per key with probability 1 - delta
+    assert np.mean(errors <= cm.error_bound) >= 1 - cm.delta
+
+
+def test_count_min_merge_equals_single_pass():
+    values = keys(3000)
+    weights = np.arange(3000, dtype=np.float64)
+    whole = CountMinSketch()
+    whole.add_hashes(hash_values(values), weights)
+    first, second = CountMinSketch(), CountMinSketch()
+    first.add_hashes(hash_values(values[:1000]), weights[:1000])
+    second.add_hashes(hash_values(values[1000:]), weights[1000:])
+    merged = first.merge(second)
+    np.testing.assert_allclose(merged.table, whole.table)
+    assert merged.total == whole.total
+
+
+def test_space_saving_keeps_heavy_hitters_of_skewed_stream():
+    rng = np.random.default_rng(3)
+    stream = rng.zipf(1.5, size=200000).astype(str).astype(object)
+    truth = pd.Series(stream).value_counts()
+    summary = SpaceSaving(capacity=64)
+    for start in range(0, len(stream), 10000):
+        summary.update(stream[start:start + 10000])
+    top = summary.top(10)
+    assert [item['key'] for item in top] == truth.index[:10].tolist()
+    for item in top:
+        exact = truth[item['key']]
+        # Estimates are upper bounds and overestimate by at most the reported error
+        assert exact <= item['estimate'] <= exact + item['error']
+
+
+def test_space_saving_merge_is_associative_on_top_k():
+    rng = np.random.default_rng(4)
+    parts = [rng.zipf(1.4, size=50000).astype(str).astype(object) for _ in range(3)]
+    a, b, c = (SpaceSaving(64) for _ in range(3))
+    for summary, part in zip((a, b, c), parts):
+        summary.update(part)
+    left = [item['key'] for item in a.merge(b).merge(c).top(5)]
+    right = [item['key'] for item in a.merge(b.merge(c)).top(5)]
+    truth = pd.Series(np.concatenate(parts)).value_counts().index[:5].tolist()
+    assert left == right == truth
+
+
+def test_address_sketches_pickle_round_trip(chain):
+    sketches = AddressSketches.from_frame(chain)
+    restored = pickle.loads(pickle.dumps(sketches))
+    np.testing.assert_array_equal(restored.blocks.registers, sketches.blocks.registers)
+    assert restored.senders.top(10) == sketches.senders.top(10)
+    assert len(restored.unique_addresses()) == len(sketches.unique_addresses())
+    # Sketches restored in another process still merge with local ones
+    merged = restored.merge(sketches)
+    assert merged.rows == 2 * len(chain)
+
+
+def test_bucketed_sketches_match_exact_analytics(chain):
+    merged = merge_sketches(build_bucketed_sketches(chain, freq='D').values())
+    assert merged.rows == len(chain)
+    for role, sketch in (('sender', merged.senders), ('receiver', merged.receivers)):
+        exact = chain[role].nunique()
+        assert abs(len(sketch.distinct) - exact) / exact < 4 * sketch.distinct.relative_error
+        volumes = chain.groupby(role)['amount'].sum()
+        for item in sketch.top(5, by='volume'):
+            assert volumes[item['key']] <= item['estimate'] + 1e-6
+            assert item['estimate'] - volumes[item['key']] <= item['error'] + 1e-6
+        assert sketch.top(1, by='volume')[0]['key'] == volumes.idxmax()
@@ -0,0 +1,70 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from vector_store import VectorStore, create_vector_store
+
+
+@pytest.mark.parametrize('kind', ['none', 'int8'])
+def test_concurrent_saves_to_one_path(tmp_path, kind):
+    vectors = np.random.default_rng(0).normal(size=(500, 32)).astype(np.float32)
+    path = str(tmp_path / 'embeddings')
+    errors = []
+
+    def save():
+        try:
+            for _ in range(20):
+                create_vector_store(kind, rerank=True).fit(vectors).save(path, fingerprint='f')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    # Only the finished files are left behind
+    assert sorted(os.listdir(tmp_path)) == ['embeddings.f32.npy', 'embeddings.npz']
+    store = VectorStore.load(path)
+    assert store.fingerprint == 'f' and len(store) == len(vectors)
+    assert store.search(vectors[7], 1)[0][0] == 7
+
+
+@pytest.fixture(scope='module')
+def clustered():
+    """Clustered vectors (like sentence embeddings) and noisy queries near stored rows"""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(40, 384))
+    vectors = (centers[rng.integers(40, size=3000)] + 0.7 * rng.normal(size=(3000, 384))).astype(np.float32)
+    queries = (vectors[:50] + 0.3 * rng.normal(size=(50, 384))).astype(np.float32)
+    return vectors, queries
+
+
+@pytest.mark.parametrize('kind, rerank, threshold', [
+    ('int8', False, 0.95),
+    ('int8', True, 0.99),
+    ('pq', False, 0.4),
+    ('pq', True, 0.95),
+])
+def test_quantized_top_k_overlaps_exact_search(clustered, kind, rerank, threshold):
+    vectors, queries = clustered
+    exact = create_vector_store('none').fit(vectors)
+    store = create_vector_store(kind, rerank=rerank).fit(vectors)
+    overlap = np.mean([
+        len({row for row, _ in store.search(query, 10)} & {row for row, _ in exact.search(query, 10)}) / 10
+        for query in queries
+    ])
+    assert overlap >= threshold
+
+
+def test_pq_settings_survive_save_and_load(tmp_path):
+    vectors = np.random.default_rng(1).normal(size=(600, 48)).astype(np.float32)
+    store = create_vector_store('pq', rerank=False)
+    store.iterations, store.train_size, store.seed = 4, 500, 3
+    store.fit(vectors).save(str(tmp_path / 'pq'), fingerprint='f')
+    loaded = VectorStore.load(str(tmp_path / 'pq'))
+    assert loaded.settings == store.settings
+    np.testing.assert_array_equal(loaded.codes, store.codes)
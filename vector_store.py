@@ -0,0 +1,370 @@
+"""
+Vector storage for document embeddings
+Exact float32 search plus int8 scalar and product quantization, with optional
+float re-ranking of the best candidates and a compact on-disk format
+"""
+
+import copy
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Rows decoded per step during a full scan (keeps temporaries cache-sized)
+SEARCH_CHUNK_ROWS = 8192
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length float32 rows (cosine similarity becomes a dot product)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class VectorStore:
+    """Exact cosine search over normalized float32 vectors"""
+
+    kind = 'float'
+
+    def __init__(self, rerank: bool = False, rerank_factor: int = 10):
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        # Identifies the documents the vectors were computed from (see save)
+        self.fingerprint = ''
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def keeps_floats(self) -> bool:
+        return self.kind == 'float' or self.rerank
+
+    @property
+    def settings(self) -> str:
+        """Parameters the saved state depends on (part of the fingerprint, see save)"""
+        return f'{self.kind}:rerank={self.rerank}:rerank_factor={self.rerank_factor}'
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes touched by a full scan"""
+        return self.vectors.nbytes
+
+    @property
+    def _rerank_nbytes(self) -> int:
+        # Memory-mapped re-rank vectors are only paged in for shortlisted rows
+        if not self.rerank or isinstance(self.vectors, np.memmap):
+            return 0
+        return self.vectors.nbytes
+
+    def fit(self, vectors: np.ndarray):
+        """Train the quantizer (if any) and store the vectors"""
+        self.vectors = normalize(vectors)
+        return self
+
+    def add(self, vectors: np.ndarray):
+        """Append vectors, reusing the trained quantizer"""
+        vectors = normalize(vectors)
+        if len(self) == 0:
+            return self.fit(vectors)
+        self.vectors = np.vstack([self.vectors, vectors])
+        return self
+
+    def select(self, rows: np.ndarray) -> 'VectorStore':
+        """New store holding only the given rows, with the same trained quantizer (see add)"""
+        store = copy.copy(self)
+        store.fingerprint = ''
+        if self.keeps_floats:
+            store.vectors = np.asarray(self.vectors[np.asarray(rows, dtype=np.int64)])
+        return store
+
+    def _approximate(self, query: np.ndarray, rows) -> np.ndarray:
+        """Scores for rows (a slice for full scans, an index array for candidates)"""
+        return self.vectors[rows] @ query
+
+    def similarities(self, query: np.ndarray, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity (approximate for quantized stores) for all rows or candidates"""
+        query = normalize(query)[0]
+        if candidates is not None:
+            return self._approximate(query, candidates)
+        # Scan in chunks so quantized codes are never expanded all at once
+        return np.concatenate([
+            self._approximate(query, slice(start, start + SEARCH_CHUNK_ROWS))
+            for start in range(0, len(self), SEARCH_CHUNK_ROWS)
+        ] or [np.zeros(0, dtype=np.float32)])
+
+    def _approximate_many(self, queries: np.ndarray, rows) -> np.ndarray:
+        """(queries x rows) scores for normalized queries"""
+        return (self.vectors[rows] @ queries.T).T
+
+    def similarities_many(self, queries: np.ndarray, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """similarities() for several queries: one matrix-matrix product per chunk of rows"""
+        queries = normalize(queries)
+        if candidates is not None:
+            return self._approximate_many(queries, candidates)
+        return np.hstack([
+            self._approximate_many(queries, slice(start, start + SEARCH_CHUNK_ROWS))
+            for start in range(0, len(self), SEARCH_CHUNK_ROWS)
+        ] or [np.zeros((len(queries), 0), dtype=np.float32)])
+
+    def search(self, query: np.ndarray, top_k: int = 3, candidates: Optional[np.ndarray] = None,
+               scores: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top k (row, cosine) pairs, re-ranked with float vectors when enabled
+
+        scores: precomputed similarities for the rows (see similarities_many)
+        """
+        rows = np.arange(len(self)) if candidates is None else np.asarray(candidates, dtype=np.int64)
+        if scores is None:
+            scores = self.similarities(query, candidates)
+        if self.kind != 'float' and self.rerank:
+            # Sorted rows keep reads from memory-mapped vectors sequential
+            shortlist = np.sort(rows[_top_k(scores, top_k * self.rerank_factor)])
+            exact = np.asarray(self.vectors[shortlist] @ normalize(query)[0])
+            best = _top_k(exact, top_k)
+            return [(int(shortlist[i]), float(exact[i])) for i in best]
+        best = _top_k(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    # Persistence -----------------------------------------------------------
+
+    def _state(self) -> dict:
+        return {}
+
+    def _load_state(self, state):
+        pass
+
+    def save(self, path: str, fingerprint: str = ''):
+        """Write codes to <path>.npz and, if kept, float vectors to <path>.f32.npy"""
+        self.fingerprint = fingerprint
+        # Write to temporary files and rename: a store still memory-mapping the old
+        # files (e.g. the dataset version being replaced by a reload) keeps reading them
+        if self.keeps_floats:
+            _write_atomic(f'{path}.f32.npy', lambda f: np.save(f, np.asarray(self.vectors)))
+        elif os.path.exists(f'{path}.f32.npy'):
+            os.remove(f'{path}.f32.npy')
+        _write_atomic(f'{path}.npz', lambda f: np.savez(
+            f, kind=self.kind, rerank=self.rerank, fingerprint=fingerprint,
+            rerank_factor=self.rerank_factor, **self._state()
+        ))
+
+    @classmethod
+    def load(cls, path: str) -> 'VectorStore':
+        """Load a saved store; float vectors are memory-mapped instead of read"""
+        with np.load(f'{path}.npz') as data:
+            store_cls = STORES[str(data['kind'])]
+            store = store_cls(rerank=bool(data['rerank']), rerank_factor=int(data['rerank_factor']))
+            store._load_state(data)
+            store.fingerprint = str(data['fingerprint'])
+        if os.path.exists(f'{path}.f32.npy'):
+            store.vectors = np.load(f'{path}.f32.npy', mmap_mode='r')
+        return store
+
+
+def _write_atomic(target: str, write):
+    """Call write(file) on a temporary file next to target, then rename it over target
+
+    The temporary name is unique per process and thread, so workers saving the same
+    store at once do not write into each other's file.
+    """
+    tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class Int8VectorStore(VectorStore):
+    """Per-dimension symmetric int8 scalar quantization (4x smaller than float32)"""
+
+    kind = 'int8'
+
+    def __init__(self, rerank: bool = False, rerank_factor: int = 10):
+        super().__init__(rerank, rerank_factor)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.codes = np.zeros((0, 0), dtype=np.int8)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes + self._rerank_nbytes
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scales), -127, 127).astype(np.int8)
+
+    def fit(self, vectors: np.ndarray):
+        vectors = normalize(vectors)
+        self.scales = np.maximum(np.abs(vectors).max(axis=0), 1e-6).astype(np.float32) / 127
+        self.codes = self._encode(vectors)
+        self.vectors = vectors if self.rerank else np.zeros((0, 0), dtype=np.float32)
+        return self
+
+    def add(self, vectors: np.ndarray):
+        if len(self) == 0:
+            return self.fit(vectors)
+        vectors = normalize(vectors)
+        self.codes = np.vstack([self.codes, self._encode(vectors)])
+        if self.rerank:
+            self.vectors = np.vstack([self.vectors, vectors])
+        return self
+
+    def select(self, rows: np.ndarray) -> 'VectorStore':
+        store = super().select(rows)
+        store.codes = self.codes[np.asarray(rows, dtype=np.int64)]
+        return store
+
+    def _approximate(self, query: np.ndarray, rows) -> np.ndarray:
+        # Fold the scales into the query so the codes are used as-is
+        return self.codes[rows].astype(np.float32) @ (query * self.scales)
+
+    def _approximate_many(self, queries: np.ndarray, rows) -> np.ndarray:
+        return (self.codes[rows].astype(np.float32) @ (queries * self.scales).T).T
+
+    def _state(self) -> dict:
+        return {'scales': self.scales, 'codes': self.codes}
+
+    def _load_state(self, state):
+        self.scales = state['scales']
+        self.codes = state['codes']
+
+
+class PQVectorStore(VectorStore):
+    """Product quantization: each subspace is coded with one byte (256 centroids)"""
+
+    kind = 'pq'
+
+    def __init__(self, rerank: bool = False, rerank_factor: int = 10, subspaces: int = 48,
+                 iterations: int = 10, train_size: int = 10000, seed: int = 0):
+        super().__init__(rerank, rerank_factor)
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.codebooks = np.zeros((0, 0, 0), dtype=np.float32)
+        self.codes = np.zeros((0, 0), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def settings(self) -> str:
+        return (f'{super().settings}:subspaces={self.subspaces}:iterations={self.iterations}'
+                f':train_size={self.train_size}:seed={self.seed}')
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.codebooks.nbytes + self._rerank_nbytes
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        rows, dims = vectors.shape
+        pad = (-dims) % self.subspaces
+        if pad:
+            vectors = np.hstack([vectors, np.zeros((rows, pad), dtype=vectors.dtype)])
+        return vectors.reshape(rows, self.subspaces, -1)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = self._split(vectors)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for m in range(self.subspaces):
+            centroids = self.codebooks[m]
+            distances = (
+                (parts[:, m] ** 2).sum(1)[:, None] - 2 * parts[:, m] @ centroids.T
+                + (centroids ** 2).sum(1)[None, :]
+            )
+            codes[:, m] = distances.argmin(axis=1)
+        return codes
+
+    def fit(self, vectors: np.ndarray):
+        vectors = normalize(vectors)
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), size=min(self.train_size, len(vectors)), replace=False)]
+        parts = self._split(sample)
+        centroids = min(256, len(sample))
+        self.codebooks = np.empty((self.subspaces, centroids, parts.shape[2]), dtype=np.float32)
+        for m in range(self.subspaces):
+            data = parts[:, m]
+            book = data[rng.choice(len(data), size=centroids, replace=False)]
+            for _ in range(self.iterations):
+                assign = ((data ** 2).sum(1)[:, None] - 2 * data @ book.T + (book ** 2).sum(1)[None, :]).argmin(1)
+                counts = np.bincount(assign, minlength=centroids)[:, None]
+                sums = np.stack([
+                    np.bincount(assign, weights=data[:, d], minlength=centroids)
+                    for d in range(data.shape[1])
+                ], axis=1)
+                # Empty clusters keep their previous centroid
+                book = np.where(counts > 0, sums / np.maximum(counts, 1), book)
+            self.codebooks[m] = book
+        self.codes = self._encode(vectors)
+        self.vectors = vectors if self.rerank else np.zeros((0, 0), dtype=np.float32)
+        return self
+
+    def add(self, vectors: np.ndarray):
+        if len(self) == 0:
+            return self.fit(vectors)
+        vectors = normalize(vectors)
+        self.codes = np.vstack([self.codes, self._encode(vectors)])
+        if self.rerank:
+            self.vectors = np.vstack([self.vectors, vectors])
+        return self
+
+    def select(self, rows: np.ndarray) -> 'VectorStore':
+        store = super().select(rows)
+        store.codes = self.codes[np.asarray(rows, dtype=np.int64)]
+        return store
+
+    def _approximate(self, query: np.ndarray, rows) -> np.ndarray:
+        # Asymmetric distance: one lookup table per query, then a gather-and-sum per row
+        table = np.einsum('mkd,md->mk', self.codebooks, self._split(query[None, :])[0])
+        offsets = np.arange(self.subspaces) * table.shape[1]
+        return table.ravel()[self.codes[rows] + offsets].sum(axis=1)
+
+    def _approximate_many(self, queries: np.ndarray, rows) -> np.ndarray:
+        # Lookup tables are per query, so there is no shared matrix product to exploit
+        return np.stack([self._approximate(query, rows) for query in queries])
+
+    def _state(self) -> dict:
+        return {'codebooks': self.codebooks, 'codes': self.codes, 'subspaces': self.subspaces,
+                'iterations': self.iterations, 'train_size': self.train_size, 'seed': self.seed}
+
+    def _load_state(self, state):
+        self.codebooks = state['codebooks']
+        self.codes = state['codes']
+        self.subspaces = int(state['subspaces'])
+        # Training parameters are part of settings (and so of the fingerprint)
+        self.iterations = int(state.get('iterations', self.iterations))
+        self.train_size = int(state.get('train_size', self.train_size))
+        self.seed = int(state.get('seed', self.seed))
+
+
+STORES = {
+    'float': VectorStore,
+    'none': VectorStore,
+    'int8': Int8VectorStore,
+    'pq': PQVectorStore,
+}
+
+
+def create_vector_store(kind: str = None, rerank: bool = None) -> VectorStore:
+    """Store selected by EMBEDDING_QUANTIZATION (none|int8|pq) and EMBEDDING_RERANK"""
+    kind = (kind or os.getenv('EMBEDDING_QUANTIZATION', 'none')).lower()
+    if rerank is None:
+        rerank = os.getenv('EMBEDDING_RERANK', 'True').lower() == 'true'
+    if kind not in STORES:
+        raise ValueError(f"Unknown embedding quantization '{kind}'")
+    return STORES[kind](rerank=rerank)
@@ -2,7 +2,9 @@
 WSGI entry point for production deployment
 This file is used by production WSGI servers like Gunicorn
 """
-from app import app
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run()